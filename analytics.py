@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+
+import sys
+import os
+import json
+import time
+import argparse
+import numpy
+import pandas
+
+# Dispersion metrics for each configuration of a result file, computed in one vectorized pass.
+# The range/mean metric is the one of variability.py.
+
+DEFAULT_CONFIGURATION = ['hostname', 'lib', 'size', 'nb_threads']
+
+def group_codes(df, by):
+    '''Return the group number of each row and a dataframe with the keys of each group.'''
+    if len(by) == 0:
+        return numpy.zeros(len(df), dtype=numpy.int64), pandas.DataFrame(index=[0])
+    grouped = df.groupby(by, sort=True)
+    codes = grouped.ngroup().values
+    keys = grouped.size().reset_index()[by] # same order than the group numbers
+    return codes, keys
+
+def config_key(values):
+    '''
+    The key of a configuration (the values of its columns) in the JSON files of drift.py and compare_csv.py.
+    The integral floats are written as integers, a column read as floats in a file (e.g. because of a missing value)
+    gives the same keys as in the other files.
+    '''
+    def normalize(value):
+        if isinstance(value, (float, numpy.floating)) and float(value).is_integer():
+            return str(int(value))
+        return str(value)
+    return json.dumps([normalize(value) for value in values])
+
+class SortedGroups:
+    '''The values sorted by group, then by value, with the offset and the size of each group.'''
+    def __init__(self, values, codes, nb_groups):
+        order = numpy.argsort(values)
+        order = order[numpy.argsort(codes[order], kind='stable')] # faster than a lexsort
+        self.values = values[order]
+        self.counts = numpy.bincount(codes, minlength=nb_groups)
+        self.offsets = numpy.concatenate([[0], numpy.cumsum(self.counts)[:-1]])
+
+    def take(self, indices):
+        '''The values at the given indices, one per group, NaN for the empty groups (e.g. only NaN values).'''
+        empty = self.counts == 0
+        result = self.values[numpy.where(empty, 0, indices)] if len(self.values) > 0 else numpy.zeros(len(indices))
+        result[empty] = numpy.nan
+        return result
+
+    def quantile(self, q):
+        '''Quantile of each group, with linear interpolation (like numpy.percentile).'''
+        position = self.offsets + q*numpy.maximum(self.counts-1, 0)
+        low = numpy.floor(position).astype(numpy.int64)
+        high = numpy.ceil(position).astype(numpy.int64)
+        frac = position - low
+        return self.take(low)*(1-frac) + self.take(high)*frac
+
+    def minimum(self):
+        return self.take(self.offsets)
+
+    def maximum(self):
+        return self.take(self.offsets + self.counts - 1)
+
+def bootstrap(groups, nb_bootstrap, confidence, rng, max_chunk=10**7):
+    '''
+    Bootstrap confidence intervals of the mean and of the coefficient of variation of each group.
+    The groups having the same size are resampled together, in batches of at most max_chunk values.
+    '''
+    nb_groups = len(groups.counts)
+    result = {name: numpy.full(nb_groups, numpy.nan) for name in ['mean_low', 'mean_high', 'cv_low', 'cv_high']}
+    alpha = (1-confidence)/2
+    for size in numpy.unique(groups.counts[groups.counts > 0]):
+        indices = numpy.nonzero(groups.counts == size)[0]
+        matrix = groups.values[groups.offsets[indices, None] + numpy.arange(size)]
+        chunk = max(1, max_chunk // (nb_bootstrap*size))
+        for start in range(0, len(indices), chunk):
+            sub = matrix[start:start+chunk]
+            samples = rng.integers(0, size, size=(len(sub), nb_bootstrap, size))
+            resampled = numpy.take_along_axis(sub[:, None, :], samples, axis=2)
+            means = resampled.mean(axis=2)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                cvs = resampled.std(axis=2) / means
+            idx = indices[start:start+chunk]
+            result['mean_low'][idx], result['mean_high'][idx] = numpy.quantile(means, [alpha, 1-alpha], axis=1)
+            result['cv_low'][idx], result['cv_high'][idx] = numpy.quantile(cvs, [alpha, 1-alpha], axis=1)
+    return result
+
+def dispersion(df, by=None, column='time', nb_bootstrap=0, confidence=0.95, seed=None):
+    '''
+    Dispersion metrics of the given column for each configuration (the columns in by):
+    count, mean, std, cv, min, max, range/mean, median, IQR/median, p99/p50 and optionally bootstrap
+    confidence intervals of the mean and of the CV.
+    '''
+    if by is None:
+        by = [col for col in DEFAULT_CONFIGURATION if col in df.columns]
+    codes, result = group_codes(df, by)
+    nb_groups = len(result)
+    values = df[column].values.astype(numpy.float64)
+    valid = (codes >= 0) & ~numpy.isnan(values) # missing keys have a code -1
+    if not valid.all():
+        codes = codes[valid]
+        values = values[valid]
+    counts = numpy.bincount(codes, minlength=nb_groups)
+    sums = numpy.bincount(codes, weights=values, minlength=nb_groups)
+    with numpy.errstate(divide='ignore', invalid='ignore'): # NaN for the empty groups
+        means = sums / counts
+    squares = numpy.bincount(codes, weights=(values - means[codes])**2, minlength=nb_groups)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        std = numpy.sqrt(squares / (counts-1))
+    groups = SortedGroups(values, codes, nb_groups)
+    median = groups.quantile(0.5)
+    q1 = groups.quantile(0.25)
+    q3 = groups.quantile(0.75)
+    p99 = groups.quantile(0.99)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        result['count'] = counts
+        result['mean'] = means
+        result['std'] = std
+        result['cv'] = std / means
+        result['min'] = groups.minimum()
+        result['max'] = groups.maximum()
+        result['range_mean'] = (result['max'] - result['min']) / means
+        result['median'] = median
+        result['iqr_median'] = (q3 - q1) / median
+        result['p99'] = p99
+        result['p99_p50'] = p99 / median
+    if nb_bootstrap > 0:
+        for name, ci in bootstrap(groups, nb_bootstrap, confidence, numpy.random.default_rng(seed)).items():
+            result[name] = ci
+    return result
+
+def read_results(filename, columns=None):
+    '''Read a result file, in CSV or in a columnar format (parquet, feather), only loading the given columns.'''
+    extension = os.path.splitext(filename)[1]
+    if extension == '.parquet':
+        return pandas.read_parquet(filename, columns=columns)
+    if extension == '.feather':
+        return pandas.read_feather(filename, columns=columns)
+    return pandas.read_csv(filename, usecols=columns)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Dispersion metrics for each configuration of a result file (CSV, parquet or feather).')
+    parser.add_argument('filename', type=str, help='Result file.')
+    parser.add_argument('--by', type=lambda s: s.split(','),
+            default=None, help='Comma-separated list of the columns defining a configuration (default: %s, when present).' % ','.join(DEFAULT_CONFIGURATION))
+    parser.add_argument('--column', type=str,
+            default='time', help='Column whose dispersion is computed.')
+    parser.add_argument('--bootstrap', type=int,
+            default=0, help='Number of bootstrap resamples for the confidence intervals of the mean and of the CV (0 to disable).')
+    parser.add_argument('--confidence', type=float,
+            default=0.95, help='Confidence level of the bootstrap intervals.')
+    parser.add_argument('--seed', type=int,
+            default=None, help='Seed of the bootstrap.')
+    parser.add_argument('--output', type=str,
+            default=None, help='Write the metrics in this CSV file instead of the standard output.')
+    args = parser.parse_args()
+    start = time.monotonic()
+    if args.by is None:
+        df = read_results(args.filename)
+    else:
+        df = read_results(args.filename, columns=args.by + [args.column])
+    result = dispersion(df, by=args.by, column=args.column, nb_bootstrap=args.bootstrap, confidence=args.confidence, seed=args.seed)
+    if args.output is None:
+        result.to_csv(sys.stdout, index=False)
+    else:
+        result.to_csv(args.output, index=False)
+    sys.stderr.write('%d rows, %d configurations, %.2f seconds.\n' % (len(df), len(result), time.monotonic() - start))
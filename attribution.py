@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+
+import sys
+import argparse
+import numpy
+import pandas
+from analytics import DEFAULT_CONFIGURATION, group_codes, read_results
+
+# Attribution of the slow calls: the outliers are flagged within each configuration, then the collected
+# metrics (Perf, Likwid, Temperature, frequency, thread mapping...) are ranked by how much they differ
+# between the outlier calls and the normal calls of the same configuration.
+
+KEY = ['run_index', 'call_index']
+# Columns which are neither a configuration nor a possible cause.
+IGNORED = {'index', 'Unnamed: 0', 'run_index', 'call_index', 'thread_index', 'core_index', 'time', 'nb_calls',
+           'date', 'hour', 'git_hash', 'command_line', 'os', 'cpu_model', 'likwid_time', 'outlier', 'robust_z'}
+
+def collapse_threads(df):
+    '''Per-thread data (e.g. Likwid) is averaged, to have one row per call.'''
+    if 'thread_index' not in df.columns:
+        return df
+    numeric = [col for col in df.select_dtypes(include=[numpy.number]).columns if col not in KEY]
+    others = [col for col in df.columns if col not in numeric and col not in KEY]
+    grouped = df.groupby(KEY, sort=False)
+    result = grouped[numeric].mean()
+    if len(others) > 0:
+        result = result.join(grouped[others].first())
+    return result.reset_index()
+
+def flag_outliers(df, by, column='time', threshold=3.5):
+    '''
+    Flag the slow calls of each configuration, with the robust z-score 0.6745*(x-median)/MAD.
+    Adds the columns robust_z and outlier.
+    '''
+    keys = [df[col] for col in by] if len(by) > 0 else numpy.zeros(len(df))
+    values = df[column]
+    deviation = values - values.groupby(keys, sort=False).transform('median')
+    mad = deviation.abs().groupby(keys, sort=False).transform('median')
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z = 0.6745*deviation / mad
+    df = df.copy()
+    df['robust_z'] = z.replace([numpy.inf, -numpy.inf], numpy.nan).fillna(0)
+    df['outlier'] = df['robust_z'] > threshold
+    return df
+
+def numeric_score(df, codes, metric):
+    '''
+    Area under the ROC curve of the metric for separating the outliers from the normal calls, computed for each
+    configuration with the Mann-Whitney statistic, and averaged over the configurations (weighted by the number of outliers).
+    The score is 2*AUC-1: positive when the metric is higher for the outliers.
+    '''
+    values = df[metric].values.astype(numpy.float64)
+    valid = ~numpy.isnan(values)
+    sub = pandas.DataFrame({'code': codes[valid], 'value': values[valid], 'outlier': df['outlier'].values[valid]})
+    sub['rank'] = sub.groupby('code')['value'].rank()
+    counts = sub.groupby('code').agg(n=('outlier', 'size'), n1=('outlier', 'sum'))
+    rank_sum = sub[sub['outlier']].groupby('code')['rank'].sum()
+    counts['rank_sum'] = rank_sum.reindex(counts.index).fillna(0)
+    counts['n2'] = counts['n'] - counts['n1']
+    counts = counts[(counts['n1'] > 0) & (counts['n2'] > 0)]
+    if len(counts) == 0:
+        return numpy.nan, numpy.nan
+    auc = (counts['rank_sum'] - counts['n1']*(counts['n1']+1)/2) / (counts['n1']*counts['n2'])
+    score = numpy.average(2*auc-1, weights=counts['n1'])
+    outliers = sub[sub['outlier']]['value'].median()
+    normal = sub[~sub['outlier']]['value'].median()
+    return score, outliers - normal
+
+def categorical_score(df, codes, metric):
+    '''
+    Total variation distance between the distributions of the metric values for the outliers and for the normal calls,
+    for each configuration, averaged over the configurations (weighted by the number of outliers).
+    '''
+    sub = pandas.DataFrame({'code': codes, 'value': df[metric].astype(str).values, 'outlier': df['outlier'].values})
+    counts = sub.groupby(['code', 'outlier', 'value']).size().unstack('value', fill_value=0)
+    try:
+        outliers = counts.xs(True, level='outlier')
+        normal = counts.xs(False, level='outlier')
+    except KeyError:
+        return numpy.nan, None
+    common = outliers.index.intersection(normal.index)
+    if len(common) == 0:
+        return numpy.nan, None
+    outliers = outliers.loc[common]
+    normal = normal.loc[common]
+    p_out = outliers.div(outliers.sum(axis=1), axis=0)
+    p_norm = normal.div(normal.sum(axis=1), axis=0)
+    distance = 0.5*(p_out - p_norm).abs().sum(axis=1)
+    score = numpy.average(distance, weights=outliers.sum(axis=1))
+    overrepresented = (p_out - p_norm).mean(axis=0).idxmax()
+    return score, overrepresented
+
+def candidate_metrics(df, by):
+    return [col for col in df.columns if col not in IGNORED and col not in by and df[col].nunique(dropna=True) > 1]
+
+def attribute(df, by=None, column='time', threshold=3.5, metrics=None):
+    '''Return the data with the outliers flagged, and the metrics ranked by their association with the outliers.'''
+    df = collapse_threads(df)
+    if by is None:
+        by = [col for col in DEFAULT_CONFIGURATION if col in df.columns]
+    df = flag_outliers(df, by, column, threshold)
+    codes, _ = group_codes(df, by)
+    if metrics is None:
+        metrics = candidate_metrics(df, by)
+    ranking = []
+    for metric in metrics:
+        if pandas.api.types.is_numeric_dtype(df[metric]) and not pandas.api.types.is_bool_dtype(df[metric]):
+            score, difference = numeric_score(df, codes, metric)
+            ranking.append({'metric': metric, 'kind': 'numeric', 'score': score, 'importance': abs(score),
+                            'detail': 'median difference (outliers - normal): %g' % difference})
+        else:
+            score, value = categorical_score(df, codes, metric)
+            ranking.append({'metric': metric, 'kind': 'categorical', 'score': score, 'importance': score,
+                            'detail': 'value over-represented in the outliers: %s' % value})
+    ranking = pandas.DataFrame(ranking, columns=['metric', 'kind', 'score', 'importance', 'detail'])
+    ranking = ranking.dropna(subset=['importance']).sort_values(by='importance', ascending=False).reset_index(drop=True)
+    return df, ranking
+
+def summary(df, by):
+    if len(by) == 0:
+        return pandas.DataFrame({'calls': [len(df)], 'outliers': [df['outlier'].sum()]})
+    result = df.groupby(by)['outlier'].agg(calls='size', outliers='sum')
+    return result.reset_index()
+
+def text_report(df, ranking, by, top):
+    lines = ['%d outlier calls out of %d.' % (df['outlier'].sum(), len(df)), '', summary(df, by).to_string(index=False), '']
+    lines.append('Metrics ranked by association with the outliers:')
+    lines.append(ranking.head(top).to_string(index=False))
+    return '\n'.join(lines) + '\n'
+
+def html_report(df, ranking, by, top):
+    return '\n'.join(['<html><head><title>Outlier attribution</title></head><body>',
+        '<h1>Outlier attribution</h1>',
+        '<p>%d outlier calls out of %d.</p>' % (df['outlier'].sum(), len(df)),
+        '<h2>Outliers per configuration</h2>', summary(df, by).to_html(index=False),
+        '<h2>Metrics ranked by association with the outliers</h2>', ranking.head(top).to_html(index=False),
+        '<h2>Outlier calls</h2>', df[df['outlier']].sort_values(by='robust_z', ascending=False).to_html(index=False),
+        '</body></html>'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Flag the outlier calls of a result file and rank the collected metrics by their association with the outliers.')
+    parser.add_argument('filename', type=str, help='Result file (output of ExpEngine).')
+    parser.add_argument('--by', type=lambda s: s.split(','),
+            default=None, help='Comma-separated list of the columns defining a configuration (default: %s, when present).' % ','.join(DEFAULT_CONFIGURATION))
+    parser.add_argument('--column', type=str,
+            default='time', help='Column used to detect the outliers.')
+    parser.add_argument('--threshold', type=float,
+            default=3.5, help='Robust z-score above which a call is an outlier.')
+    parser.add_argument('--top', type=int,
+            default=20, help='Number of metrics in the report.')
+    parser.add_argument('--html', type=str,
+            default=None, help='Write an HTML report in this file (the text report is always printed).')
+    args = parser.parse_args()
+    df = read_results(args.filename)
+    by = args.by
+    if by is None:
+        by = [col for col in DEFAULT_CONFIGURATION if col in df.columns]
+    flagged, ranking = attribute(df, by=by, column=args.column, threshold=args.threshold)
+    sys.stdout.write(text_report(flagged, ranking, by, args.top))
+    if args.html:
+        with open(args.html, 'w') as f:
+            f.write(html_report(flagged, ranking, by, args.top))
@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import itertools
+import statistics
+import collections
+from multiprocessing import cpu_count
+from concurrent.futures import ThreadPoolExecutor
+from utils import compile_generic, run_command
+
+# Autotuning of the naive dgemm of common_matrix.c. The variants (block size, loop order within a block, collapse
+# of the two outer parallel loops) are compiled in parallel into a cache, keyed by the hash of the sources, then
+# raced with short runs: the clearly slower variants are eliminated after each round, so most of the time is spent
+# on the best candidates. The fastest variant of each (host, size, nb_threads) is written in a tuning table, which
+# is used by Dgemm(lib='naive', block_size=None).
+
+SOURCES = ['multi_dgemm.c', 'common_matrix.c', 'common_matrix.h']
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'variability_study')
+DEFAULT_TABLE = os.path.join(CACHE_DIR, 'naive_tuning.json')
+LOOP_ORDERS = [''.join(order) for order in itertools.permutations('ijk')]
+MAX_CALLS = 1000
+
+Variant = collections.namedtuple('Variant', ['block_size', 'loop_order', 'collapse'])
+DEFAULT_VARIANT = Variant(128, 'kij', False) # the historical version
+
+def variant_name(variant):
+    return 'bs%d_%s%s' % (variant.block_size, variant.loop_order, '_collapse' if variant.collapse else '')
+
+def sources_hash():
+    '''Hash of the sources and of the compiler, a change of one of them invalidates the cached binaries.'''
+    digest = hashlib.sha1()
+    for filename in SOURCES:
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    compiler = shutil.which('gcc')
+    if compiler is not None:
+        digest.update(('%s %s' % (compiler, os.stat(compiler).st_mtime)).encode())
+    return digest.hexdigest()[:16]
+
+class VariantSet:
+    '''The binaries of the variants, compiled in parallel, in a cache directory specific to the current sources.'''
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.directory = os.path.join(cache_dir, 'naive_variants', sources_hash())
+
+    def path(self, variant):
+        return os.path.join(self.directory, 'multi_dgemm_%s' % variant_name(variant))
+
+    def compile(self, variant):
+        path = self.path(variant)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid()) # several autotuners may share the cache
+        compile_generic('multi_dgemm', 'naive', variant.block_size, loop_order=variant.loop_order, collapse=variant.collapse, output=tmp_path)
+        os.replace(tmp_path, path)
+
+    def build(self, variants, nb_jobs=None):
+        '''Compile the variants which are not in the cache yet, return {variant: binary}.'''
+        os.makedirs(self.directory, exist_ok=True)
+        missing = [variant for variant in variants if not os.path.isfile(self.path(variant))]
+        if len(missing) > 0:
+            with ThreadPoolExecutor(max_workers=nb_jobs or cpu_count()) as executor:
+                list(executor.map(self.compile, missing))
+        return {variant: self.path(variant) for variant in variants}
+
+def run_variant(binary, size, nb_calls, nb_threads):
+    '''The duration of each call of a run of the given binary.'''
+    output = run_command([binary, str(nb_calls), str(size)], env={**os.environ, 'OMP_NUM_THREADS': str(nb_threads)})
+    return [float(line.split()[0]) for line in output.decode().splitlines()]
+
+def race(binaries, size, nb_threads, target_time=0.5, min_rounds=2, max_rounds=10, margin=1.05, run=run_variant, rng=random):
+    '''
+    Adaptive racing of the variants ({variant: binary}). Each round runs every remaining variant once, in a random
+    order, with a number of calls such that a run lasts about target_time (calibrated by a first call, which is not
+    kept). From min_rounds on, the variants whose fastest call is slower than the median of the current best variant
+    by more than the margin are eliminated. Return the winner (smallest median) and the times of all the variants.
+    '''
+    times = {variant: [] for variant in binaries}
+    nb_calls = {}
+    alive = list(binaries)
+    for round_index in range(max_rounds):
+        rng.shuffle(alive)
+        for variant in alive:
+            if variant not in nb_calls:
+                duration = run(binaries[variant], size, 1, nb_threads)[0]
+                nb_calls[variant] = max(1, min(MAX_CALLS, int(target_time / max(duration, 1e-6))))
+            times[variant].extend(run(binaries[variant], size, nb_calls[variant], nb_threads))
+        if round_index+1 >= min_rounds:
+            best = min(alive, key=lambda variant: statistics.median(times[variant]))
+            threshold = statistics.median(times[best]) * margin
+            alive = [variant for variant in alive if min(times[variant]) <= threshold]
+            if len(alive) == 1:
+                break
+    winner = min(alive, key=lambda variant: statistics.median(times[variant]))
+    return winner, times
+
+class TuningTable:
+    '''The best variant for each (host, size, nb_threads), persisted in a JSON file.'''
+    def __init__(self, filename=DEFAULT_TABLE):
+        self.filename = filename
+        self.entries = {}
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                for entry in json.load(f)['entries']:
+                    self.entries[self.key(entry['host'], entry['size'], entry['nb_threads'])] = entry
+
+    @staticmethod
+    def key(host, size, nb_threads):
+        return (host, int(size), int(nb_threads))
+
+    def get(self, size, nb_threads, host=None):
+        '''The tuned variant, or None.'''
+        try:
+            entry = self.entries[self.key(host or platform.node(), size, nb_threads)]
+        except KeyError:
+            return None
+        return Variant(entry['block_size'], entry['loop_order'], entry['collapse'])
+
+    def set(self, size, nb_threads, variant, median_time, host=None):
+        host = host or platform.node()
+        self.entries[self.key(host, size, nb_threads)] = {'host': host, 'size': int(size), 'nb_threads': int(nb_threads),
+                **variant._asdict(), 'time': median_time, 'date': time.strftime('%Y/%m/%d %H:%M:%S')}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({'entries': [self.entries[key] for key in sorted(self.entries)]}, f, indent=2)
+        os.replace(tmp_filename, self.filename)
+
+def print_ranking(times, output=sys.stdout, nb_variants=5):
+    ranking = sorted(times, key=lambda variant: statistics.median(times[variant]))
+    for variant in ranking[:nb_variants]:
+        output.write('    %-20s median %.6f s (%d calls)\n' % (variant_name(variant), statistics.median(times[variant]), len(times[variant])))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Tune the block size, the loop order and the collapse of the naive dgemm, for each size and number of threads.')
+    parser.add_argument('--size', type=int, nargs='+',
+            required=True, help='Sizes of the matrices.')
+    parser.add_argument('-np', '--nb_threads', type=int, nargs='+',
+            default=[1], help='Numbers of threads.')
+    parser.add_argument('--block_size', type=int, nargs='+',
+            default=[16, 32, 64, 128, 256], help='Candidate block sizes.')
+    parser.add_argument('--loop_order', type=str, nargs='+', choices=LOOP_ORDERS,
+            default=LOOP_ORDERS, help='Candidate orders of the loops within a block (from the outermost to the innermost).')
+    parser.add_argument('--collapse', type=str, nargs='+', choices=['no', 'yes'],
+            default=['no', 'yes'], help='Candidate collapse modes.')
+    parser.add_argument('--table', type=str,
+            default=DEFAULT_TABLE, help='Tuning table, updated with the results (default: %(default)s).')
+    parser.add_argument('--jobs', type=int,
+            default=None, help='Number of parallel compilations (default: number of CPUs).')
+    parser.add_argument('--target_time', type=float,
+            default=0.5, help='Duration of a run of a variant, in seconds.')
+    parser.add_argument('--min_rounds', type=int,
+            default=2, help='Number of rounds before the first elimination.')
+    parser.add_argument('--max_rounds', type=int,
+            default=10, help='Maximal number of rounds.')
+    parser.add_argument('--margin', type=float,
+            default=1.05, help='A variant is eliminated when its fastest call is slower than the median of the best one times this margin.')
+    args = parser.parse_args()
+    variants = [Variant(block_size, loop_order, collapse == 'yes') for block_size, loop_order, collapse in
+            itertools.product(args.block_size, args.loop_order, args.collapse)]
+    binaries = VariantSet().build(variants, args.jobs)
+    table = TuningTable(args.table)
+    for size, nb_threads in itertools.product(args.size, args.nb_threads):
+        winner, times = race(binaries, size, nb_threads, args.target_time, args.min_rounds, args.max_rounds, args.margin)
+        print('size=%d nb_threads=%d: %s' % (size, nb_threads, variant_name(winner)))
+        print_ranking(times)
+        table.set(size, nb_threads, winner, statistics.median(times[winner]))
+        table.save() # the results of the previous configurations are kept if the tuning is interrupted
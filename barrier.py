@@ -0,0 +1,257 @@
+#! /usr/bin/env python3
+
+import sys
+import csv
+import json
+import time
+import socket
+import argparse
+import threading
+from utils import logger
+
+# Synchronized start of the runs on several nodes, to study the interference through the shared power and cooling.
+# A coordinator waits for all the agents (one per node, see Barrier in experiment.py) to be ready, then sends them
+# a start date, a bit in the future. Before each barrier, an agent estimates the offset between its clock and the
+# clock of the coordinator with an NTP-like exchange of pings (the one with the smallest round trip is kept), so that
+# it can convert the start date to its own clock. The messages are JSON objects, one per line, over TCP.
+
+DEFAULT_PORT = 4817
+
+class BarrierError(Exception):
+    pass
+
+class Connection:
+    def __init__(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # the pings must not be delayed
+        self.sock = sock
+        self.reader = sock.makefile('r')
+        self.lock = threading.Lock()
+
+    def send(self, **message):
+        data = (json.dumps(message) + '\n').encode()
+        with self.lock: # the coordinator may send to an agent from several threads
+            self.sock.sendall(data)
+
+    def receive(self):
+        line = self.reader.readline()
+        if line == '':
+            raise BarrierError('Connection closed.')
+        return json.loads(line)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+class Coordinator:
+    '''
+    Barriers for nb_agents agents. When all the agents are ready for a barrier, they are given a start date of
+    start_delay seconds in the future. The offset and the round trip reported by each agent for each barrier are
+    kept in the skew table (and written in the given CSV file, if any).
+    '''
+    skew_header = ['barrier_index', 'agent', 'start_time', 'clock_offset', 'clock_delay']
+
+    def __init__(self, nb_agents, host='', port=DEFAULT_PORT, start_delay=0.2, output=None):
+        self.nb_agents = nb_agents
+        self.start_delay = start_delay
+        self.output = output
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(nb_agents)
+        self.agents = []
+        self.ready = {}
+        self.skew = []
+        self.lock = threading.Lock()
+        self.aborted = False
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.getsockname()[1]
+
+    def start(self):
+        '''Serve the agents in a background thread.'''
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def serve(self):
+        threads = []
+        for _ in range(self.nb_agents):
+            sock, address = self.server.accept()
+            connection = Connection(sock)
+            hello = connection.receive()
+            name = hello.get('name', address[0])
+            with self.lock:
+                if name in (agent for agent, _ in self.agents): # e.g. two agents on the same host, named after it
+                    logger.warning('Agent name %s already used, renamed to %s:%d.' % (name, name, address[1]))
+                    name = '%s:%d' % (name, address[1])
+                self.agents.append((name, connection))
+                if self.aborted: # an agent has already failed
+                    connection.send(type='abort')
+            logger.info('Agent %s connected (%d/%d).' % (self.agents[-1][0], len(self.agents), self.nb_agents))
+            threads.append(threading.Thread(target=self.handle, args=self.agents[-1]))
+            threads[-1].start() # the agent can estimate its clock offset while the others connect
+        self.server.close()
+        for thread in threads:
+            thread.join()
+        if self.output is not None:
+            self.write_skew(self.output)
+
+    def handle(self, name, connection):
+        try:
+            while True:
+                message = connection.receive()
+                if message['type'] == 'ping':
+                    receive_date = time.time()
+                    connection.send(type='pong', t0=message['t0'], t1=receive_date, t2=time.time())
+                elif message['type'] == 'ready':
+                    self.agent_ready(name, connection, message)
+                elif message['type'] == 'done':
+                    break
+        except (BarrierError, OSError, ValueError) as e:
+            logger.error('Agent %s failed (%s), aborting the barriers.' % (name, e))
+            self.abort()
+        finally:
+            connection.close()
+
+    def agent_ready(self, name, connection, message):
+        index = message['barrier_index']
+        with self.lock:
+            if self.aborted:
+                return
+            ready = self.ready.setdefault(index, {})
+            ready[connection] = (name, message) # per connection, the names are only used in the skew table
+            if len(ready) < self.nb_agents:
+                return
+            start_time = time.time() + self.start_delay
+            for agent, msg in sorted(ready.values(), key=lambda item: item[0]):
+                self.skew.append({'barrier_index': index, 'agent': agent, 'start_time': start_time,
+                    'clock_offset': msg['offset'], 'clock_delay': msg['delay']})
+            del self.ready[index]
+            agents = list(self.agents)
+        for _, connection in agents:
+            connection.send(type='start', barrier_index=index, start_time=start_time)
+
+    def abort(self):
+        with self.lock:
+            if self.aborted:
+                return
+            self.aborted = True
+            agents = list(self.agents)
+        for _, connection in agents:
+            try:
+                connection.send(type='abort')
+            except OSError:
+                pass
+
+    def write_skew(self, filename):
+        with open(filename, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=self.skew_header)
+            writer.writeheader()
+            writer.writerows(self.skew)
+
+class Agent:
+    '''Connection of a node to the coordinator, wait() returns at the start date of the next barrier.'''
+    def __init__(self, host, port=DEFAULT_PORT, name=None, nb_pings=8, connect_timeout=60):
+        self.name = name or socket.gethostname()
+        self.nb_pings = nb_pings
+        self.barrier_index = 0
+        deadline = time.monotonic() + connect_timeout
+        while True: # the coordinator may not be listening yet
+            try:
+                sock = socket.create_connection((host, port), timeout=connect_timeout)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise BarrierError('Cannot connect to the coordinator %s:%d.' % (host, port))
+                time.sleep(0.1)
+        sock.settimeout(None) # the other nodes may be much slower
+        self.connection = Connection(sock)
+        self.connection.send(type='hello', name=self.name)
+
+    def receive(self, expected):
+        message = self.connection.receive()
+        if message['type'] == 'abort':
+            raise BarrierError('The barriers have been aborted by the coordinator.')
+        if message['type'] != expected:
+            raise BarrierError('Unexpected message %s.' % message)
+        return message
+
+    def estimate_offset(self):
+        '''Offset of the clock of the coordinator relative to the local clock, and round trip of the best ping.'''
+        best = None
+        for _ in range(self.nb_pings):
+            self.connection.send(type='ping', t0=time.time())
+            pong = self.receive('pong')
+            t3 = time.time()
+            delay = (t3 - pong['t0']) - (pong['t2'] - pong['t1'])
+            offset = ((pong['t1'] - pong['t0']) + (pong['t2'] - t3)) / 2
+            if best is None or delay < best[1]:
+                best = (offset, delay)
+        return best
+
+    @staticmethod
+    def sleep_until(date):
+        remaining = date - time.time()
+        if remaining > 0.002:
+            time.sleep(remaining - 0.002)
+        while time.time() < date: # the last milliseconds are spent spinning, sleep is not precise enough
+            pass
+
+    def wait(self):
+        '''Wait for the start date of the next barrier, return the waiting time, the clock offset and the lateness of the start.'''
+        offset, delay = self.estimate_offset()
+        ready_date = time.time()
+        self.connection.send(type='ready', barrier_index=self.barrier_index, offset=offset, delay=delay)
+        message = self.receive('start')
+        if message['barrier_index'] != self.barrier_index:
+            raise BarrierError('Expected barrier %d, got %d.' % (self.barrier_index, message['barrier_index']))
+        target = message['start_time'] - offset
+        self.sleep_until(target)
+        now = time.time()
+        self.barrier_index += 1
+        return {'barrier_wait': now - ready_date, 'clock_offset': offset, 'clock_delay': delay, 'start_lateness': now - target}
+
+    def close(self):
+        try:
+            self.connection.send(type='done')
+        except OSError:
+            pass
+        self.connection.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Coordinator of the synchronized runs (see multi_runner.py --barrier), or a test agent.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    coordinator = subparsers.add_parser('coordinator', help='Run the coordinator until all the agents are done.')
+    coordinator.add_argument('nb_agents', type=int, help='Number of agents (i.e. of nodes).')
+    coordinator.add_argument('--port', type=int,
+            default=DEFAULT_PORT, help='Port of the coordinator.')
+    coordinator.add_argument('--start_delay', type=float,
+            default=0.2, help='Delay between the last agent being ready and the start of the run, in seconds.')
+    coordinator.add_argument('--output', type=str,
+            default=None, help='CSV file for the clock offset of each agent for each barrier.')
+    agent = subparsers.add_parser('agent', help='Pass a number of barriers and print the start dates, to check the synchronization.')
+    agent.add_argument('host', type=str, help='Host of the coordinator.')
+    agent.add_argument('--port', type=int,
+            default=DEFAULT_PORT, help='Port of the coordinator.')
+    agent.add_argument('--name', type=str,
+            default=None, help='Name of the agent (default: hostname).')
+    agent.add_argument('--nb_barriers', type=int,
+            default=10, help='Number of barriers.')
+    args = parser.parse_args()
+    if args.command == 'coordinator':
+        Coordinator(args.nb_agents, port=args.port, start_delay=args.start_delay, output=args.output).serve()
+    else:
+        agent = Agent(args.host, args.port, args.name)
+        try:
+            for _ in range(args.nb_barriers):
+                result = agent.wait()
+                print('%.6f %.6f %.6f' % (time.time(), result['clock_offset'], result['start_lateness']))
+                sys.stdout.flush()
+        finally:
+            agent.close()
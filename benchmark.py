@@ -0,0 +1,285 @@
+#! /usr/bin/env python3
+
+import sys
+import os
+import time
+import json
+import random
+import argparse
+import contextlib
+import subprocess
+import tracemalloc
+import pandas
+from experiment import *
+import compare_csv
+
+# Mock programs, in the spirit of MockProgram in test_experiment.py, so that the framework
+# can be benchmarked without running any real experiment.
+
+class BenchApplication(Program):
+    header = ['call_index', 'time']
+    key = ['run_index', 'call_index']
+
+    def __init__(self, nb_calls):
+        super().__init__()
+        self.nb_calls = nb_calls
+
+    def __command_line__(self):
+        return ['true']
+
+    def __environment_variables__(self):
+        return {'OMP_NUM_THREADS': '1'}
+
+    def __fetch_data__(self):
+        for call_index in range(self.nb_calls):
+            self.__append_data__({'call_index': call_index, 'time': random.random()})
+
+class BenchWrapper(PurePythonProgram):
+    def __init__(self, idn):
+        super().__init__()
+        self.idn = idn
+        self.header = ['metric_%d' % idn]
+
+    @property
+    def name(self):
+        return 'BenchWrapper_%d' % self.idn
+
+    def __fetch_data__(self):
+        self.__append_data__({self.header[0]: random.random()})
+
+class BenchThreads(PurePythonProgram):
+    '''Per-thread data, like Likwid.'''
+    header = ['call_index', 'thread_index', 'thread_metric']
+    key = ['run_index', 'call_index', 'thread_index']
+
+    def __init__(self, nb_calls, nb_threads):
+        super().__init__()
+        self.nb_calls = nb_calls
+        self.nb_threads = nb_threads
+
+    def __fetch_data__(self):
+        for call_index in range(self.nb_calls):
+            for thread_index in range(self.nb_threads):
+                self.__append_data__({'call_index': call_index, 'thread_index': thread_index, 'thread_metric': random.random()})
+
+def make_engine(nb_calls, nb_threads, nb_wrappers):
+    wrappers = [DisableWrapper(BenchWrapper(i)) for i in range(nb_wrappers)]
+    if nb_threads > 1:
+        wrappers.append(BenchThreads(nb_calls, nb_threads))
+    return ExpEngine(application=BenchApplication(nb_calls), wrappers=wrappers)
+
+def fill_engine(engine, nb_runs):
+    for _ in range(nb_runs):
+        engine.randomly_enable()
+        engine.fetch_data()
+
+def write_likwid_output(likwid, nb_calls, nb_threads):
+    events = ['INSTR_RETIRED_ANY', 'CPU_CLK_UNHALTED_CORE', 'CPU_CLK_UNHALTED_REF']
+    with open(likwid.tmp_output, 'w') as f:
+        f.write('STRUCT,Info,3\nCPU name:,Bench CPU\nCPU clock:,2.40 GHz\n')
+        f.write('Event,Counter,%s\n' % ','.join('Core %d' % i for i in range(nb_threads)))
+        for evt in events:
+            f.write('%s,FIXC0,%s\n' % (evt, ','.join(['1'] * nb_threads)))
+        f.write('TABLE,Region perf_dgemm\n')
+    with open(likwid.tmp_filename, 'w') as f:
+        for call_index in range(nb_calls):
+            for thread_index in range(nb_threads):
+                f.write('%d,%f,%d,%d,%s\n' % (call_index, call_index+1, thread_index, thread_index, ','.join(['1000'] * len(events))))
+
+def write_perf_output(perf):
+    with open(perf.tmp_filename, 'w') as f:
+        f.write('# started on Mon Jan 1 00:00:00 2018\n\n')
+        for metric in perf.metrics:
+            f.write('%d,,%s,1000,100.00,,\n' % (random.randint(0, 10**6), metric))
+
+def bench_fetch_data(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    engine = make_engine(nb_calls, nb_threads, nb_wrappers)
+    yield
+    fill_engine(engine, nb_runs)
+
+def bench_gather_data(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    engine = make_engine(nb_calls, nb_threads, nb_wrappers)
+    fill_engine(engine, nb_runs)
+    yield
+    engine.gather_data()
+
+def bench_merge_data(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    engine = make_engine(nb_calls, nb_threads, nb_wrappers)
+    fill_engine(engine, nb_runs)
+    other = pandas.DataFrame()
+    for prog in engine.wrappers:
+        other = prog.merge_data(other)
+    yield
+    engine.application.merge_data(other)
+
+def bench_write_csv(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    engine = make_engine(nb_calls, nb_threads, nb_wrappers)
+    fill_engine(engine, nb_runs)
+    data = engine.gather_data()
+    yield
+    data.to_csv()
+
+def bench_likwid(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    Likwid.available_groups = {'CLOCK'} # no call to likwid-perfctr
+    likwid = Likwid(group='CLOCK', nb_threads=1)
+    write_likwid_output(likwid, nb_calls, nb_threads)
+    yield
+    for _ in range(nb_runs):
+        likwid.fetch_data()
+    likwid.post_process()
+
+def bench_perf(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    perf = Perf()
+    write_perf_output(perf)
+    yield
+    for _ in range(nb_runs):
+        perf.fetch_data()
+
+def compare_csv_data(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    '''A control file and a new file of 100 of its rows, as read by compare_csv, and the columns telling if each program was enabled.'''
+    engine = make_engine(nb_calls, nb_threads, nb_wrappers)
+    fill_engine(engine, nb_runs)
+    control = engine.gather_data()
+    control['filename'] = 'control.csv'
+    control['index'] = range(1, len(control)+1)
+    new = control.sample(n=min(len(control), 100)).copy()
+    new['filename'] = 'new.csv'
+    return control, new, [prog.name for prog in engine.programs]
+
+def bench_compare_csv(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    control, new, _ = compare_csv_data(nb_runs, nb_calls, nb_threads, nb_wrappers)
+    yield
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        compare_csv.compare_all(control, new, ['call_index'], ['run_index', 'index', 'filename'])
+
+def bench_index_update(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    control, _, enabled = compare_csv_data(nb_runs, nb_calls, nb_threads, nb_wrappers)
+    yield
+    compare_csv.BaselineIndex(['call_index'], ['run_index', *enabled]).update(control, 'control.csv')
+
+def bench_index_check(nb_runs, nb_calls, nb_threads, nb_wrappers):
+    control, new, enabled = compare_csv_data(nb_runs, nb_calls, nb_threads, nb_wrappers)
+    index = compare_csv.BaselineIndex(['call_index'], ['run_index', *enabled])
+    index.update(control, 'control.csv')
+    yield
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        index.check(new)
+
+# Startup time of the command line tools (a new interpreter for each measure), the parameters do not apply.
+STARTUP_COMMANDS = {
+    'import_experiment': [sys.executable, '-c', 'import experiment'],
+    'multi_runner_help': [sys.executable, 'multi_runner.py', '--help'],
+    'runner_help': [sys.executable, 'runner.py', '--help'],
+}
+
+def bench_startup(command):
+    def bench(nb_runs, nb_calls, nb_threads, nb_wrappers):
+        yield
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return bench
+
+BENCHMARKS = {
+    'fetch_data': bench_fetch_data,
+    'gather_data': bench_gather_data,
+    'merge_data': bench_merge_data,
+    'write_csv': bench_write_csv,
+    'likwid': bench_likwid,
+    'perf': bench_perf,
+    'compare_csv': bench_compare_csv,
+    'index_update': bench_index_update,
+    'index_check': bench_index_check,
+    **{name: bench_startup(command) for name, command in STARTUP_COMMANDS.items()},
+}
+
+def measure(bench, params, nb_repeat):
+    '''Run the benchmark nb_repeat times and return the minimal time and the peak memory of the measured part.'''
+    times = []
+    for _ in range(nb_repeat):
+        gen = bench(**params)
+        next(gen) # setup, not measured
+        start = time.perf_counter()
+        for _ in gen:
+            pass
+        times.append(time.perf_counter() - start)
+    gen = bench(**params)
+    next(gen)
+    tracemalloc.start()
+    for _ in gen:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+def get_configurations(args):
+    '''Scale one parameter at a time, the others remaining at their first value.'''
+    base = {'nb_runs': args.runs[0], 'nb_calls': args.calls[0], 'nb_threads': args.threads[0], 'nb_wrappers': args.wrappers[0]}
+    configurations = [base]
+    for name, values in [('nb_runs', args.runs), ('nb_calls', args.calls), ('nb_threads', args.threads), ('nb_wrappers', args.wrappers)]:
+        for value in values[1:]:
+            configurations.append(dict(base, **{name: value}))
+    return configurations
+
+def result_key(result):
+    return (result['benchmark'], result['nb_runs'], result['nb_calls'], result['nb_threads'], result['nb_wrappers'])
+
+def compare_results(baseline, results, threshold):
+    baseline = {result_key(res): res for res in baseline['results']}
+    nb_regressions = 0
+    for res in results:
+        try:
+            old = baseline[result_key(res)]
+        except KeyError:
+            continue
+        ratio = res['time'] / old['time']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            nb_regressions += 1
+        print('%-17s runs=%-4d calls=%-4d threads=%-3d wrappers=%-3d time x%.2f memory x%.2f %s' % (*result_key(res), ratio,
+            res['peak_memory'] / max(old['peak_memory'], 1), flag))
+    return nb_regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Benchmark of the overhead of the experiment framework itself (no real experiment is run).')
+    parser.add_argument('--runs', type=int, nargs='+',
+            default=[20, 100], help='Number of runs (the first value is the base value).')
+    parser.add_argument('--calls', type=int, nargs='+',
+            default=[20, 100], help='Number of calls per run (the first value is the base value).')
+    parser.add_argument('--threads', type=int, nargs='+',
+            default=[1, 8], help='Number of threads, i.e. per-thread rows per call (the first value is the base value).')
+    parser.add_argument('--wrappers', type=int, nargs='+',
+            default=[4, 16], help='Number of wrappers (the first value is the base value).')
+    parser.add_argument('--benchmarks', type=str, nargs='+', choices=list(BENCHMARKS),
+            default=list(BENCHMARKS), help='Benchmarks to run.')
+    parser.add_argument('--repeat', type=int,
+            default=3, help='Number of repetitions of each measure (the minimum is kept).')
+    parser.add_argument('--save', type=str,
+            default=None, help='Save the results in the given JSON file, to be used as a baseline.')
+    parser.add_argument('--compare', type=str,
+            default=None, help='Compare the results with the given baseline JSON file.')
+    parser.add_argument('--threshold', type=float,
+            default=0.2, help='Relative slowdown above which a regression is reported.')
+    args = parser.parse_args()
+    results = []
+    for name in args.benchmarks:
+        configurations = get_configurations(args)
+        if name in STARTUP_COMMANDS:
+            configurations = configurations[:1]
+        for params in configurations:
+            duration, peak = measure(BENCHMARKS[name], params, args.repeat)
+            results.append(dict(params, benchmark=name, time=duration, peak_memory=peak))
+            print('%-17s runs=%-4d calls=%-4d threads=%-3d wrappers=%-3d %8.4fs %8.2fMB' % (*result_key(results[-1]), duration, peak/1e6))
+    if args.save:
+        try:
+            git_hash = git.Repo(search_parent_directories=True).head.object.hexsha
+        except git.exc.InvalidGitRepositoryError:
+            git_hash = None
+        with open(args.save, 'w') as f:
+            json.dump({'git_hash': git_hash, 'date': time.strftime('%Y/%m/%d %H:%M:%S'), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\nComparison with %s (commit %s, %s)' % (args.compare, baseline['git_hash'], baseline['date']))
+        if compare_results(baseline, results, args.threshold) > 0:
+            sys.exit(1)
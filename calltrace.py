@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+
+import sys
+import argparse
+import collections
+from utils import lazy_import
+numpy = lazy_import('numpy')
+pandas = lazy_import('pandas')
+
+# Traces of dgemm/dtrsm calls, replayed in order by trace_replay.c (see TraceReplay in experiment.py).
+# A trace file has one call per line: "dgemm <m> <n> <k> <lead_A> <lead_B> <lead_C>" or "dtrsm <m> <n> <lead_A> <lead_B>",
+# with the same conventions than dgemm_test and dtrsm_test (and thus than the files produced by runner.py).
+
+Call = collections.namedtuple('Call', ['kernel', 'm', 'n', 'k', 'lead_A', 'lead_B', 'lead_C'])
+
+class TraceError(Exception):
+    pass
+
+def read_trace(filename):
+    calls = []
+    with open(filename) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split()
+            if len(line) == 0 or line[0].startswith('#'):
+                continue
+            try:
+                if line[0] == 'dgemm' and len(line) == 7:
+                    calls.append(Call('dgemm', *(int(v) for v in line[1:])))
+                elif line[0] == 'dtrsm' and len(line) == 5:
+                    m, n, lead_A, lead_B = (int(v) for v in line[1:])
+                    calls.append(Call('dtrsm', m, n, 0, lead_A, lead_B, 0))
+                else:
+                    raise ValueError()
+            except ValueError:
+                raise TraceError('Wrong call at line %d of %s: %s' % (line_number, filename, ' '.join(line)))
+    return calls
+
+def write_trace(calls, filename):
+    with open(filename, 'w') as f:
+        for call in calls:
+            if call.kernel == 'dgemm':
+                f.write('dgemm %d %d %d %d %d %d\n' % call[1:])
+            else:
+                f.write('dtrsm %d %d %d %d\n' % (call.m, call.n, call.lead_A, call.lead_B))
+
+def numroc(n, nb, iproc, nprocs):
+    '''Number of rows (or columns) among the first n owned by the process iproc, with a block-cyclic distribution.'''
+    nb_blocks = n // nb
+    result = (nb_blocks // nprocs) * nb
+    extra = nb_blocks % nprocs
+    if iproc < extra:
+        result += nb
+    elif iproc == extra:
+        result += n % nb
+    return result
+
+def hpl_trace(N, NB, P=1, Q=1, process=(0, 0)):
+    '''
+    Sequence of the calls made by the given process for the trailing matrix updates of HPL (right-looking
+    LU factorization of a N×N matrix, with blocks of size NB distributed on a P×Q grid, without look-ahead).
+    For each panel, the row panel U is solved with dtrsm and the trailing matrix is updated with dgemm.
+    The small calls of the panel factorization are not included.
+    '''
+    p, q = process
+    if not (0 <= p < P and 0 <= q < Q):
+        raise TraceError('Process (%d, %d) is not in the %d×%d grid.' % (p, q, P, Q))
+    lead_dim = max(1, numroc(N, NB, p, P))
+    calls = []
+    for j in range(0, N, NB):
+        jb = min(NB, N-j)
+        mp = numroc(N, NB, p, P) - numroc(j+jb, NB, p, P) # local size of the trailing matrix
+        nq = numroc(N, NB, q, Q) - numroc(j+jb, NB, q, Q)
+        if nq > 0:
+            calls.append(Call('dtrsm', nq, jb, 0, jb, nq, 0))
+            if mp > 0:
+                calls.append(Call('dgemm', mp, nq, jb, mp, nq, lead_dim))
+    return calls
+
+def predict(df, models):
+    '''Add a column predicted_time, with the given linear_regression model of each kernel ({kernel: model}).'''
+    df = df.copy()
+    df['predicted_time'] = numpy.nan
+    for kernel, model in models.items():
+        mask = df['kernel'] == kernel
+        if mask.any():
+            df.loc[mask, 'predicted_time'] = model.predict(df[mask]).values
+    return df
+
+def compare(df):
+    '''Measured and predicted total time of each run.'''
+    result = df.groupby('run_index').agg(measured=('time', 'sum'), predicted=('predicted_time', 'sum'), nb_calls=('time', 'size'))
+    result['ratio'] = result['measured'] / result['predicted']
+    return result.reset_index()
+
+def process_parser(string):
+    return tuple(int(v) for v in string.split(','))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Generation, replay and analysis of traces of dgemm/dtrsm calls.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    generate = subparsers.add_parser('hpl', help='Generate the trace of a process of HPL.')
+    generate.add_argument('N', type=int, help='Size of the matrix.')
+    generate.add_argument('NB', type=int, help='Block size.')
+    generate.add_argument('P', type=int, help='Number of rows of the process grid.')
+    generate.add_argument('Q', type=int, help='Number of columns of the process grid.')
+    generate.add_argument('--process', type=process_parser,
+            default=(0, 0), help='Coordinates of the process in the grid (example: "0,1").')
+    generate.add_argument('--output', type=str,
+            required=True, help='Trace file.')
+    replay = subparsers.add_parser('run', help='Replay a trace several times.')
+    replay.add_argument('trace_file', type=str, help='Trace file.')
+    replay.add_argument('--lib', type=str, choices=['mkl', 'mkl2', 'atlas', 'openblas'],
+            required=True, help='Library to use.')
+    replay.add_argument('-np', '--nb_threads', type=int,
+            default=1, help='Number of threads used to perform the operations.')
+    replay.add_argument('--nb_runs', type=int,
+            default=10, help='Number of replays.')
+    replay.add_argument('--csv_file', type=str,
+            required=True, help='Path of the CSV file for the results.')
+    analysis = subparsers.add_parser('compare', help='Compare the total time of each replay with the prediction of linear_regression models.')
+    analysis.add_argument('csv_file', type=str, help='Result file of the replay.')
+    analysis.add_argument('--dgemm_model', type=str,
+            default=None, help='Result file of runner.py for dgemm, used to fit the dgemm model.')
+    analysis.add_argument('--dtrsm_model', type=str,
+            default=None, help='Result file of runner.py for dtrsm, used to fit the dtrsm model.')
+    analysis.add_argument('--output', type=str,
+            default=None, help='Write the results with the predicted time of each call in this CSV file.')
+    args = parser.parse_args()
+    if args.command == 'hpl':
+        write_trace(hpl_trace(args.N, args.NB, args.P, args.Q, args.process), args.output)
+    elif args.command == 'run':
+        from experiment import ExpEngine, TraceReplay, CommandLine, Date, Platform, CPU
+        app = TraceReplay(lib=args.lib, trace_file=args.trace_file, nb_threads=args.nb_threads)
+        ExpEngine(application=app, wrappers=[CommandLine(), Date(), Platform(), CPU()]).run_all(nb_runs=args.nb_runs, filename=args.csv_file)
+    else:
+        from linear_regression import get_reg
+        models = {}
+        if args.dgemm_model:
+            models['dgemm'] = get_reg(args.dgemm_model)
+        if args.dtrsm_model:
+            models['dtrsm'] = get_reg(args.dtrsm_model)
+        if len(models) == 0:
+            parser.error('at least one model is required.')
+        df = predict(pandas.read_csv(args.csv_file), models)
+        if args.output:
+            df.to_csv(args.output, index=False)
+        compare(df).to_csv(sys.stdout, index=False)
@@ -1,3 +1,6 @@
+#ifdef USE_DLOPEN
+#define _GNU_SOURCE // for dladdr
+#endif
 #include "common_matrix.h"
 
 #ifdef USE_MKL
@@ -16,36 +19,246 @@
 #pragma message "Using Atlas for BLAS."
 #include <cblas.h>
 #endif
+#ifdef USE_DLOPEN
+#pragma message "Loading the BLAS library at runtime (environment variable BLAS_LIBRARY)."
+#include <dlfcn.h>
+#include <limits.h>
+// Values of the CBLAS enumerations, they are the same in all the implementations, so no cblas.h is needed.
+enum {DLOPEN_ROW_MAJOR = 101, DLOPEN_NO_TRANS = 111};
+typedef void (*dgemm_function)(int, int, int, int, int, int, double, const double*, int, const double*, int, double, double*, int);
+typedef void (*set_threads_function)(int);
+typedef char *(*openblas_config_function)(void);
+typedef void (*mkl_version_function)(char*, int);
+static dgemm_function dynamic_dgemm = NULL;
+static set_threads_function dynamic_set_threads = NULL;
+#endif
+
+#include <stdio.h>
+#include <sys/mman.h>
+
+#define PAGE_SIZE (1<<12)
+#define HUGE_PAGE_SIZE (1<<21)
+
+enum allocation_mode {ALLOC_MALLOC, ALLOC_ALIGNED, ALLOC_THP, ALLOC_NOTHP, ALLOC_FIRST_TOUCH, ALLOC_HUGETLB, NB_ALLOCATION_MODES};
+static const char *allocation_names[NB_ALLOCATION_MODES] = {"malloc", "aligned", "thp", "nothp", "first_touch", "hugetlb"};
+
+// The buffers mapped with MAP_HUGETLB, with their size, so that free_buffer can unmap them.
+#define MAX_HUGETLB_BUFFERS 64
+static struct {void *buffer; size_t nb_bytes;} hugetlb_buffers[MAX_HUGETLB_BUFFERS];
+
+static enum allocation_mode get_allocation_mode(void) {
+    char *name = getenv("DGEMM_ALLOCATION");
+    if(name == NULL)
+        return ALLOC_MALLOC;
+    for(int mode = 0; mode < NB_ALLOCATION_MODES; mode++) {
+        if(strcmp(name, allocation_names[mode]) == 0)
+            return mode;
+    }
+    fprintf(stderr, "Unknown allocation mode %s.\n", name);
+    exit(1);
+}
+
+static void *aligned_buffer(size_t alignment, size_t nb_bytes) {
+    void *result = NULL;
+    int error = posix_memalign(&result, alignment, nb_bytes);
+    assert(error == 0 && result);
+    return result;
+}
+
+static void *hugetlb_buffer(size_t nb_bytes) {
+#ifdef MAP_HUGETLB
+    void *result = mmap(NULL, nb_bytes, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS | MAP_HUGETLB, -1, 0);
+    if(result == MAP_FAILED) {
+        perror("mmap");
+        fprintf(stderr, "Error: could not allocate %zu bytes of huge pages, are enough huge pages reserved (see /proc/sys/vm/nr_hugepages)?\n", nb_bytes);
+        exit(1);
+    }
+    for(int i = 0; i < MAX_HUGETLB_BUFFERS; i++) {
+        if(hugetlb_buffers[i].buffer == NULL) {
+            hugetlb_buffers[i].buffer = result;
+            hugetlb_buffers[i].nb_bytes = nb_bytes;
+            return result;
+        }
+    }
+    fprintf(stderr, "Error: more than %d buffers allocated with huge pages.\n", MAX_HUGETLB_BUFFERS);
+    exit(1);
+#else
+    (void)nb_bytes;
+    fprintf(stderr, "Error: MAP_HUGETLB is not supported on this system.\n");
+    exit(1);
+#endif
+}
+
+void *allocate_buffer(size_t nb_bytes) {
+    size_t huge_nb_bytes = (nb_bytes + HUGE_PAGE_SIZE - 1) / HUGE_PAGE_SIZE * HUGE_PAGE_SIZE;
+    char *result;
+    switch(get_allocation_mode()) {
+        case ALLOC_ALIGNED:
+            result = aligned_buffer(PAGE_SIZE, nb_bytes);
+            break;
+        case ALLOC_THP:
+        case ALLOC_NOTHP:
+            result = aligned_buffer(HUGE_PAGE_SIZE, huge_nb_bytes);
+#ifdef MADV_HUGEPAGE
+            if(madvise(result, huge_nb_bytes, get_allocation_mode() == ALLOC_THP ? MADV_HUGEPAGE : MADV_NOHUGEPAGE) != 0)
+                perror("madvise");
+#endif
+            break;
+        case ALLOC_FIRST_TOUCH:
+            result = aligned_buffer(PAGE_SIZE, nb_bytes);
+            #pragma omp parallel for schedule(static)
+            for(long offset = 0 ; offset < (long)nb_bytes ; offset += PAGE_SIZE) {
+                memset(result + offset, 1, nb_bytes - offset < PAGE_SIZE ? nb_bytes - offset : PAGE_SIZE);
+            }
+            return result;
+        case ALLOC_HUGETLB:
+            result = hugetlb_buffer(huge_nb_bytes);
+            break;
+        default:
+            result = malloc(nb_bytes);
+            assert(result);
+    }
+    memset(result, 1, nb_bytes);
+    return result;
+}
+
+void free_buffer(void *buffer) {
+    for(int i = 0; i < MAX_HUGETLB_BUFFERS; i++) {
+        if(buffer != NULL && hugetlb_buffers[i].buffer == buffer) {
+            munmap(buffer, hugetlb_buffers[i].nb_bytes);
+            hugetlb_buffers[i].buffer = NULL;
+            return;
+        }
+    }
+    free(buffer);
+}
+
+double *allocate_matrix(int size) {
+    return (double*) allocate_buffer((size_t)size*size*sizeof(double));
+}
+
+#ifdef USE_DLOPEN
+// The path and the version of the loaded library are written in the file given by BLAS_INFO_FILE, if any.
+static void write_blas_info(void *handle) {
+    char *filename = getenv("BLAS_INFO_FILE");
+    if(filename == NULL)
+        return;
+    FILE *f = fopen(filename, "w");
+    if(f == NULL) {
+        perror(filename);
+        exit(1);
+    }
+    Dl_info info;
+    char path[PATH_MAX];
+    if(dladdr((void*) dynamic_dgemm, &info) == 0 || realpath(info.dli_fname, path) == NULL)
+        strcpy(path, getenv("BLAS_LIBRARY"));
+    fprintf(f, "%s\n", path);
+    openblas_config_function openblas_config = (openblas_config_function) dlsym(handle, "openblas_get_config");
+    mkl_version_function mkl_version = (mkl_version_function) dlsym(handle, "MKL_Get_Version_String");
+    char version[256] = "unknown";
+    if(openblas_config != NULL)
+        snprintf(version, sizeof(version), "%s", openblas_config());
+    else if(mkl_version != NULL)
+        mkl_version(version, sizeof(version));
+    fprintf(f, "%s\n", version);
+    fclose(f);
+}
+#endif
+
+void load_blas_library(void) {
+#ifdef USE_DLOPEN
+    if(dynamic_dgemm != NULL)
+        return;
+    char *filename = getenv("BLAS_LIBRARY");
+    if(filename == NULL) {
+        fprintf(stderr, "Error: the environment variable BLAS_LIBRARY is not set.\n");
+        exit(1);
+    }
+    void *handle = dlopen(filename, RTLD_NOW | RTLD_LOCAL);
+    if(handle == NULL) {
+        fprintf(stderr, "Error: %s\n", dlerror());
+        exit(1);
+    }
+    dynamic_dgemm = (dgemm_function) dlsym(handle, "cblas_dgemm");
+    if(dynamic_dgemm == NULL) {
+        fprintf(stderr, "Error: no cblas_dgemm in %s.\n", filename);
+        exit(1);
+    }
+    dynamic_set_threads = (set_threads_function) dlsym(handle, "openblas_set_num_threads");
+    if(dynamic_set_threads == NULL)
+        dynamic_set_threads = (set_threads_function) dlsym(handle, "MKL_Set_Num_Threads");
+    write_blas_info(handle);
+#endif
+}
 
 inline int min(int a, int b) {
     return a < b ? a : b;
 }
 
-void matrix_product(double *A, double *B, double *C, int size) {
 #ifdef USE_NAIVE
+// Variants of the naive version (see autotune.py), in addition to BLOCK_SIZE:
+//  - LOOP_ORDER: order of the three loops within a block, e.g. -DLOOP_ORDER="LOOP_I LOOP_K LOOP_J"
+//  - COLLAPSE: distribute the (i0, j0) blocks among the threads, instead of only the j0 blocks of each i0 row
+#define LOOP_I for(int i = i0 ; i < min(i0+BLOCK_SIZE, size) ; i++)
+#define LOOP_J for(int j = j0 ; j < min(j0+BLOCK_SIZE, size) ; j++)
+#define LOOP_K for(int k = k0 ; k < min(k0+BLOCK_SIZE, size) ; k++)
+#ifndef LOOP_ORDER
+#define LOOP_ORDER LOOP_K LOOP_I LOOP_J
+#endif
+
+static inline void block_product(double *A, double *B, double *C, int size, int i0, int j0) {
+    for(int k0 = 0 ; k0 < size ; k0 += BLOCK_SIZE) {
+        LOOP_ORDER {
+            double a = matrix_get(A, size, i, k);
+            double b = matrix_get(B, size, k, j);
+            double c = matrix_get(C, size, i, j);
+            matrix_set(C, size, i, j, c + a*b);
+        }
+    }
+}
+#endif
+
+void matrix_product(double *A, double *B, double *C, int size) {
+#if defined(USE_NAIVE) && defined(COLLAPSE)
+    // reported to slow down the execution by a factor 2 (hypothesis: more cache miss), to be checked with autotune.py
+    #pragma omp parallel for collapse(2)
+    for(int i0 = 0 ; i0 < size ; i0 += BLOCK_SIZE) {
+        for(int j0 = 0 ; j0 < size ; j0 += BLOCK_SIZE) {
+            block_product(A, B, C, size, i0, j0);
+        }
+    }
+#elif defined(USE_NAIVE)
     #pragma omp parallel
     {
     for(int i0 = 0 ; i0 < size ; i0 += BLOCK_SIZE) {
-        #pragma omp for // collapse(2) // ← doing the j-loop in parallel slow down the execution by a factor 2 (hypothesis: more cache miss)
+        #pragma omp for
         for(int j0 = 0 ; j0 < size ; j0 += BLOCK_SIZE) {
-            for(int k0 = 0 ; k0 < size ; k0 += BLOCK_SIZE) {
-                for(int k = k0 ; k < min(k0+BLOCK_SIZE, size) ; k++) {
-                    for(int i = i0 ; i < min(i0+BLOCK_SIZE, size) ; i++) {
-                        for(int j = j0 ; j < min(j0+BLOCK_SIZE, size) ; j++) {
-                            double a = matrix_get(A, size, i, k);
-                            double b = matrix_get(B, size, k, j);
-                            double c = matrix_get(C, size, i, j);
-                            matrix_set(C, size, i, j, c + a*b);
-                        }
-                    }
-                }
-            }
+            block_product(A, B, C, size, i0, j0);
         }
     }
     }
+#elif defined(USE_DLOPEN)
+    load_blas_library();
+    dynamic_dgemm(DLOPEN_ROW_MAJOR, DLOPEN_NO_TRANS, DLOPEN_NO_TRANS, size, size, size, 1., A, size, B, size, 1., C, size);
 #else
     double alpha = 1.;
     double beta = 1.;
     cblas_dgemm(CblasRowMajor, CblasNoTrans, CblasNoTrans, size, size, size, alpha, A, size, B, size, beta, C, size);
 #endif
 }
+
+void set_nb_threads(int nb_threads) {
+#if defined(USE_NAIVE) && defined(_OPENMP)
+    omp_set_num_threads(nb_threads);
+#elif defined(USE_OPENBLAS)
+    openblas_set_num_threads(nb_threads);
+#elif defined(USE_MKL)
+    mkl_set_num_threads(nb_threads);
+#elif defined(USE_DLOPEN)
+    load_blas_library();
+    if(dynamic_set_threads != NULL)
+        dynamic_set_threads(nb_threads);
+#else
+    (void)nb_threads; // no way to change the number of threads at runtime (e.g. Atlas)
+#endif
+}
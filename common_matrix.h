@@ -4,15 +4,24 @@
 #include <string.h>
 #include <stdlib.h>
 
-static inline double *allocate_matrix(int size) {
-    double *result = (double*) malloc(size*size*sizeof(double));
-    memset(result, 1, size*size*sizeof(double));
-    assert(result);
-    return result;
-}
+// The allocation mode is given by the environment variable DGEMM_ALLOCATION:
+//  - malloc (default): plain malloc, the matrix is initialized by the main thread
+//  - aligned: aligned on a page boundary
+//  - thp: aligned on a huge page boundary, transparent huge pages are requested with madvise
+//  - nothp: aligned on a huge page boundary, transparent huge pages are disabled with madvise
+//  - first_touch: aligned on a page boundary, the matrix is initialized in parallel by the OpenMP threads
+//  - hugetlb: mapped with MAP_HUGETLB, from the huge pages reserved in /proc/sys/vm/nr_hugepages (exits with an error
+//    if there are not enough of them)
+void *allocate_buffer(size_t nb_bytes);
+
+// Free a buffer allocated with allocate_buffer (whatever the allocation mode).
+void free_buffer(void *buffer);
+
+// A square matrix of doubles, allocated with allocate_buffer.
+double *allocate_matrix(int size);
 
 static inline void free_matrix(double *matrix) {
-    free(matrix);
+    free_buffer(matrix);
 }
 
 static inline void matrix_set(double *matrix, int size, int i, int j, double value) {
@@ -25,4 +34,10 @@ static inline double matrix_get(double *matrix, int size, int i, int j) {
 
 void matrix_product(double *A, double *B, double *C, int size);
 
+void set_nb_threads(int nb_threads);
+
+// With USE_DLOPEN, load the library given by the environment variable BLAS_LIBRARY (done by the first call to
+// matrix_product or set_nb_threads otherwise), does nothing for the other libraries.
+void load_blas_library(void);
+
 #endif
@@ -1,10 +1,17 @@
 #! /usr/bin/env python3
 
+import os
 import sys
-from pandas import DataFrame
+import json
+import math
+import time
+import numpy
+import pandas
+from ingest import load_results
+from analytics import config_key
 
 def read_csv(filename):
-    df = DataFrame.from_csv(filename, index_col=None)
+    df, _ = load_results([filename])
     df['index'] = range(1, len(df)+1)
     df['filename'] = filename
     return df
@@ -50,7 +57,181 @@ def compare_all(df1, df2, control_variables, excluded_variables):
         error += compare(df1, row[1], control_variables, excluded_variables)
     return error
 
+# Baseline index: a compact summary of the accepted results, so that a new file can be checked without
+# re-reading the control files. For each group (i.e. each value of the control variables) and each variable,
+# the index keeps a sketch of each of the last accepted files (rolling window): count, min, max, mean, sum of
+# the squared deviations and a few quantiles for the numeric variables, the distinct values for the other ones.
+# The statistics of the window are merged from these sketches. Numeric variables are checked against the
+# [min, max] envelope of the window, the other ones against its distinct values.
+
+AUTOMATIC_EXCLUDED = ['index', 'filename']
+QUANTILES = [0.05, 0.5, 0.95]
+SKETCH_QUANTILES = numpy.linspace(0, 1, 21)
+
+class BaselineIndex:
+    def __init__(self, control_variables, excluded_variables, window=10):
+        self.control_variables = list(control_variables)
+        self.excluded_variables = list(excluded_variables)
+        self.window = window
+        self.versions = []
+        self.groups = {}
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            content = json.load(f)
+        index = cls(content['control_variables'], content['excluded_variables'], content['window'])
+        index.versions = content['versions']
+        index.groups = content['groups']
+        return index
+
+    def save(self, filename):
+        content = {
+            'control_variables': self.control_variables,
+            'excluded_variables': self.excluded_variables,
+            'window': self.window,
+            'versions': self.versions,
+            'groups': self.groups,
+        }
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_filename, filename)
+
+    def variables(self, df):
+        excluded = set(self.control_variables) | set(self.excluded_variables) | set(AUTOMATIC_EXCLUDED)
+        return [var for var in df.columns if var not in excluded]
+
+    @staticmethod
+    def sketch(values):
+        '''The summary of the values of a variable in a file.'''
+        if pandas.api.types.is_numeric_dtype(values) and not pandas.api.types.is_bool_dtype(values):
+            values = values.values.astype(numpy.float64)
+            return {'count': len(values), 'min': float(values.min()), 'max': float(values.max()), 'mean': float(values.mean()),
+                    'm2': float(((values - values.mean())**2).sum()),
+                    'quantiles': [float(v) for v in numpy.quantile(values, SKETCH_QUANTILES)]}
+        return {'count': len(values), 'distinct': sorted(set(str(v) for v in values))}
+
+    @staticmethod
+    def summary(sketches):
+        '''The statistics of the window, merged from the sketches of its files.'''
+        count = sum(sketch['count'] for sketch in sketches)
+        if 'distinct' in sketches[0]:
+            return {'distinct': sorted(set().union(*(sketch['distinct'] for sketch in sketches))), 'count': count}
+        mean = sum(sketch['mean']*sketch['count'] for sketch in sketches) / count
+        m2 = sum(sketch['m2'] + sketch['count']*(sketch['mean'] - mean)**2 for sketch in sketches) # Chan et al.
+        stats = {'min': min(sketch['min'] for sketch in sketches), 'max': max(sketch['max'] for sketch in sketches),
+                 'count': count, 'mean': mean, 'std': math.sqrt(m2/(count-1)) if count > 1 else float('nan')}
+        # each quantile of a sketch stands for the same share of the values of its file
+        points = numpy.concatenate([sketch['quantiles'] for sketch in sketches])
+        weights = numpy.concatenate([[sketch['count']/len(sketch['quantiles'])]*len(sketch['quantiles']) for sketch in sketches])
+        order = numpy.argsort(points, kind='stable')
+        cumulated = numpy.cumsum(weights[order])
+        for q in QUANTILES:
+            position = min(numpy.searchsorted(cumulated, q*cumulated[-1]), len(points)-1)
+            stats['q%02d' % (q*100)] = float(points[order][position])
+        return stats
+
+    def groups_of(self, df):
+        if len(self.control_variables) == 1:
+            for value, subset in df.groupby(self.control_variables[0], sort=False):
+                yield (value,), subset
+        else:
+            yield from df.groupby(self.control_variables, sort=False)
+
+    def contains(self, filename):
+        return any(version['filename'] == filename for version in self.versions)
+
+    def update(self, df, filename=None):
+        '''
+        Add the rows of an accepted result file, only the groups present in the file are recomputed.
+        A file already in the index is not added twice, return False in this case.
+        '''
+        if filename is not None and self.contains(filename):
+            return False
+        variables = self.variables(df)
+        for key_values, subset in self.groups_of(df):
+            group = self.groups.setdefault(config_key(key_values), {'sketches': {}, 'stats': {}})
+            for var in variables:
+                values = subset[var].dropna()
+                if len(values) == 0:
+                    continue
+                sketch = self.sketch(values)
+                sketches = [old for old in group['sketches'].get(var, []) if ('distinct' in old) == ('distinct' in sketch)]
+                sketches = (sketches + [sketch])[-self.window:]
+                group['sketches'][var] = sketches
+                group['stats'][var] = self.summary(sketches)
+        version = {'filename': filename, 'date': time.strftime('%Y/%m/%d %H:%M:%S'), 'nb_rows': len(df)}
+        for col in ('git_hash', 'date'):
+            if col in df.columns:
+                version['result_%s' % col] = sorted(str(v) for v in df[col].dropna().unique())
+        self.versions.append(version)
+        return True
+
+    def check(self, df, delta=0.1):
+        '''Compare a new result file with the index, only using the statistics of the groups.'''
+        error = 0
+        variables = self.variables(df)
+        for key_values, subset in self.groups_of(df):
+            try:
+                stats = self.groups[config_key(key_values)]['stats']
+            except KeyError:
+                sys.stderr.write('ERROR, no baseline for %s\n\n' % ', '.join('%s=%s' % item for item in zip(self.control_variables, key_values)))
+                error += 1
+                continue
+            for var in variables:
+                if var not in stats:
+                    continue
+                if 'distinct' in stats[var]:
+                    if len(stats[var]['distinct']) != 1:
+                        raise ValueError('Do not know what to compare, got different candidate values in the baseline for field %s: %s.' % (var, stats[var]['distinct']))
+                    wrong = subset[subset[var].astype(str) != stats[var]['distinct'][0]]
+                    expected = 'a value equal to %s' % stats[var]['distinct'][0]
+                else:
+                    min_expected = stats[var]['min'] * (1-delta)
+                    max_expected = stats[var]['max'] * (1+delta)
+                    wrong = subset[(subset[var] < min_expected) | (subset[var] > max_expected)]
+                    expected = 'a value in [%g, %g]' % (min_expected, max_expected)
+                for _, row in wrong.iterrows():
+                    sys.stderr.write('ERROR for key "%s"\n' % var)
+                    sys.stderr.write('Expected %s (baseline of %d values), got %s (file %s, line %d)\n\n' % (expected, stats[var]['count'], row[var], row['filename'], row['index']))
+                error += len(wrong)
+        return error
+
+def index_main():
+    if sys.argv[1] == 'index' and len(sys.argv) in (6, 7):
+        filename = sys.argv[2]
+        window = int(sys.argv[6]) if len(sys.argv) == 7 else None
+        if os.path.isfile(filename):
+            index = BaselineIndex.load(filename)
+            if window is not None and window != index.window:
+                sys.stderr.write('Error: the index %s has a window of %d files, not %d.\n' % (filename, index.window, window))
+                sys.exit(1)
+            if sys.argv[4].split(',') != index.control_variables:
+                sys.stderr.write('Error: the control variables of the index %s are %s.\n' % (filename, ','.join(index.control_variables)))
+                sys.exit(1)
+        else:
+            index = BaselineIndex(sys.argv[4].split(','), sys.argv[5].split(','), window or 10)
+        if not index.update(read_csv(sys.argv[3]), os.path.abspath(sys.argv[3])):
+            sys.stderr.write('The file %s is already in the index, skipped.\n' % sys.argv[3])
+            sys.exit(0)
+        index.save(filename)
+        sys.exit(0)
+    if sys.argv[1] == 'check' and len(sys.argv) == 4:
+        error = BaselineIndex.load(sys.argv[2]).check(read_csv(sys.argv[3]))
+        if error > 0:
+            sys.stderr.write('Total number of errors: %d\n' % error)
+            sys.exit(1)
+        sys.exit(0)
+    sys.stderr.write('Syntax: %s index <index file> <CSV file> <control variables> <excluded_variables> [<window>]\n' % sys.argv[0])
+    sys.stderr.write('        %s check <index file> <CSV file>\n' % sys.argv[0])
+    sys.stderr.write('The first command adds the rows of an accepted CSV file to the index (created if needed, the window is the number of accepted files summarized per group and variable, it cannot be changed afterwards). A file already in the index is skipped.\n')
+    sys.stderr.write('The second one checks a CSV file against the index, like the comparison with a control file.\n')
+    sys.exit(1)
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('index', 'check'):
+        index_main()
     if len(sys.argv) != 5:
         sys.stderr.write('Syntax: %s <CSV file> <CSV file> <control variables> <excluded_variables>\n' % sys.argv[0])
         sys.stderr.write('Example: %s control_file.csv new_file.csv size,nb_threads date,hour,git_hash\n' % sys.argv[0])
@@ -0,0 +1,229 @@
+#! /usr/bin/env python3
+
+import os
+import csv
+import math
+import random
+import itertools
+import collections
+
+class DesignError(Exception):
+    pass
+
+class Factor:
+    def __init__(self, name, levels):
+        if len(levels) == 0:
+            raise DesignError('Factor %s has no level.' % name)
+        self.name = name
+        self.levels = list(levels)
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.name, self.levels)
+
+    def level(self, u):
+        '''Map a number u in [0, 1) to one of the levels (used by the latin hypercube).'''
+        return self.levels[min(int(u*len(self.levels)), len(self.levels)-1)]
+
+class RangeFactor(Factor):
+    '''A numeric factor sampled in the interval [low, high]. Only usable in a latin hypercube.'''
+    def __init__(self, name, low, high):
+        if low > high:
+            raise DesignError('Empty range for factor %s: [%s, %s].' % (name, low, high))
+        self.name = name
+        self.low = low
+        self.high = high
+
+    def __repr__(self):
+        return '%s(%s, %s, %s)' % (self.__class__.__name__, self.name, self.low, self.high)
+
+    @property
+    def levels(self):
+        raise DesignError('Factor %s is a range, it can only be used in a latin hypercube.' % self.name)
+
+    def level(self, u):
+        value = self.low + u*(self.high-self.low)
+        if isinstance(self.low, int) and isinstance(self.high, int):
+            value = min(int(value), self.high)
+        return value
+
+def full_factorial(factors):
+    names = [factor.name for factor in factors]
+    return [dict(zip(names, values)) for values in itertools.product(*[factor.levels for factor in factors])]
+
+def fractional_factorial(factors, nb_generated):
+    '''
+    Two-level fractional factorial design 2^(k-p), with p=nb_generated.
+    The first k-p factors form a full factorial, each of the p last factors is aliased with
+    a distinct interaction of the base factors (highest order interactions first).
+    '''
+    for factor in factors:
+        if len(factor.levels) != 2:
+            raise DesignError('Factor %s has %d levels, a fractional factorial requires two-level factors.' % (factor.name, len(factor.levels)))
+    nb_base = len(factors) - nb_generated
+    if nb_generated < 0 or nb_base < 1:
+        raise DesignError('Cannot generate %d factors out of %d.' % (nb_generated, len(factors)))
+    interactions = []
+    for order in range(nb_base, 1, -1):
+        interactions.extend(itertools.combinations(range(nb_base), order))
+    if nb_generated > len(interactions):
+        raise DesignError('Too many generated factors (%d), at most %d with %d base factors.' % (nb_generated, len(interactions), nb_base))
+    generators = interactions[:nb_generated]
+    points = []
+    for base in itertools.product([0, 1], repeat=nb_base):
+        coded = list(base) + [sum(base[i] for i in gen) % 2 for gen in generators]
+        points.append({factor.name: factor.levels[c] for factor, c in zip(factors, coded)})
+    return points
+
+def latin_hypercube(factors, nb_points):
+    strata = []
+    for _ in factors:
+        perm = list(range(nb_points))
+        random.shuffle(perm)
+        strata.append(perm)
+    points = []
+    for i in range(nb_points):
+        points.append({factor.name: factor.level((strata[j][i] + random.random())/nb_points) for j, factor in enumerate(factors)})
+    return points
+
+def parse_value(value):
+    if value in ('True', 'False'):
+        return value == 'True'
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+class Schedule:
+    '''
+    The list of runs to perform, with the level of each factor. It is written in a CSV file before the first run
+    and the file is updated after each run (once its data is written), so that an interrupted experiment can be resumed.
+    '''
+    def __init__(self, factor_names, rows, filename=None):
+        self.factor_names = list(factor_names)
+        self.rows = rows
+        self.filename = filename
+
+    @property
+    def header(self):
+        return ['run_index', 'block', *self.factor_names, 'done']
+
+    @classmethod
+    def from_points(cls, factor_names, points, nb_runs=None, blocked=False):
+        '''
+        Replicate the design until there are at least nb_runs runs. When blocked is True, each replicate is
+        a block, shuffled independently. Otherwise, all the runs are shuffled together.
+        '''
+        nb_replicates = max(1, math.ceil(nb_runs/len(points))) if nb_runs else 1
+        blocks = []
+        for block in range(nb_replicates):
+            replicate = [dict(point, block=block if blocked else 0) for point in points]
+            random.shuffle(replicate)
+            blocks.append(replicate)
+        runs = list(itertools.chain(*blocks))
+        if not blocked:
+            random.shuffle(runs)
+        rows = [dict(run, run_index=i, done=False) for i, run in enumerate(runs)]
+        return cls(factor_names, rows)
+
+    @classmethod
+    def generate(cls, design, factors, nb_runs, fraction=1):
+        names = [factor.name for factor in factors]
+        if design == 'full':
+            return cls.from_points(names, full_factorial(factors), nb_runs)
+        elif design == 'blocked':
+            return cls.from_points(names, full_factorial(factors), nb_runs, blocked=True)
+        elif design == 'fractional':
+            return cls.from_points(names, fractional_factorial(factors, fraction), nb_runs)
+        elif design == 'lhs':
+            return cls.from_points(names, latin_hypercube(factors, nb_runs))
+        else:
+            raise DesignError('Unknown design %s.' % design)
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename) as f:
+            reader = csv.DictReader(f)
+            rows = [{key: parse_value(value) for key, value in row.items()} for row in reader]
+            header = reader.fieldnames
+        if header is None or header[:2] != ['run_index', 'block'] or header[-1] != 'done':
+            raise DesignError('Wrong format for schedule file %s.' % filename)
+        return cls(header[2:-1], rows, filename)
+
+    def write(self, filename=None):
+        if filename is not None:
+            self.filename = filename
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=self.header)
+            writer.writeheader()
+            writer.writerows(self.rows)
+        os.replace(tmp_filename, self.filename) # atomic, the schedule is never left half-written
+
+    def minimize_transitions(self, costs=None, randomize=True):
+        '''
+        Reorder the runs of each block to minimize the cost of the transitions between consecutive runs.
+        The runs sharing the same levels for all the costly factors are grouped together, and the groups are
+        chained greedily (nearest neighbour). The cost of changing a factor is given by the costs dictionary
+        (default: 1, a cost of 0 means the factor can change freely).
+        If randomize is True, each block starts from a random group, to avoid a systematic order bias.
+        Otherwise, each block starts from the group closest to the last run of the previous block.
+        '''
+        if any(row['done'] for row in self.rows):
+            raise DesignError('Cannot reorder a schedule which has already been started.')
+        if len(set(row['block'] for row in self.rows)) < 2:
+            # with a single block, all the runs of a level would be consecutive, confounded with the time of the day
+            raise DesignError('Cannot reorder a schedule with a single block, it requires several replicates of a blocked design.')
+        costs = costs or {}
+        costly = [name for name in self.factor_names if costs.get(name, 1) > 0]
+        def distance(state1, state2):
+            return sum(costs.get(name, 1) for name, v1, v2 in zip(costly, state1, state2) if v1 != v2)
+        blocks = collections.OrderedDict()
+        for row in self.rows:
+            blocks.setdefault(row['block'], []).append(row)
+        ordered = []
+        previous = None
+        for rows in blocks.values():
+            groups = collections.OrderedDict()
+            for row in rows:
+                groups.setdefault(tuple(row[name] for name in costly), []).append(row)
+            states = list(groups)
+            if randomize or previous is None:
+                current = random.choice(states)
+            else:
+                current = min(states, key=lambda state: distance(previous, state))
+            while True:
+                states.remove(current)
+                group = groups[current]
+                random.shuffle(group)
+                ordered.extend(group)
+                previous = current
+                if len(states) == 0:
+                    break
+                current = min(states, key=lambda state: distance(previous, state))
+        for i, row in enumerate(ordered):
+            row['run_index'] = i
+        self.rows = ordered
+
+    def transition_costs(self, costs=None):
+        '''The cost of the transition before each run (the first run has no transition).'''
+        costs = costs or {}
+        result = [0]
+        for row1, row2 in zip(self.rows, self.rows[1:]):
+            result.append(sum(costs.get(name, 1) for name in self.factor_names if row1[name] != row2[name]))
+        return result
+
+    def __len__(self):
+        return len(self.rows)
+
+    def pending(self):
+        return [(row['run_index'], {name: row[name] for name in self.factor_names}) for row in self.rows if not row['done']]
+
+    def mark_done(self, *run_indices):
+        run_indices = set(run_indices)
+        for row in self.rows:
+            if row['run_index'] in run_indices:
+                row['done'] = True
+        if self.filename is not None:
+            self.write()
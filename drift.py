@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import argparse
+from analytics import DEFAULT_CONFIGURATION, config_key, read_results
+
+# Detection of the performance drifts across the result files of successive experiments (e.g. nightly runs).
+# Each run is summarized by its median time, for each configuration. A reference mean and standard deviation
+# are computed on the first runs of the configuration (the warmup), then a two-sided CUSUM accumulates the
+# deviations of the following runs. The state is kept in a JSON file, so each new file is processed in O(new rows).
+
+class ConfigurationState:
+    def __init__(self, nb_reference=0, mean=0.0, m2=0.0, cusum_high=0.0, cusum_low=0.0, nb_runs=0, last_alert=None):
+        self.nb_reference = nb_reference
+        self.mean = mean
+        self.m2 = m2 # sum of the squared deviations (Welford)
+        self.cusum_high = cusum_high
+        self.cusum_low = cusum_low
+        self.nb_runs = nb_runs
+        self.last_alert = last_alert
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @property
+    def std(self):
+        if self.nb_reference < 2:
+            return float('nan')
+        return math.sqrt(self.m2/(self.nb_reference-1))
+
+    def reset(self):
+        '''Start a new reference, after a change has been detected.'''
+        self.nb_reference = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+
+    def update(self, value, warmup, slack, threshold):
+        '''Add the summary of a new run, return 'slowdown', 'speedup' or None.'''
+        self.nb_runs += 1
+        if self.nb_reference < warmup:
+            self.nb_reference += 1
+            delta = value - self.mean
+            self.mean += delta/self.nb_reference
+            self.m2 += delta*(value - self.mean)
+            return None
+        std = self.std
+        if not std > 0:
+            std = abs(self.mean)*1e-3 or 1 # constant reference, avoid a division by zero
+        z = (value - self.mean)/std
+        self.cusum_high = max(0.0, self.cusum_high + z - slack)
+        self.cusum_low = max(0.0, self.cusum_low - z - slack)
+        if self.cusum_high > threshold:
+            return 'slowdown'
+        if self.cusum_low > threshold:
+            return 'speedup'
+        return None
+
+class DriftDetector:
+    def __init__(self, by=None, column='time', warmup=30, slack=0.5, threshold=8):
+        self.by = by or list(DEFAULT_CONFIGURATION)
+        self.column = column
+        self.warmup = warmup
+        self.slack = slack
+        self.threshold = threshold
+        self.configurations = {}
+        self.files = []
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            state = json.load(f)
+        detector = cls(state['by'], state['column'], state['warmup'], state['slack'], state['threshold'])
+        detector.configurations = {key: ConfigurationState(**conf) for key, conf in state['configurations'].items()}
+        detector.files = state['files']
+        return detector
+
+    def save(self, filename):
+        state = {
+            'by': self.by,
+            'column': self.column,
+            'warmup': self.warmup,
+            'slack': self.slack,
+            'threshold': self.threshold,
+            'files': self.files,
+            'configurations': {key: conf.to_dict() for key, conf in self.configurations.items()},
+        }
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_filename, filename)
+
+    def process(self, df, name=None):
+        '''Update the state with the runs of the given data, return the list of alerts.'''
+        missing = [col for col in self.by + ['run_index', self.column] if col not in df.columns]
+        if len(missing) > 0:
+            raise ValueError('Missing columns in %s: %s.' % (name, ', '.join(missing)))
+        runs = df.groupby(self.by + ['run_index'], sort=True)[self.column].median().reset_index()
+        alerts = []
+        for row in runs.itertuples(index=False):
+            values, run_index, value = row[:-2], int(row[-2]), float(row[-1])
+            key = config_key(values)
+            try:
+                conf = self.configurations[key]
+            except KeyError:
+                conf = ConfigurationState()
+                self.configurations[key] = conf
+            reference, std = conf.mean, conf.std
+            change = conf.update(value, self.warmup, self.slack, self.threshold)
+            if change is not None:
+                alert = {
+                    'configuration': dict(zip(self.by, values)),
+                    'change': change,
+                    'file': name,
+                    'run_index': run_index,
+                    'value': value,
+                    'reference_mean': reference,
+                    'reference_std': std,
+                }
+                conf.last_alert = {'file': name, 'run_index': run_index, 'change': change}
+                conf.reset()
+                alerts.append(alert)
+        if name is not None:
+            self.files.append(name)
+        return alerts
+
+def format_alert(alert):
+    configuration = ', '.join('%s=%s' % item for item in alert['configuration'].items())
+    return '%s: %s at run %d of %s (median %g, reference %g +/- %g)' % (configuration, alert['change'].upper(),
+            alert['run_index'], alert['file'], alert['value'], alert['reference_mean'], alert['reference_std'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Update the drift detection state with new result files and report the detected changes.')
+    parser.add_argument('state', type=str, help='JSON state file (created if it does not exist).')
+    parser.add_argument('filenames', type=str, nargs='+', help='New result files, in chronological order.')
+    parser.add_argument('--by', type=lambda s: s.split(','),
+            default=None, help='Comma-separated list of the columns defining a configuration (default: %s). Only used when creating the state.' % ','.join(DEFAULT_CONFIGURATION))
+    parser.add_argument('--column', type=str,
+            default='time', help='Monitored column. Only used when creating the state.')
+    parser.add_argument('--warmup', type=int,
+            default=30, help='Number of runs used to compute the reference of each configuration. Only used when creating the state.')
+    parser.add_argument('--slack', type=float,
+            default=0.5, help='Allowed deviation (in standard deviations) before accumulating. Only used when creating the state.')
+    parser.add_argument('--threshold', type=float,
+            default=8, help='CUSUM value (in standard deviations) above which a change is reported. Only used when creating the state.')
+    args = parser.parse_args()
+    if os.path.isfile(args.state):
+        detector = DriftDetector.load(args.state)
+    else:
+        detector = DriftDetector(args.by, args.column, args.warmup, args.slack, args.threshold)
+    nb_alerts = 0
+    for filename in args.filenames:
+        name = os.path.abspath(filename)
+        if name in detector.files:
+            sys.stderr.write('File %s already processed, skipping it.\n' % filename)
+            continue
+        df = read_results(filename, columns=detector.by + ['run_index', detector.column])
+        for alert in detector.process(df, name):
+            print(format_alert(alert))
+            nb_alerts += 1
+    detector.save(args.state)
+    if nb_alerts > 0:
+        sys.exit(1)
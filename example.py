@@ -1,4 +1,5 @@
 from experiment import *
+import os
 import sys
 
 app = Dgemm(lib='openblas',
@@ -15,6 +16,8 @@ wrappers= [
     CPU(),
     Time()
 ]
+if Barrier.environment_variable in os.environ: # synchronized start of the runs on all the nodes, see fabfile.run_exp
+    wrappers.append(Barrier.from_address(os.environ[Barrier.environment_variable]))
 
 if __name__ == '__main__':
     if len(sys.argv) != 2:
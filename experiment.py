@@ -6,23 +6,52 @@ import re
 import itertools
 import time
 import platform
-import psutil
 import csv
 import zipfile
 import random
 import collections
-import pandas
-import cpuinfo # https://github.com/workhorsy/py-cpuinfo
-import git     # https://github.com/gitpython-developers/GitPython
+import contextlib
+import cProfile
+import tracemalloc
+import json
+import glob
+import shutil
+import threading
 from multiprocessing import cpu_count
 
-from utils import run_command, compile_generic
+from utils import run_command, start_command, wait_command, compile_generic, ResidentProcess, lazy_import, logger
+# The heavy modules are only imported when needed, e.g. --help does not import pandas.
+pandas  = lazy_import('pandas')
+numpy   = lazy_import('numpy')
+psutil  = lazy_import('psutil')
+cpuinfo = lazy_import('cpuinfo') # https://github.com/workhorsy/py-cpuinfo
+git     = lazy_import('git')     # https://github.com/gitpython-developers/GitPython
+from calltrace import read_trace
+
+def write_csv(filename, data):
+    tmp_filename = filename + '.tmp'
+    data.to_csv(tmp_filename, index=False)
+    os.replace(tmp_filename, filename) # atomic, the file is never left half-written
+
+def append_csv(filename, data):
+    '''Append the rows to the CSV file, which is only rewritten when the rows have new columns.'''
+    if not os.path.isfile(filename):
+        write_csv(filename, data)
+        return
+    with open(filename) as f:
+        columns = next(csv.reader(f), [])
+    if all(col in columns for col in data.columns):
+        with open(filename, 'a') as f:
+            data.reindex(columns=columns).to_csv(f, header=False, index=False)
+    else:
+        write_csv(filename, pandas.concat([pandas.read_csv(filename), data], sort=False))
 
 def mean(l):
     return sum(l)/len(l)
 
 class Program(metaclass=abc.ABCMeta):
     key = ['run_index']
+    resident = False
     def __init__(self):
         self.tmp_dir = tempfile.TemporaryDirectory()
         self.tmp_filename = os.path.join(self.tmp_dir.name, 'file')
@@ -40,6 +69,18 @@ class Program(metaclass=abc.ABCMeta):
     def enabled(self, value):
         assert value in (True, False)
 
+    @property
+    def state(self):
+        '''The part of the configuration whose changes require a teardown and a new setup.'''
+        return self.enabled
+
+    @state.setter
+    def state(self, value):
+        self.enabled = value
+
+    def random_state(self):
+        return random.choice([False, True])
+
     def __del__(self):
         self.tmp_dir.cleanup()
 
@@ -63,10 +104,21 @@ class Program(metaclass=abc.ABCMeta):
     def name(self):
         return self.__class__.__name__
 
+    @property
+    def label(self):
+        return str(self)
+
     def fetch_data(self):
         self.__fetch_data__()
         self.run_index += 1
 
+    def seek(self, run_index):
+        self.run_index = run_index
+
+    def set_factor(self, name, value):
+        '''Set the given factor of the experiment design, return True if this program handles it.'''
+        return False
+
     @abc.abstractmethod
     def __fetch_data__(self):
         pass
@@ -138,6 +190,10 @@ class Program(metaclass=abc.ABCMeta):
     def post_process(self):
         pass
 
+    def clear_data(self):
+        '''Forget the data of the previous runs (e.g. once it has been written).'''
+        self.__dict__.pop('__data__', None)
+
     @property
     def data(self):
         try:
@@ -151,6 +207,18 @@ class Program(metaclass=abc.ABCMeta):
     def teardown(self):
         pass
 
+    def pre_run(self):
+        '''Called just before each run (unlike setup, even when the state is kept between the runs).'''
+        pass
+
+    def post_run(self):
+        '''Called just after each run.'''
+        pass
+
+    def close(self):
+        '''Release the resources kept between the runs, called after the last run.'''
+        pass
+
 class ComposeWrapper(Program):
     def __init__(self, *programs):
         self.programs = programs
@@ -175,6 +243,15 @@ class ComposeWrapper(Program):
         for prog in self.programs:
             prog.fetch_data()
 
+    def seek(self, run_index):
+        super().seek(run_index)
+        for prog in self.programs:
+            prog.seek(run_index)
+
+    def set_factor(self, name, value):
+        handled = [prog.set_factor(name, value) for prog in self.programs]
+        return any(handled)
+
     @property
     def header(self):
         header = []
@@ -200,6 +277,10 @@ class ComposeWrapper(Program):
         for prog in self.programs:
             prog.post_process()
 
+    def clear_data(self):
+        for prog in self.programs:
+            prog.clear_data()
+
     def setup(self):
         for prog in self.programs:
             prog.setup()
@@ -208,6 +289,18 @@ class ComposeWrapper(Program):
         for prog in self.programs:
             prog.teardown()
 
+    def pre_run(self):
+        for prog in self.programs:
+            prog.pre_run()
+
+    def post_run(self):
+        for prog in self.programs:
+            prog.post_run()
+
+    def close(self):
+        for prog in self.programs:
+            prog.close()
+
 class DisableWrapper(Program):
     def __init__(self, program):
         self.program = program
@@ -235,10 +328,24 @@ class DisableWrapper(Program):
             self.program.__append_data__({})
             self.program.run_index += 1
 
+    def seek(self, run_index):
+        super().seek(run_index)
+        self.program.seek(run_index)
+
+    def set_factor(self, name, value):
+        if name == self.name:
+            self.enabled = value
+            return True
+        return self.program.set_factor(name, value)
+
     @property
     def name(self):
         return self.program.name
 
+    @property
+    def label(self):
+        return self.program.label
+
     @property
     def header(self):
         return self.program.header
@@ -258,6 +365,9 @@ class DisableWrapper(Program):
     def post_process(self):
         self.program.post_process()
 
+    def clear_data(self):
+        self.program.clear_data()
+
     @property
     def enabled(self):
         return self.program.enabled
@@ -275,10 +385,52 @@ class DisableWrapper(Program):
         if self.enabled:
             self.program.teardown()
 
+    def pre_run(self):
+        if self.enabled:
+            self.program.pre_run()
+
+    def post_run(self):
+        if self.enabled:
+            self.program.post_run()
+
+    def close(self):
+        self.program.close()
+
 class OnlyOneWrapper(ComposeWrapper):
-    def __init__(self, *programs):
+    def __init__(self, *programs, name=None):
         programs = [DisableWrapper(prog) for prog in programs]
         super().__init__(*programs)
+        self.__name__ = name
+
+    @property
+    def name(self):
+        return self.__name__ or self.__class__.__name__
+
+    def set_factor(self, name, value):
+        if name != self.name:
+            return super().set_factor(name, value)
+        self.state = value
+        return True
+
+    @property
+    def state(self):
+        try:
+            return self.current_prog.label
+        except AttributeError: # no program has been chosen yet
+            return None
+
+    @state.setter
+    def state(self, value):
+        candidates = [prog for prog in self.programs if prog.label == value]
+        if len(candidates) != 1:
+            raise ValueError('No unique program %s in %s, got %d candidates.' % (value, self, len(candidates)))
+        for prog in self.programs:
+            prog.enabled = False
+        self.current_prog = candidates[0]
+        self.current_prog.enabled = True
+
+    def random_state(self):
+        return random.choice(self.programs).label
 
     @property
     def enabled(self):
@@ -343,6 +495,121 @@ class Intercoolr(Program):
         energy = self.get_energy()
         self.__append_data__({'energy': energy})
 
+class RAPLError(Exception):
+    pass
+
+class RAPLDomain:
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        with open(os.path.join(path, 'max_energy_range_uj')) as f:
+            self.max_range = int(f.read())
+
+    def read(self):
+        with open(os.path.join(self.path, 'energy_uj')) as f:
+            return int(f.read())
+
+class RAPL(Program):
+    '''
+    Energy consumption of the package and DRAM domains, read from the powercap interface of the kernel (no build step).
+    The counters are read before and after each run and, if sampling_period is not 0, by a thread during the run.
+    If the application gives the time windows of its calls (see Dgemm.call_windows), the energy of each call is
+    computed by interpolation of the counters, otherwise the energy of the whole run is given.
+    '''
+    def __init__(self, application=None, sampling_period=0.01, root='/sys/class/powercap'):
+        super().__init__()
+        self.domains = self.find_domains(root)
+        if len(self.domains) == 0:
+            raise RAPLError('No RAPL package or DRAM domain in %s.' % root)
+        self.application = application
+        self.sampling_period = sampling_period
+        names = [domain.name for domain in self.domains]
+        self.header = ['energy_%s' % name for name in names] + ['power_%s' % name for name in names]
+        if application is not None:
+            self.header = ['call_index'] + self.header
+            self.key = ['run_index', 'call_index']
+        self.samples = []
+        self.sampler = None
+
+    @staticmethod
+    def find_domains(root):
+        domains = []
+        for path in sorted(glob.glob(os.path.join(root, 'intel-rapl:*'))):
+            package = os.path.basename(path).split(':')[1] # intel-rapl:<package>[:<subdomain>]
+            with open(os.path.join(path, 'name')) as f:
+                name = f.read().strip()
+            if name.startswith('package'):
+                domains.append(RAPLDomain(path, 'package_%s' % package))
+            elif name == 'dram':
+                domains.append(RAPLDomain(path, 'dram_%s' % package))
+        return domains
+
+    def __command_line__(self):
+        return []
+
+    def __environment_variables__(self):
+        return {}
+
+    def sample(self):
+        self.samples.append((time.monotonic(), [domain.read() for domain in self.domains]))
+
+    def sampling_loop(self):
+        while not self.stop_sampling.wait(self.sampling_period):
+            self.sample()
+
+    def pre_run(self):
+        self.samples = []
+        self.sample()
+        if self.sampling_period > 0:
+            self.stop_sampling = threading.Event()
+            self.sampler = threading.Thread(target=self.sampling_loop, daemon=True)
+            self.sampler.start()
+
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.stop_sampling.set()
+            self.sampler.join()
+            self.sampler = None
+
+    def post_run(self):
+        self.stop_sampler()
+        self.sample()
+
+    def close(self):
+        self.stop_sampler()
+
+    def cumulative_energy(self):
+        '''The dates of the samples and the energy (in joules) consumed by each domain since the first sample.'''
+        dates = [date for date, _ in self.samples]
+        energies = []
+        for i, domain in enumerate(self.domains):
+            total = 0
+            cumulative = [0]
+            for (_, old), (_, new) in zip(self.samples, self.samples[1:]):
+                delta = new[i] - old[i]
+                if delta < 0: # the counter has wrapped around
+                    delta += domain.max_range
+                total += delta
+                cumulative.append(total*1e-6)
+            energies.append(cumulative)
+        return dates, energies
+
+    def __fetch_data__(self):
+        dates, energies = self.cumulative_energy()
+        if self.application is None:
+            windows = [(dates[0], dates[-1])]
+        else:
+            windows = self.application.call_windows()
+        for call_index, (start, end) in enumerate(windows):
+            entry = {}
+            if self.application is not None:
+                entry['call_index'] = call_index
+            for domain, cumulative in zip(self.domains, energies):
+                energy = numpy.interp(end, dates, cumulative) - numpy.interp(start, dates, cumulative)
+                entry['energy_%s' % domain.name] = energy
+                entry['power_%s' % domain.name] = energy/(end-start) if end > start else float('nan')
+            self.__append_data__(entry)
+
 class CommandLine(PurePythonProgram):
     header = ['git_hash', 'command_line']
     def __init__(self):
@@ -371,6 +638,25 @@ class Platform(PurePythonProgram):
     def __fetch_data__(self):
         self.__append_data__({'hostname': self.hostname, 'os': self.os})
 
+class TransitionCost(PurePythonProgram):
+    '''Time spent in the setup and teardown of the programs for each run, filled by the ExpEngine.'''
+    header = ['transition_time', 'nb_transitions']
+    def __init__(self):
+        super().__init__()
+        self.reset()
+
+    def reset(self):
+        self.transition_time = 0
+        self.nb_transitions = 0
+
+    def record(self, duration, nb_transitions):
+        self.transition_time += duration
+        self.nb_transitions += nb_transitions
+
+    def __fetch_data__(self):
+        self.__append_data__({'transition_time': self.transition_time, 'nb_transitions': self.nb_transitions})
+        self.reset()
+
 class CPU(PurePythonProgram):
     header = ['cpu_model',
               'nb_cores',
@@ -393,6 +679,9 @@ class CPU(PurePythonProgram):
                             })
 
 
+class QuiescenceError(Exception):
+    pass
+
 class Temperature(PurePythonProgram):
     header = ['average_temperature']
 
@@ -401,6 +690,416 @@ class Temperature(PurePythonProgram):
         assert len(temperatures) == cpu_count() or len(temperatures) == cpu_count()/2 # case of hyperthreading
         self.__append_data__({'average_temperature': mean(temperatures)})
 
+class Quiescence(PurePythonProgram):
+    '''
+    Wait before each run until the machine has settled, to avoid inheriting the heat and the load of the previous run.
+    The conditions are checked every poll_period seconds and must hold nb_checks times in a row:
+     - the hottest core is below max_temperature (in °C, coretemp or k10temp sensors of the hwmon interface)
+     - the CPU load since the previous check (from /proc/stat, over all the CPUs) is below max_load
+     - the mean frequency of the CPUs (scaling_cur_freq) has changed by less than max_frequency_change (relative)
+    A condition whose threshold is None is not checked. After timeout seconds, the run is started anyway.
+    The waiting time, whether the timeout was reached, and the last state are recorded.
+    '''
+    header = ['quiescence_wait', 'quiescence_timeout', 'pre_temperature', 'pre_load', 'pre_frequency']
+
+    def __init__(self, max_temperature=None, max_load=0.05, max_frequency_change=None, timeout=60, poll_period=0.2, nb_checks=2,
+                 hwmon_root='/sys/class/hwmon', cpu_root='/sys/devices/system/cpu', proc_stat='/proc/stat'):
+        super().__init__()
+        self.max_temperature = max_temperature
+        self.max_load = max_load
+        self.max_frequency_change = max_frequency_change
+        self.timeout = timeout
+        self.poll_period = poll_period
+        self.nb_checks = nb_checks
+        self.proc_stat = proc_stat
+        self.temperature_files = self.find_temperature_files(hwmon_root)
+        self.frequency_files = sorted(glob.glob(os.path.join(cpu_root, 'cpu[0-9]*', 'cpufreq', 'scaling_cur_freq')))
+        if max_temperature is not None and len(self.temperature_files) == 0:
+            raise QuiescenceError('No core temperature sensor in %s.' % hwmon_root)
+        if max_frequency_change is not None and len(self.frequency_files) == 0:
+            raise QuiescenceError('No CPU frequency in %s.' % cpu_root)
+
+    @staticmethod
+    def find_temperature_files(root):
+        files = []
+        for path in sorted(glob.glob(os.path.join(root, 'hwmon*'))):
+            try:
+                with open(os.path.join(path, 'name')) as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            if name not in ('coretemp', 'k10temp'):
+                continue
+            for input_file in sorted(glob.glob(os.path.join(path, 'temp*_input'))):
+                if name == 'coretemp': # the package sensor is not a core
+                    try:
+                        with open(input_file.replace('_input', '_label')) as f:
+                            if not f.read().startswith('Core'):
+                                continue
+                    except OSError:
+                        continue
+                files.append(input_file)
+        return files
+
+    @staticmethod
+    def read_int(filename):
+        with open(filename) as f:
+            return int(f.read())
+
+    def read_temperature(self):
+        if len(self.temperature_files) == 0:
+            return float('nan')
+        return max(self.read_int(filename) for filename in self.temperature_files) * 1e-3
+
+    def read_frequency(self):
+        if len(self.frequency_files) == 0:
+            return float('nan')
+        return mean([self.read_int(filename) for filename in self.frequency_files]) * 1e3
+
+    def read_cpu_times(self):
+        '''The busy and total times of all the CPUs since the boot.'''
+        with open(self.proc_stat) as f:
+            times = [int(v) for v in f.readline().split()[1:]]
+        idle = times[3] + (times[4] if len(times) > 4 else 0) # idle and iowait
+        return sum(times) - idle, sum(times)
+
+    @staticmethod
+    def load(old_times, new_times):
+        total = new_times[1] - old_times[1]
+        if total <= 0:
+            return 0.0
+        return (new_times[0] - old_times[0]) / total
+
+    def is_quiet(self, temperature, load, frequency, previous_frequency):
+        if self.max_temperature is not None and not temperature <= self.max_temperature:
+            return False
+        if self.max_load is not None and not load <= self.max_load:
+            return False
+        if self.max_frequency_change is not None and not abs(frequency-previous_frequency) <= self.max_frequency_change*previous_frequency:
+            return False
+        return True
+
+    def pre_run(self):
+        start = time.monotonic()
+        cpu_times = self.read_cpu_times()
+        frequency = self.read_frequency()
+        nb_quiet = 0
+        while True:
+            time.sleep(self.poll_period)
+            new_cpu_times = self.read_cpu_times()
+            temperature, load, previous_frequency = self.read_temperature(), self.load(cpu_times, new_cpu_times), frequency
+            frequency = self.read_frequency()
+            cpu_times = new_cpu_times
+            nb_quiet = nb_quiet + 1 if self.is_quiet(temperature, load, frequency, previous_frequency) else 0
+            timed_out = time.monotonic() - start >= self.timeout
+            if nb_quiet >= self.nb_checks or timed_out:
+                break
+        self.last_entry = {'quiescence_wait': time.monotonic() - start, 'quiescence_timeout': nb_quiet < self.nb_checks,
+                'pre_temperature': temperature, 'pre_load': load, 'pre_frequency': frequency}
+
+    def __fetch_data__(self):
+        self.__append_data__(dict(self.last_entry))
+
+class Barrier(PurePythonProgram):
+    '''
+    Start each run at the same instant on all the nodes of the experiment, with a coordinator (see barrier.py).
+    All the nodes must do the same number of runs. The time spent waiting for the other nodes, the estimated offset of
+    the local clock (relative to the clock of the coordinator), the round trip used for this estimation and the
+    lateness of the start relative to the agreed instant are recorded.
+    '''
+    header = ['barrier_wait', 'clock_offset', 'clock_delay', 'start_lateness']
+
+    environment_variable = 'VARIABILITY_BARRIER' # set by fabfile.run_exp for the synchronized experiments
+
+    def __init__(self, host, port=None, name=None):
+        import barrier # only needed for the synchronized experiments
+        super().__init__()
+        self.agent = barrier.Agent(host, port or barrier.DEFAULT_PORT, name)
+
+    @classmethod
+    def from_address(cls, address, name=None):
+        '''The barrier of the coordinator at HOST[:PORT].'''
+        host, _, port = address.partition(':')
+        return cls(host, int(port) if port else None, name)
+
+    def pre_run(self):
+        self.last_entry = self.agent.wait()
+
+    def __fetch_data__(self):
+        self.__append_data__(dict(self.last_entry))
+
+    def close(self):
+        self.agent.close()
+
+class InterferenceError(Exception):
+    pass
+
+class Interference(Program):
+    '''
+    Controlled background load during the runs, to measure how the variability responds to co-runners. A process of
+    interference.c is pinned to each of the given cores, started just before the run and stopped just after it:
+     - stream: memory bandwidth (triad on buffers much larger than the caches, of buffer_size bytes, 64 MiB by default)
+     - llc: random read-modify-write of the cache lines of a buffer of the size of the last level cache
+     - syscall: storm of cheap system calls
+     - timer: storm of very short sleeps (timer interrupts and context switches)
+     - busy: integer arithmetic, typically on the SMT siblings of the cores of the application
+     - none: no load, the reference
+    The load is active during the fraction intensity of each period of 10 ms. The mode and the intensity are randomly
+    chosen for each run among the given ones (factors 'interference' and 'interference_intensity'). The mean rate of
+    work of the load processes (in the unit of the mode, see interference.c) is recorded.
+    '''
+    header = ['interference', 'interference_intensity', 'interference_cores', 'interference_rate']
+    modes = ['none', 'stream', 'llc', 'syscall', 'timer', 'busy']
+
+    def __init__(self, modes, cores, intensities=(1.0,), buffer_size=None, cpu_root='/sys/devices/system/cpu'):
+        super().__init__()
+        for mode in modes:
+            if mode not in self.modes:
+                raise ValueError('Unknown interference mode %s, accepted values: %s.' % (mode, self.modes))
+        for intensity in intensities:
+            if not 0 < intensity <= 1:
+                raise ValueError('The intensity must be in ]0, 1], got %s.' % intensity)
+        self.modes = list(modes)
+        self.intensities = list(intensities)
+        self.cores = self.parse_cores(cores, cpu_root) if isinstance(cores, str) else list(cores)
+        if len(self.cores) == 0:
+            raise InterferenceError('No core given for the interference.')
+        self.buffer_sizes = {'stream': buffer_size, 'llc': self.llc_size(cpu_root)}
+        self.mode, self.intensity = self.modes[0], self.intensities[0]
+        self.processes = []
+        self.rate = float('nan')
+        self.executable = os.path.join(self.tmp_dir.name, 'interference')
+        run_command(['gcc', '-std=gnu99', '-O2', 'interference.c', '-o', self.executable])
+
+    @staticmethod
+    def parse_cpu_list(cpu_list):
+        '''The CPUs of a list like "0-3,8".'''
+        cpus = []
+        for part in cpu_list.strip().split(','):
+            first, _, last = part.partition('-')
+            cpus.extend(range(int(first), int(last or first)+1))
+        return cpus
+
+    @classmethod
+    def parse_cores(cls, spec, cpu_root='/sys/devices/system/cpu'):
+        '''Cores given as a list like "0-3,8", or as "siblings:<list>" for the SMT siblings of the cores of the list.'''
+        if not spec.startswith('siblings:'):
+            return cls.parse_cpu_list(spec)
+        siblings = []
+        for core in cls.parse_cpu_list(spec[len('siblings:'):]):
+            with open(os.path.join(cpu_root, 'cpu%d' % core, 'topology', 'thread_siblings_list')) as f:
+                others = [cpu for cpu in cls.parse_cpu_list(f.read()) if cpu != core]
+            if len(others) == 0:
+                raise InterferenceError('Core %d has no SMT sibling.' % core)
+            siblings.extend(others)
+        return siblings
+
+    @staticmethod
+    def llc_size(cpu_root='/sys/devices/system/cpu'):
+        '''Size in bytes of the last level cache of the first CPU, or None if unknown.'''
+        caches = []
+        for path in glob.glob(os.path.join(cpu_root, 'cpu0', 'cache', 'index*')):
+            try:
+                with open(os.path.join(path, 'level')) as f:
+                    level = int(f.read())
+                with open(os.path.join(path, 'size')) as f:
+                    size = f.read().strip()
+            except OSError:
+                continue
+            multiplier = {'K': 1 << 10, 'M': 1 << 20}.get(size[-1], 1)
+            caches.append((level, int(size.rstrip('KM')) * multiplier))
+        return max(caches)[1] if len(caches) > 0 else None
+
+    @property
+    def state(self):
+        return (self.mode, self.intensity)
+
+    @state.setter
+    def state(self, value):
+        self.mode, self.intensity = value
+
+    def random_state(self):
+        return (random.choice(self.modes), random.choice(self.intensities))
+
+    def set_factor(self, name, value):
+        if name == 'interference':
+            self.mode = value
+            return True
+        if name == 'interference_intensity':
+            self.intensity = value
+            return True
+        return False
+
+    def __command_line__(self):
+        return []
+
+    def __environment_variables__(self):
+        return {}
+
+    def pre_run(self):
+        self.rate = float('nan')
+        if self.mode == 'none':
+            return
+        buffer_size = self.buffer_sizes.get(self.mode)
+        for core in self.cores:
+            args = [self.executable, self.mode, str(core), str(self.intensity)]
+            if buffer_size is not None:
+                args.append(str(buffer_size))
+            self.processes.append(start_command(args))
+        for process in self.processes: # the buffers must be initialized before the run starts
+            if process.stdout.readline().strip() != b'ready':
+                self.stop()
+                raise InterferenceError('The interference process failed: %s' % process.stderr.read().decode())
+
+    def stop(self):
+        '''Stop the load processes, return their rates.'''
+        rates = []
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+            stdout, _ = process.communicate()
+            try:
+                rates.append(float(stdout))
+            except ValueError:
+                pass
+        self.processes = []
+        return rates
+
+    def post_run(self):
+        rates = self.stop()
+        if len(rates) > 0:
+            self.rate = mean(rates)
+
+    def close(self):
+        self.stop()
+
+    def __fetch_data__(self):
+        self.__append_data__({'interference': self.mode, 'interference_intensity': self.intensity,
+            'interference_cores': ','.join(str(core) for core in self.cores), 'interference_rate': self.rate})
+
+class NoiseProbeError(Exception):
+    pass
+
+class NoiseProbe(Program):
+    '''
+    Measure of the OS noise during the runs with fixed work quantum probes (see fwq.c), one per given core: a detour
+    is a quantum lasting more than threshold µs longer than the fastest one. The cores are given like for Interference,
+    or as 'idle' for the last core which is not used by the application (assuming it uses the first nb_threads cores).
+    For each run: the number of detours, the noise (fraction of the probe time lost in the detours), and the longest
+    detour (s). If the application gives the time windows of its calls (see Dgemm.call_windows), the number of detours
+    overlapping each call, the time lost by the probes during the call (s) and the longest of these detours are also
+    given.
+    '''
+    run_header = ['noise_detours', 'noise_fraction', 'noise_max', 'noise_dropped']
+    call_header = ['call_noise_detours', 'call_noise_time', 'call_noise_max']
+
+    def __init__(self, cores, application=None, quantum=10, threshold=1, cpu_root='/sys/devices/system/cpu'):
+        super().__init__()
+        self.application = application
+        if cores == 'idle':
+            allowed = sorted(os.sched_getaffinity(0))
+            nb_threads = getattr(application, 'nb_threads', 1)
+            if len(allowed) <= nb_threads:
+                raise NoiseProbeError('No idle core, the application uses %d threads on %d cores.' % (nb_threads, len(allowed)))
+            self.cores = [allowed[-1]]
+        else:
+            try:
+                self.cores = Interference.parse_cores(cores, cpu_root) if isinstance(cores, str) else list(cores)
+            except InterferenceError as e:
+                raise NoiseProbeError(str(e))
+        self.quantum = quantum
+        self.threshold = threshold
+        self.header = list(self.run_header)
+        if application is not None:
+            self.header = ['call_index'] + self.header + self.call_header
+            self.key = ['run_index', 'call_index']
+        self.processes = []
+        self.executable = os.path.join(self.tmp_dir.name, 'fwq')
+        run_command(['gcc', '-std=gnu99', '-O2', 'fwq.c', '-o', self.executable])
+
+    def output_file(self, core):
+        return os.path.join(self.tmp_dir.name, 'fwq_%d.bin' % core)
+
+    def __command_line__(self):
+        return []
+
+    def __environment_variables__(self):
+        return {}
+
+    def pre_run(self):
+        for core in self.cores:
+            if os.path.exists(self.output_file(core)): # a probe which fails to write its output must not leave the previous one
+                os.remove(self.output_file(core))
+            self.processes.append(start_command([self.executable, str(core), self.output_file(core), str(self.quantum), str(self.threshold)]))
+        for process in self.processes: # the calibration must be done before the run starts
+            if process.stdout.readline().strip() != b'ready':
+                self.stop()
+                raise NoiseProbeError('The noise probe failed: %s' % process.stderr.read().decode())
+
+    def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+            process.communicate()
+        self.processes = []
+
+    def post_run(self):
+        self.stop()
+
+    def close(self):
+        self.stop()
+
+    @staticmethod
+    def read_probe(filename):
+        '''The header of the output of a probe (see fwq.c) as a dict, and its detours as an array of (start, duration), in seconds.'''
+        try:
+            values = numpy.fromfile(filename, dtype=numpy.uint64)
+        except OSError as e:
+            raise NoiseProbeError('No output for the noise probe: %s' % e)
+        if len(values) < 6:
+            raise NoiseProbeError('Truncated output of the noise probe %s: %d bytes.' % (filename, 8*len(values)))
+        header = dict(zip(['nb_quanta', 'fastest', 'nb_detours', 'nb_dropped', 'start', 'end'], values[:6].tolist()))
+        if len(values) < 6 + 2*header['nb_detours']:
+            raise NoiseProbeError('Truncated output of the noise probe %s: %d detours announced, %d written.' % (filename,
+                header['nb_detours'], (len(values) - 6) // 2))
+        detours = values[6:6+2*header['nb_detours']].reshape(-1, 2).astype(numpy.float64) * 1e-9
+        return header, detours
+
+    def read_probes(self):
+        '''The headers of all the probes, and all their detours as an array of (start, duration, time lost), sorted by start.'''
+        headers, detours = [], []
+        for core in self.cores:
+            header, core_detours = self.read_probe(self.output_file(core))
+            headers.append(header)
+            lost = core_detours[:, 1] - header['fastest']*1e-9
+            detours.append(numpy.column_stack([core_detours, lost]))
+        detours = numpy.concatenate(detours) if len(detours) > 0 else numpy.zeros((0, 3))
+        return headers, detours[numpy.argsort(detours[:, 0])]
+
+    def __fetch_data__(self):
+        headers, detours = self.read_probes()
+        total_time = sum((header['end'] - header['start'])*1e-9 for header in headers)
+        entry = {
+            'noise_detours': len(detours),
+            'noise_fraction': detours[:, 2].sum() / total_time if total_time > 0 else float('nan'),
+            'noise_max': detours[:, 1].max() if len(detours) > 0 else 0.,
+            'noise_dropped': sum(header['nb_dropped'] for header in headers),
+        }
+        if self.application is None:
+            self.__append_data__(entry)
+            return
+        starts = detours[:, 0]
+        max_duration = detours[:, 1].max() if len(detours) > 0 else 0.
+        for call_index, (start, end) in enumerate(self.application.call_windows()):
+            # the detours are sorted by start, only those starting less than max_duration before the call may overlap it
+            candidates = detours[numpy.searchsorted(starts, start - max_duration):numpy.searchsorted(starts, end)]
+            overlapping = candidates[candidates[:, 0] + candidates[:, 1] > start]
+            overlap = numpy.minimum(overlapping[:, 0] + overlapping[:, 1], end) - numpy.maximum(overlapping[:, 0], start)
+            # the time lost by a detour is assumed evenly spread over its duration
+            lost = (overlap * overlapping[:, 2] / overlapping[:, 1]).sum() if len(overlapping) > 0 else 0.
+            self.__append_data__({**entry, 'call_index': call_index, 'call_noise_detours': len(overlapping),
+                'call_noise_time': lost, 'call_noise_max': overlapping[:, 1].max() if len(overlapping) > 0 else 0.})
+
 class Perf(Program):
     metrics = ['context-switches',
                'cpu-migrations',
@@ -450,6 +1149,65 @@ class Perf(Program):
         assert len(metrics_to_handle) == 0
         self.__append_data__(data)
 
+class PerfRecord(Program):
+    '''
+    Sampling profile of the runs having an outlier call, to know where the time of the slow calls went (BLAS kernel,
+    OpenMP barriers, page faults, operating system...). Each run is recorded with perf record at a low frequency.
+    After the run, the profile is only kept if the slowest call is more than outlier_threshold times slower than the
+    median call of the run: it is then summarized into the nb_symbols hottest symbols, with their shared object and
+    their share of the samples, and the fraction of the samples spent in the kernel. The raw profiles are deleted,
+    unless a profile_dir is given (they are then moved to <profile_dir>/perf_<run_index>.data).
+    '''
+    header = ['perf_outlier', 'outlier_ratio', 'kernel_fraction', 'hot_symbols']
+    report_line = re.compile(r'^\s*([\d.]+)%\s+(\S+)\s+\[(.)\]\s+(.+?)\s*$')
+
+    def __init__(self, application, frequency=99, outlier_threshold=1.5, nb_symbols=10, profile_dir=None):
+        super().__init__()
+        if not isinstance(application, TimedCallsProgram):
+            raise ValueError('PerfRecord requires an application giving the duration of its calls.')
+        self.application = application
+        self.frequency = frequency
+        self.outlier_threshold = outlier_threshold
+        self.nb_symbols = nb_symbols
+        self.profile_dir = profile_dir
+        self.profile_file = os.path.join(self.tmp_dir.name, 'perf.data')
+
+    def __command_line__(self):
+        return ['perf', 'record', '--quiet', '-F', str(self.frequency), '-o', self.profile_file]
+
+    def __environment_variables__(self):
+        return {'LC_TIME' : 'en'}
+
+    def read_profile(self):
+        '''The (percentage, shared object, kernel or user, symbol) of all the symbols of the profile.'''
+        output = run_command(['perf', 'report', '-i', self.profile_file, '--stdio', '--quiet', '--no-children',
+            '--sort', 'dso,symbol', '-g', 'none'])
+        symbols = []
+        for line in output.decode(errors='replace').splitlines():
+            match = self.report_line.match(line)
+            if match is not None:
+                symbols.append((float(match.group(1)), match.group(2), match.group(3), match.group(4)))
+        return sorted(symbols, key=lambda symbol: -symbol[0])
+
+    def post_run(self):
+        times = [row[0] for row in self.application.read_output()]
+        median = numpy.median(times)
+        ratio = max(times) / median if median > 0 else float('nan')
+        self.last_entry = {'perf_outlier': ratio > self.outlier_threshold, 'outlier_ratio': ratio,
+                'kernel_fraction': float('nan'), 'hot_symbols': ''}
+        if self.last_entry['perf_outlier']:
+            symbols = self.read_profile()
+            self.last_entry['kernel_fraction'] = sum(percent for percent, _, kind, _ in symbols if kind == 'k') / 100
+            self.last_entry['hot_symbols'] = '; '.join('%.1f%% %s:%s' % (percent, dso, symbol)
+                    for percent, dso, _, symbol in symbols[:self.nb_symbols])
+            if self.profile_dir is not None:
+                shutil.move(self.profile_file, os.path.join(self.profile_dir, 'perf_%d.data' % self.run_index))
+        if os.path.exists(self.profile_file):
+            os.remove(self.profile_file)
+
+    def __fetch_data__(self):
+        self.__append_data__(dict(self.last_entry))
+
 class Scheduler(NoDataProgram):
     def __environment_variables__(self):
         return {}
@@ -463,16 +1221,39 @@ def get_core_subset():
     return [group[0] for group in all_cores]
 
 class ThreadMapping(Program):
-    header = ['cpubind']
-    def __init__(self, nb_threads):
+    header = ['cpubind', 'memory_policy']
+    def __init__(self, nb_threads, memory_policies=('localalloc',)):
+        '''
+        The memory policy is one of the numactl policies (e.g. localalloc, interleave=all, membind=0, preferred=0),
+        randomly chosen among memory_policies for each run (unless it is fixed with a factor).
+        '''
         super().__init__()
         self.nb_cores = psutil.cpu_count()
         self.nb_threads = nb_threads
+        self.memory_policies = list(memory_policies)
+        self.memory_policy = self.memory_policies[0]
         if nb_threads not in (1, self.nb_cores):
             self.core_subset = get_core_subset()
             if len(self.core_subset) != self.nb_threads:
                 raise ValueError('wrong number of threads, accepted values: 1, %d, %d.' % (len(self.core_subset), self.nb_cores))
 
+    @property
+    def state(self):
+        return self.memory_policy
+
+    @state.setter
+    def state(self, value):
+        self.memory_policy = value
+
+    def random_state(self):
+        return random.choice(self.memory_policies)
+
+    def set_factor(self, name, value):
+        if name == 'memory_policy':
+            self.memory_policy = value
+            return True
+        return False
+
     def __environment_variables__(self):
         return {'OMP_PROc_BIND' : 'TRUE'}
 
@@ -483,10 +1264,50 @@ class ThreadMapping(Program):
             self.cpubind = ','.join(str(core) for core in self.core_subset)
         else:
             self.cpubind = str(random.randint(0, self.nb_cores-1))
-        return ['numactl', '--physcpubind=%s' % self.cpubind, '--localalloc']   # we have to choose between localalloc and membind, let's pick localalloc
-                                                                                # also cannot use --touch option here, not sure to understand why
+        return ['numactl', '--physcpubind=%s' % self.cpubind, '--%s' % self.memory_policy]   # cannot use --touch option here, not sure to understand why
+
+    def __fetch_data__(self):
+        self.__append_data__({'cpubind': self.cpubind, 'memory_policy': self.memory_policy})
+
+class MemoryAllocation(Program):
+    '''Allocation mode of the matrices in the harness (see common_matrix.h), randomly chosen among the given modes for each run.'''
+    header = ['allocation']
+    modes = ['malloc', 'aligned', 'thp', 'nothp', 'first_touch', 'hugetlb']
+
+    def __init__(self, modes=None):
+        super().__init__()
+        if modes is not None:
+            for mode in modes:
+                if mode not in self.modes:
+                    raise ValueError('Unknown allocation mode %s, accepted values: %s.' % (mode, self.modes))
+            self.modes = list(modes)
+        self.mode = self.modes[0]
+
+    @property
+    def state(self):
+        return self.mode
+
+    @state.setter
+    def state(self, value):
+        self.mode = value
+
+    def random_state(self):
+        return random.choice(self.modes)
+
+    def set_factor(self, name, value):
+        if name == 'allocation':
+            self.mode = value
+            return True
+        return False
+
+    def __command_line__(self):
+        return []
+
+    def __environment_variables__(self):
+        return {'DGEMM_ALLOCATION': self.mode}
+
     def __fetch_data__(self):
-        self.__append_data__({'cpubind': self.cpubind})
+        self.__append_data__({'allocation': self.mode})
 
 class LikwidError(Exception):
     pass
@@ -507,16 +1328,45 @@ class Likwid(Program):
         self.tmp_output = os.path.join(self.tmp_dir.name, 'output.csv')
         self.check_group()
 
+    groups_cache = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'variability_study', 'likwid_groups.json')
+
+    @classmethod
+    def groups_cache_key(cls):
+        '''The cached groups are only valid for the same machine and the same likwid installation.'''
+        path = shutil.which('likwid-perfctr')
+        if path is None:
+            return None
+        return [platform.node(), path, os.stat(path).st_mtime]
+
     @classmethod
     def get_available_groups(cls):
+        if cls.available_groups is None:
+            key = cls.groups_cache_key()
+            try:
+                with open(cls.groups_cache) as f:
+                    cache = json.load(f)
+                if key is not None and cache['key'] == key:
+                    cls.available_groups = set(cache['groups'])
+            except (OSError, ValueError, KeyError):
+                pass
         if cls.available_groups is None:
             stdout = run_command(['likwid-perfctr', '-a'])
             stdout = stdout.decode('ascii')
             lines = stdout.split('\n')[2:]
             lines = [line.strip().split() for line in lines]
             cls.available_groups = set([line[0] for line in lines if len(line) > 0])
+            try:
+                os.makedirs(os.path.dirname(cls.groups_cache), exist_ok=True)
+                with open(cls.groups_cache, 'w') as f:
+                    json.dump({'key': key, 'groups': sorted(cls.available_groups)}, f)
+            except OSError: # the cache is only an optimization
+                pass
         return cls.available_groups
 
+    @property
+    def label(self):
+        return self.group
+
     def check_group(self):
         groups = self.get_available_groups()
         if self.group not in groups:
@@ -611,7 +1461,7 @@ def get_likwid_instance(nb_threads, groups):
     if len(groups) == 1:
         return Likwid(group=groups[0], nb_threads=nb_threads)
     else:
-        return OnlyOneWrapper(*[Likwid(group=group, nb_threads=nb_threads) for group in groups])
+        return OnlyOneWrapper(*[Likwid(group=group, nb_threads=nb_threads) for group in groups], name='likwid_group')
 
 class CPUPowerError(Exception):
     pass
@@ -740,41 +1590,402 @@ class Hyperthreading(NoDataProgram):
     def __environment_variables__(self):
         return {}
 
-class Dgemm(Program):
-    header = ['call_index', 'size', 'nb_calls', 'time']
-    key = ['run_index', 'call_index']
+class HarnessError(Exception):
+    pass
 
-    def __init__(self, lib, size, nb_calls, nb_threads, block_size, likwid=None):
+class TimedCallsProgram(Program):
+    '''An application writing the duration and the start date of each of its calls in its output file.'''
+    def read_output(self):
+        '''The duration and the start date of each call of the last run.'''
+        with open(self.tmp_filename, 'r') as f:
+            return [[float(v) for v in line.split()] for line in f]
+
+    def call_windows(self):
+        '''The start and end dates of each call of the last run (CLOCK_MONOTONIC, like time.monotonic).'''
+        return [(start, start+duration) for duration, start in self.read_output()]
+
+# Shared libraries of the harnesses built with lib='dlopen', searched like with dlopen(3) when they are not absolute paths.
+BLAS_LIBRARIES = {
+    'openblas': 'libopenblas.so.0',
+    'mkl': 'libmkl_rt.so',
+    'mkl2': '/opt/intel/mkl/lib/intel64/libmkl_rt.so',
+    'atlas': '/usr/lib/atlas-base/libcblas.so.3',
+    'netlib': 'libblas.so.3',
+}
+
+class Dgemm(TimedCallsProgram):
+    header = ['call_index', 'size', 'nb_calls', 'nb_threads', 'lib', 'block_size', 'resident', 'cold_start', 'server_start', 'time']
+    key = ['run_index', 'call_index']
+    tuning_table = None # default: the table of autotune.py
+
+    def __init__(self, lib, size, nb_calls, nb_threads, block_size, likwid=None, resident=False, cold_start=False, dlopen=None):
+        '''
+        If resident is True, multi_dgemm is started once in server mode and driven through a pipe, the BLAS library,
+        the thread pool and the matrices are then reused between runs. With cold_start, the server is restarted
+        for every run, to compare both regimes with the same harness.
+        With dlopen (a list of names of BLAS_LIBRARIES, or a dictionary {name: shared library}), a single binary is
+        built, which loads the library at runtime. Changing the library is then free, so it is randomly chosen among
+        these ones for each run (unless it is a factor of the design), and the path and version of the loaded library
+        are recorded.
+
+        If block_size is None, the naive version uses the variant (block size, loop order and collapse) of the tuning
+        table of autotune.py for the current size and number of threads.
+        '''
         super().__init__()
+        if resident and likwid is not None:
+            raise HarnessError('The resident mode is not supported with Likwid.')
+        if dlopen is not None:
+            if not isinstance(dlopen, dict):
+                unknown = [name for name in dlopen if name not in BLAS_LIBRARIES]
+                if len(unknown) > 0:
+                    raise HarnessError('Unknown libraries %s, the possible choices are %s.' % (unknown, list(BLAS_LIBRARIES)))
+                dlopen = {name: BLAS_LIBRARIES[name] for name in dlopen}
+            if lib not in dlopen:
+                raise HarnessError('Library %s is not one of the loaded libraries %s.' % (lib, list(dlopen)))
+            self.header = self.header + ['blas_path', 'blas_version']
+            self.blas_info_filename = os.path.join(self.tmp_dir.name, 'blas_info')
+        self.libraries = dlopen
         self.lib = lib
         self.size = size
         self.nb_calls = nb_calls
         self.nb_threads = nb_threads
+        self.tuned = block_size is None
+        if self.tuned:
+            import autotune # only needed for the tuned naive version
+            self.header = self.header + ['loop_order', 'collapse']
+            self.tuning = autotune.TuningTable(self.tuning_table or autotune.DEFAULT_TABLE)
+            self.block_size, self.loop_order, self.collapse = self.tuned_variant()
+        else:
+            self.block_size, self.loop_order, self.collapse = block_size, 'kij', False # the defaults of compile_generic
+        self.likwid = likwid
+        self.resident = resident
+        self.cold_start = cold_start
+        self.server = None
+        self.server_start = False
+        self.compile()
+
+    def compile(self):
+        self.stop_server() # the binary is replaced
+        compile_generic('multi_dgemm', self.lib if self.libraries is None else 'dlopen', self.block_size, self.likwid,
+                loop_order=self.loop_order, collapse=self.collapse)
+
+    def tuned_variant(self):
+        import autotune
+        variant = self.tuning.get(self.size, self.nb_threads)
+        if variant is None:
+            logger.warning('No tuned variant for size %d and %d threads in %s, using %s.' % (self.size, self.nb_threads, self.tuning.filename, autotune.DEFAULT_VARIANT))
+            variant = autotune.DEFAULT_VARIANT
+        return variant
+
+    def update_variant(self):
+        '''With a tuned naive version, recompile if the size or the number of threads has a different tuned variant.'''
+        variant = self.tuned_variant()
+        if variant != (self.block_size, self.loop_order, self.collapse):
+            self.block_size, self.loop_order, self.collapse = variant
+            if self.lib == 'naive':
+                self.compile()
+
+    @property
+    def state(self):
+        if self.libraries is None:
+            return self.enabled
+        return self.lib
+
+    @state.setter
+    def state(self, value):
+        if self.libraries is None:
+            self.enabled = value
+        else:
+            self.lib = value
+
+    def random_state(self):
+        if self.libraries is None:
+            return super().random_state()
+        return random.choice(list(self.libraries))
+
+    def set_factor(self, name, value):
+        if name in ('size', 'nb_calls', 'nb_threads', 'cold_start'):
+            setattr(self, name, value)
+            if self.tuned and name in ('size', 'nb_threads'):
+                self.update_variant()
+            return True
+        if name == 'lib' and self.libraries is not None:
+            if value not in self.libraries:
+                raise HarnessError('Library %s is not one of the loaded libraries %s.' % (value, list(self.libraries)))
+            self.lib = value # loaded at runtime, no new binary
+            return True
+        if name in ('lib', 'block_size'):
+            if getattr(self, name) != value: # a new binary is needed
+                setattr(self, name, value)
+                self.compile()
+            return True
+        return False
+
+    def start_server(self, prefix):
+        '''Start the server (with the given command line prefix) if needed, i.e. if it is not running with the same command and environment.'''
+        command = [*prefix, './multi_dgemm', '--server']
+        environment = dict(os.environ)
+        environment.pop('OMP_NUM_THREADS', None) # handled by the server itself
+        if self.server is not None and (self.cold_start or (command, environment) != self.server_config):
+            self.stop_server()
+        self.server_start = self.server is None
+        if self.server_start:
+            self.server = ResidentProcess(command)
+            self.server_config = (command, environment)
+
+    def submit(self):
+        answer = self.server.request('%d %d %d %s' % (self.nb_calls, self.size, self.nb_threads, self.tmp_filename))
+        if answer != 'done':
+            raise HarnessError('Error from multi_dgemm server: %s.' % answer)
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def close(self):
+        self.stop_server()
+
+    def __environment_variables__(self):
+        env = {'OMP_NUM_THREADS' : str(self.nb_threads)}
+        if self.libraries is not None:
+            env['BLAS_LIBRARY'] = self.libraries[self.lib]
+            env['BLAS_INFO_FILE'] = self.blas_info_filename
+        return env
+
+    def __command_line__(self):
+        return ['./multi_dgemm', str(self.nb_calls), str(self.size), self.tmp_filename]
+
+    def read_blas_info(self):
+        '''The path and the version of the library loaded by the harness (written when the library is loaded).'''
+        with open(self.blas_info_filename) as f:
+            path, version = [line.strip() for line in f.readlines()[:2]]
+        return {'blas_path': path, 'blas_version': version}
+
+    def __fetch_data__(self):
+        times = [row[0] for row in self.read_output()]
+        extra = {} if self.libraries is None else self.read_blas_info()
+        if self.tuned:
+            extra.update({'loop_order': self.loop_order, 'collapse': self.collapse})
+        for call_index, t in enumerate(times):
+            self.__append_data__({'call_index': call_index, 'size': self.size, 'nb_calls': self.nb_calls,
+                'nb_threads': self.nb_threads, 'lib': self.lib, 'block_size': self.block_size,
+                'resident': self.resident, 'cold_start': self.cold_start, 'server_start': self.server_start, 'time': t, **extra})
+
+class BlasKernel(TimedCallsProgram):
+    header = ['call_index', 'kernel', 'm', 'n', 'k', 'lead_A', 'lead_B', 'lead_C', 'trans_A', 'trans_B', 'nb_calls', 'nb_threads', 'lib',
+              'flops', 'bytes', 'time', 'gflops', 'bandwidth']
+    key = ['run_index', 'call_index']
+    kernels = ['dgemm', 'sgemm', 'dtrsm', 'dgemv', 'daxpy', 'dsyrk']
+    shape_factors = ['m', 'n', 'k', 'lead_A', 'lead_B', 'lead_C', 'trans_A', 'trans_B']
+
+    def __init__(self, kernel, lib, nb_calls, nb_threads, m=0, n=0, k=0, lead_A=None, lead_B=None, lead_C=None,
+                 trans_A=False, trans_B=False, likwid=None):
+        '''
+        Repeated calls to the given kernel with multi_blas (the conventions of each kernel are described in multi_blas.c).
+        The leading dimensions default to the smallest valid ones. The number of floating-point operations and the
+        number of bytes moved (each element of the operands read once and each element of the result written once)
+        are recorded for each call, with the corresponding rates in GFlop/s (gflops) and GB/s (bandwidth).
+        '''
+        super().__init__()
+        if kernel not in self.kernels:
+            raise HarnessError('Unknown kernel %s, the possible choices are %s.' % (kernel, self.kernels))
+        if lib == 'naive':
+            raise HarnessError('The BLAS kernels require a BLAS library.')
+        self.kernel = kernel
+        self.lib = lib
+        self.nb_calls = nb_calls
+        self.nb_threads = nb_threads
+        self.m, self.n, self.k = m, n, k
+        self.lead_A, self.lead_B, self.lead_C = lead_A, lead_B, lead_C
+        self.trans_A, self.trans_B = trans_A, trans_B
         self.likwid = likwid
-        compile_generic('multi_dgemm', lib, block_size, likwid)
+        self.leading_dimensions() # check the shape
+        self.compile()
+
+    def compile(self):
+        compile_generic('multi_blas', self.lib, likwid=self.likwid)
+
+    def set_factor(self, name, value):
+        if name in ('kernel', 'nb_calls', 'nb_threads', *self.shape_factors):
+            setattr(self, name, value)
+            return True
+        if name == 'lib':
+            if self.lib != value:
+                self.lib = value
+                self.compile()
+            return True
+        return False
+
+    def shapes(self):
+        '''Number of rows and columns of the buffers A, B and C, None when unused (same as get_shapes in multi_blas.c).'''
+        m, n, k = self.m, self.n, self.k
+        if self.kernel in ('dgemm', 'sgemm'):
+            return [(k, m) if self.trans_A else (m, k), (n, k) if self.trans_B else (k, n), (m, n)]
+        if self.kernel == 'dtrsm':
+            return [(n, n), (m, n), None]
+        if self.kernel == 'dgemv':
+            return [(m, n), (m if self.trans_A else n, 1), (n if self.trans_A else m, 1)]
+        if self.kernel == 'daxpy':
+            return [None, (n, 1), (n, 1)]
+        assert self.kernel == 'dsyrk'
+        return [(k, n) if self.trans_A else (n, k), None, (n, n)]
+
+    def leading_dimensions(self):
+        result = []
+        for name, shape in zip(['lead_A', 'lead_B', 'lead_C'], self.shapes()):
+            lead = getattr(self, name)
+            if shape is None:
+                result.append(0)
+                continue
+            rows, cols = shape
+            if rows <= 0 or cols <= 0:
+                raise HarnessError('Wrong shape for %s: m=%d, n=%d, k=%d.' % (self.kernel, self.m, self.n, self.k))
+            if lead is None:
+                lead = rows
+            elif lead < rows:
+                raise HarnessError('The leading dimension %s of %s is too small (%d < %d).' % (name, self.kernel, lead, rows))
+            result.append(lead)
+        return result
+
+    def cost(self):
+        '''Number of floating-point operations and of bytes moved by a call.'''
+        m, n, k = self.m, self.n, self.k
+        element_size = 4 if self.kernel == 'sgemm' else 8
+        if self.kernel in ('dgemm', 'sgemm'):
+            flops, elements = 2*m*n*k, m*k + k*n + 2*m*n
+        elif self.kernel == 'dtrsm':
+            flops, elements = m*n*n, n*(n+1)//2 + 2*m*n
+        elif self.kernel == 'dgemv':
+            flops, elements = 2*m*n, m*n + m + n + (n if self.trans_A else m) # y is read and written
+        elif self.kernel == 'daxpy':
+            flops, elements = 2*n, 3*n
+        else:
+            flops, elements = n*(n+1)*k, n*k + n*(n+1)
+        return flops, elements*element_size
 
     def __environment_variables__(self):
         return {'OMP_NUM_THREADS' : str(self.nb_threads)}
 
     def __command_line__(self):
-        return ['./multi_dgemm', str(self.nb_calls), str(self.size), self.tmp_filename]
+        leads = self.leading_dimensions()
+        return ['./multi_blas', self.kernel, str(self.nb_calls), str(self.m), str(self.n), str(self.k), *(str(lead) for lead in leads),
+                'T' if self.trans_A else 'N', 'T' if self.trans_B else 'N', self.tmp_filename]
+
+    def __fetch_data__(self):
+        lead_A, lead_B, lead_C = self.leading_dimensions()
+        flops, nb_bytes = self.cost()
+        for call_index, (t, _) in enumerate(self.read_output()):
+            self.__append_data__({'call_index': call_index, 'kernel': self.kernel, 'm': self.m, 'n': self.n, 'k': self.k,
+                'lead_A': lead_A, 'lead_B': lead_B, 'lead_C': lead_C, 'trans_A': self.trans_A, 'trans_B': self.trans_B,
+                'nb_calls': self.nb_calls, 'nb_threads': self.nb_threads, 'lib': self.lib, 'flops': flops, 'bytes': nb_bytes, 'time': t})
+
+    def post_process(self):
+        if len(self.data) == 0:
+            return
+        self.data['gflops'] = self.data['flops'] / self.data['time'] * 1e-9
+        self.data['bandwidth'] = self.data['bytes'] / self.data['time'] * 1e-9
+
+class TraceReplay(Program):
+    header = ['call_index', 'kernel', 'm', 'n', 'k', 'lead_A', 'lead_B', 'lead_C', 'nb_threads', 'lib', 'time']
+    key = ['run_index', 'call_index']
+
+    def __init__(self, lib, trace_file, nb_threads):
+        '''Replay the sequence of dgemm and dtrsm calls of the trace file (see calltrace.py) in a single process.'''
+        super().__init__()
+        if lib == 'naive':
+            raise HarnessError('The trace replay requires a BLAS library.')
+        self.lib = lib
+        self.trace_file = trace_file
+        self.calls = read_trace(trace_file)
+        self.nb_threads = nb_threads
+        compile_generic('trace_replay', self.lib)
+
+    def __environment_variables__(self):
+        return {'OMP_NUM_THREADS' : str(self.nb_threads)}
+
+    def __command_line__(self):
+        return ['./trace_replay', self.trace_file, self.tmp_filename]
 
     def __fetch_data__(self):
         with open(self.tmp_filename, 'r') as f:
             times = [float(t) for t in f.readlines()]
-        for call_index, t in enumerate(times):
-            self.__append_data__({'call_index': call_index, 'size': self.size, 'nb_calls': self.nb_calls, 'time': t})
+        assert len(times) == len(self.calls)
+        for call_index, (call, t) in enumerate(zip(self.calls, times)):
+            self.__append_data__({'call_index': call_index, **call._asdict(), 'nb_threads': self.nb_threads, 'lib': self.lib, 'time': t})
+
+class Instrumentation:
+    '''
+    Monotonic timings of the phases of each run of the ExpEngine (and of each program within a phase).
+    With profile='cprofile', a cProfile dump is written in profile_dir for each phase of each run.
+    With profile='tracemalloc', the peak memory of each phase is recorded.
+    '''
+    header = ['run_index', 'phase', 'program', 'duration', 'memory_peak']
+    def __init__(self, enabled=True, profile=None, profile_dir=None):
+        if profile not in (None, 'cprofile', 'tracemalloc'):
+            raise ValueError('Unknown profiler %s.' % profile)
+        if profile == 'cprofile' and profile_dir is None:
+            raise ValueError('A directory is required for the cProfile dumps.')
+        self.enabled = enabled
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.run_index = 0
+        self.rows = []
+
+    @contextlib.contextmanager
+    def phase(self, name, program=None):
+        if not self.enabled:
+            yield
+            return
+        profiled = program is None # the programs are not profiled separately, their phase already is
+        if profiled and self.profile == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif profiled and self.profile == 'tracemalloc':
+            tracemalloc.start()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            row = {'run_index': self.run_index, 'phase': name, 'program': '' if program is None else program.name,
+                    'duration': duration, 'memory_peak': None}
+            if profiled and self.profile == 'cprofile':
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, '%d_%s.prof' % (self.run_index, name)))
+            elif profiled and self.profile == 'tracemalloc':
+                row['memory_peak'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.rows.append(row)
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=self.header)
+            writer.writeheader()
+            writer.writerows(self.rows)
 
 class ExpEngine:
-    def __init__(self, application, wrappers):
+    def __init__(self, application, wrappers, keep_state=False, instrumentation=None, metrics=None):
+        '''
+        If keep_state is True, the setup and teardown of a program are only done when its state changes between
+        two consecutive runs (e.g. when a DisableWrapper is enabled or disabled), instead of for every run.
+        If an Instrumentation is given, the timings of the phases of each run are written in a side CSV file.
+        If a SessionMetrics (see metrics.py) is given, it is updated after each run.
+        '''
         self.wrappers = wrappers
         self.application = application
-        self.programs = [*self.wrappers, self.application]
+        self.transition_cost = TransitionCost()
+        self.programs = [*self.wrappers, self.application, self.transition_cost]
         self.base_environment = dict(os.environ)
+        self.keep_state = keep_state
+        self.active_states = {}
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
+        self.metrics = metrics
+        self.factors = {}
 
     def randomly_enable(self):
         for prog in self.programs:
-            prog.enabled = random.choice([False, True])
+            prog.state = prog.random_state()
 
     def enable_all(self):
         for prog in self.programs:
@@ -784,6 +1995,16 @@ class ExpEngine:
         for prog in self.programs:
             prog.enabled = False
 
+    def apply_factors(self, factors):
+        for name, value in factors.items():
+            handled = [prog.set_factor(name, value) for prog in self.programs]
+            if not any(handled):
+                raise ValueError('Factor %s is not handled by any program.' % name)
+
+    def seek(self, run_index):
+        for prog in self.programs:
+            prog.seek(run_index)
+
     @property
     def command_line(self):
         cmd =[]
@@ -799,22 +2020,88 @@ class ExpEngine:
         return env
 
     def run(self):
-        os.environ.clear()
-        os.environ.update(self.base_environment)
-        os.environ.update(self.environment_variables)
-        self.output = run_command(self.command_line)
+        with self.instrumentation.phase('pre_run'):
+            for prog in self.programs:
+                prog.pre_run()
+        with self.instrumentation.phase('launch'):
+            os.environ.clear()
+            os.environ.update(self.base_environment)
+            os.environ.update(self.environment_variables)
+            if self.application.resident:
+                prefix = []
+                for prog in self.wrappers:
+                    prefix.extend(prog.command_line)
+                self.application.start_server(prefix)
+            else:
+                command_line = self.command_line
+                process = start_command(command_line)
+        kernel_start = time.monotonic()
+        with self.instrumentation.phase('kernel'):
+            if self.application.resident:
+                self.output = self.application.submit()
+            else:
+                self.output = wait_command(process, command_line)
+        self.kernel_duration = time.monotonic() - kernel_start
+        with self.instrumentation.phase('post_run'):
+            for prog in self.programs:
+                prog.post_run()
+
+    def close(self):
+        for prog in self.programs:
+            prog.close()
 
     def setup(self):
-        for prog in self.programs:
-            prog.setup()
+        start = time.monotonic()
+        with self.instrumentation.phase('setup'):
+            for prog in self.programs:
+                with self.instrumentation.phase('setup', prog):
+                    prog.setup()
+        self.transition_cost.record(time.monotonic()-start, len(self.programs))
 
     def teardown(self):
-        for prog in self.programs:
+        start = time.monotonic()
+        with self.instrumentation.phase('teardown'):
+            for prog in self.programs:
+                with self.instrumentation.phase('teardown', prog):
+                    prog.teardown()
+        self.transition_cost.record(time.monotonic()-start, 0) # counted by the setup, like in transition
+
+    def transition(self):
+        '''Teardown and setup the programs whose state has changed since the previous run.'''
+        start = time.monotonic()
+        changed = [prog for prog in self.programs if prog not in self.active_states or self.active_states[prog] != prog.state]
+        with self.instrumentation.phase('transition'):
+            for prog in changed:
+                if prog in self.active_states:
+                    new_state = prog.state
+                    prog.state = self.active_states[prog] # the teardown has to be done in the old state
+                    with self.instrumentation.phase('teardown', prog):
+                        prog.teardown()
+                    prog.state = new_state
+            for prog in changed:
+                with self.instrumentation.phase('setup', prog):
+                    prog.setup()
+                self.active_states[prog] = prog.state
+        self.transition_cost.record(time.monotonic()-start, len(changed))
+
+    def final_teardown(self):
+        for prog, state in self.active_states.items():
+            prog.state = state
             prog.teardown()
+        self.active_states = {}
 
     def fetch_data(self):
+        with self.instrumentation.phase('fetch_data'):
+            for prog in self.programs:
+                with self.instrumentation.phase('fetch_data', prog):
+                    prog.fetch_data()
+
+    def write_data(self, filename):
+        '''Append the data of the runs done since the previous call to the CSV file.'''
+        data = self.gather_data()
         for prog in self.programs:
-            prog.fetch_data()
+            prog.clear_data()
+        append_csv(filename, data)
 
     def gather_data(self):
         all_data = pandas.DataFrame()
@@ -824,13 +2111,74 @@ class ExpEngine:
         all_data = all_data.reset_index().sort_values(by=['run_index', 'call_index']).fillna(method='ffill')
         return all_data
 
-    def run_all(self, filename, nb_runs):
-        for run_index in range(nb_runs):
-            self.randomly_enable()
-            self.setup()
+    @property
+    def configuration(self):
+        '''The states of the programs which are not always enabled and the factors of the current run, as a string.'''
+        configuration = {prog.name: prog.state for prog in self.programs
+                if isinstance(prog, DisableWrapper) or prog.state is not True}
+        configuration.update(self.factors)
+        return ' '.join('%s=%s' % item for item in sorted(configuration.items()))
+
+    def record_metrics(self, run_duration):
+        call_times = []
+        if isinstance(self.application, TimedCallsProgram):
+            call_times = [row[0] for row in self.application.read_output()]
+        self.metrics.record_run(self.configuration, call_times, run_duration, self.kernel_duration)
+
+    def run_once(self):
+        start = time.monotonic()
+        if self.keep_state:
+            self.transition()
             self.run()
-            self.teardown()
-            self.fetch_data()
-        all_data =self.gather_data()
-        with open(filename, 'w') as f:
-            f.write(all_data.to_csv())
+        else:
+            self.setup()
+            try:
+                self.run()
+            finally:
+                self.teardown()
+        self.fetch_data()
+        if self.metrics is not None:
+            self.record_metrics(time.monotonic() - start)
+
+    def run_all(self, filename, nb_runs=None, schedule=None):
+        '''
+        Perform nb_runs runs, randomly enabling the programs for each of them.
+        If a schedule is given, follow it instead: only its pending runs are performed (so it can be resumed),
+        the programs which are not factors of the schedule are still randomly enabled.
+        The data of each run is appended to the CSV file as soon as the run is done, then the run is marked as done
+        in the schedule. When a schedule is resumed, the data of its previous sessions is kept.
+        '''
+        if schedule is None:
+            runs = [(run_index, None) for run_index in range(nb_runs)]
+        else:
+            runs = schedule.pending()
+        if self.metrics is not None:
+            self.metrics.start_session(len(runs))
+        if len(runs) == 0:
+            return
+        if schedule is not None and len(runs) < len(schedule) and os.path.isfile(filename):
+            # the rows of a pending run may have been written just before an interruption
+            previous = pandas.read_csv(filename)
+            previous = previous.drop(columns=[col for col in previous.columns if col == 'Unnamed: 0']) # index of the old files
+            write_csv(filename, previous[~previous['run_index'].isin([run_index for run_index, _ in runs])])
+        elif os.path.isfile(filename):
+            os.remove(filename)
+        try:
+            for run_index, factors in runs:
+                self.instrumentation.run_index = run_index
+                with self.instrumentation.phase('randomly_enable'):
+                    self.randomly_enable()
+                    if factors is not None:
+                        self.apply_factors(factors)
+                if factors is not None:
+                    self.factors = factors
+                self.seek(run_index)
+                self.run_once()
+                self.write_data(filename)
+                if schedule is not None:
+                    schedule.mark_done(run_index)
+        finally: # e.g. the resident server, the background loads and the disabled hyperthreads
+            self.final_teardown()
+            self.close()
+            if self.instrumentation.enabled:
+                self.instrumentation.write(os.path.splitext(filename)[0] + '_timings.csv')
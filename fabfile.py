@@ -1,8 +1,12 @@
 from fabric.api import local, run, cd, env, put, get, task, runs_once, parallel, execute
 from fabric.network import ssh
+from fabric.utils import abort
 import os
+import socket
+import hashlib
 import zipfile
-import shutil
+from ingest import load_results, report_errors
+from barrier import Coordinator
 
 env.use_ssh_config = True
 ssh.util.log_to_file('/tmp/paramiko.log', 10)
@@ -12,6 +16,13 @@ OPENBLAS_DIRECTORY = 'OpenBLAS-0.2.20'
 OPENBLAS_URL       = 'https://github.com/xianyi/OpenBLAS/archive/v0.2.20.zip'
 EXP_DIRECTORY      = 'variability_study'
 EXP_ARCHIVE        = EXP_DIRECTORY + '.zip'
+OPENBLAS_CACHE     = 'openblas_cache'         # local directory of the prebuilt OpenBLAS, one per fingerprint
+MANIFEST           = 'provision_manifest.txt' # on each host, the digest of the inputs of each provisioning step
+POOL_SIZE          = 16                       # maximal number of hosts provisioned at the same time
+
+# Hosts with the same fingerprint share the same OpenBLAS binaries: the build is only done on one of them.
+# The architecture chosen by gcc for -march=native is close enough to the TARGET detected by OpenBLAS.
+FINGERPRINT_COMMAND = "uname -m && gcc -dumpversion && gcc -march=native -Q --help=target | grep -E '^ +-march=' | awk '{print $2}'"
 
 APT_PACKAGES = [
         'build-essential',
@@ -67,6 +78,102 @@ def install_apt_packages():
     run_no_output('yes | apt upgrade')
     run_no_output('yes | apt install %s' % ' '.join(APT_PACKAGES))
 
+def digest(*values):
+    return hashlib.sha1('\n'.join(str(v) for v in values).encode()).hexdigest()[:12]
+
+def file_digest(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()[:12]
+
+def read_manifest():
+    output = run('cat %s 2>/dev/null || true' % MANIFEST, quiet=True)
+    return dict(line.split() for line in output.splitlines() if len(line.split()) == 2)
+
+def unchanged_step(step, inputs_digest, function, *args):
+    '''Run the provisioning step, unless it has already been done on the host with the same inputs.'''
+    if read_manifest().get(step) == inputs_digest:
+        print('[%s] %s is up to date.' % (env.host_string, step))
+        return
+    function(*args)
+    run_no_output("touch {0} && sed -i '/^{1} /d' {0} && echo '{1} {2}' >> {0}".format(MANIFEST, step, inputs_digest))
+
+def fingerprint():
+    output = run(FINGERPRINT_COMMAND, quiet=True)
+    values = output.split()
+    if output.failed or len(values) != 3: # e.g. no gcc yet, the pipeline can succeed with a partial output
+        abort('Cannot compute the fingerprint of %s (%s): %s' % (env.host_string, FINGERPRINT_COMMAND, output))
+    return '%s_%s_%s' % (OPENBLAS_DIRECTORY, values[-1], digest(*values))
+
+def artifact_path(host_fingerprint):
+    return os.path.join(OPENBLAS_CACHE, host_fingerprint + '.tar.gz')
+
+@parallel(pool_size=POOL_SIZE)
+def get_fingerprint():
+    return fingerprint()
+
+@parallel(pool_size=POOL_SIZE)
+def build_openblas_artifact():
+    build_dir, prefix = '/tmp/openblas_build', '/tmp/openblas_build/prefix'
+    run_no_output('rm -rf %s && mkdir -p %s' % (build_dir, prefix))
+    put(OPENBLAS_ARCHIVE, build_dir)
+    with cd(build_dir):
+        run_no_output('unzip %s' % OPENBLAS_ARCHIVE)
+        with cd(OPENBLAS_DIRECTORY):
+            run_no_output('make -j $(nproc)')
+            run_no_output('make install PREFIX=%s' % prefix)
+        run_no_output('tar czf openblas.tar.gz -C %s .' % prefix)
+    path = artifact_path(fingerprint())
+    tmp_path = '%s.%s.tmp' % (path, env.host_string) # several builds may be running
+    get(os.path.join(build_dir, 'openblas.tar.gz'), tmp_path)
+    os.replace(tmp_path, path)
+    run_no_output('rm -rf %s' % build_dir)
+
+@runs_once
+def build_openblas_artifacts():
+    '''Build OpenBLAS on one host of each fingerprint missing in the local cache, return the fingerprint of each host.'''
+    execute(get_openblas_archive)
+    os.makedirs(OPENBLAS_CACHE, exist_ok=True)
+    fingerprints = execute(get_fingerprint)
+    builders = {}
+    for host in sorted(fingerprints):
+        if not os.path.isfile(artifact_path(fingerprints[host])):
+            builders.setdefault(fingerprints[host], host)
+    if len(builders) > 0:
+        print('Building OpenBLAS for %s.' % ', '.join(sorted(builders)))
+        execute(build_openblas_artifact, hosts=list(builders.values()))
+    return fingerprints
+
+def install_openblas_artifact(artifact):
+    put(artifact, '~/openblas.tar.gz')
+    run_no_output('tar xzf ~/openblas.tar.gz -C /usr && rm ~/openblas.tar.gz')
+    run_no_output('mkdir -p /usr/lib/openblas-base/')
+    run_no_output('ln -sf /usr/lib/libopenblas.so /usr/lib/openblas-base/libblas.so')
+
+def copy_experiment_archive():
+    put(EXP_ARCHIVE, '~')
+    run_no_output('rm -rf %s' % EXP_DIRECTORY)
+    extract_experiment()
+
+@parallel(pool_size=POOL_SIZE)
+def provision_apt():
+    '''The packages needed by the other steps (e.g. gcc for the fingerprint and the build of OpenBLAS).'''
+    unchanged_step('apt', digest(*APT_PACKAGES), install_apt_packages)
+
+@parallel(pool_size=POOL_SIZE)
+def provision(fingerprints):
+    '''All the installation steps of one host after provision_apt, the hosts are provisioned concurrently.'''
+    artifact = artifact_path(fingerprints[env.host_string])
+    openblas_digest = file_digest(artifact)
+    experiment_digest = file_digest(EXP_ARCHIVE)
+    unchanged_step('openblas', openblas_digest, install_openblas_artifact, artifact)
+    unchanged_step('pip', digest(*PIP_PACKAGES), install_pip_packages)
+    unchanged_step('experiment', experiment_digest, copy_experiment_archive)
+    setup_os() # not persistent across reboots
+    unchanged_step('test', digest(openblas_digest, experiment_digest), test_installation)
+
 @parallel
 def install_openblas():
     run_no_output('yes | unzip %s' % OPENBLAS_ARCHIVE)
@@ -98,30 +205,51 @@ def test_installation():
         run_no_output('python3 ./multi_runner.py --nb_runs 3 --nb_calls 10 --size 100 -np 1 --csv_file /tmp/test.csv --lib naive --likwid CLOCK L3CACHE')
 
 @parallel
-def __run_exp(experiment_file):
+def __run_exp(experiment_file, barrier=None):
     result_file = 'tmp.csv'
     with cd(EXP_DIRECTORY):
         put(experiment_file, experiment_file)
-        run_no_output('python3 %s %s' % (experiment_file, result_file))
+        prefix = '' if barrier is None else 'VARIABILITY_BARRIER=%s ' % barrier
+        run_no_output('%spython3 %s %s' % (prefix, experiment_file, result_file))
         result = get(result_file)
         assert len(result) == 1
         result = result[0]
     return result
 
 @runs_once
-def run_exp(experiment_file, result_file):
-    results = execute(__run_exp, experiment_file)
+def run_exp(experiment_file, result_file, barrier_port=None, coordinator_host=None):
+    '''
+    With a barrier_port, the runs start at the same instant on all the hosts: a coordinator is started locally (the
+    hosts must be able to connect to coordinator_host:barrier_port) and the clock offsets of the hosts for each run
+    are written in <result_file>_barrier.csv.
+    '''
+    barrier = None
+    if barrier_port is not None:
+        output = os.path.splitext(result_file)[0] + '_barrier.csv'
+        coordinator = Coordinator(len(env.all_hosts), port=int(barrier_port), output=output)
+        coordinator.start()
+        barrier = '%s:%s' % (coordinator_host or socket.getfqdn(), barrier_port)
+    results = execute(__run_exp, experiment_file, barrier)
+    if barrier is not None:
+        coordinator.join()
     file_names = list(results.values())
     assert len(file_names) > 0
-    shutil.copy(file_names[0], result_file)
-    for name in file_names[1:]:
-        with open(result_file, 'a') as out_f, open(name, 'r') as in_f:
-            in_f.readline() # skip the first one, header of the CSV
-            for line in in_f:
-                out_f.write(line)
+    df, errors = load_results(file_names)
+    report_errors(errors)
+    df.to_csv(result_file, index=False)
 
 @runs_once
 def install():
+    '''
+    OpenBLAS is built once per fingerprint (see FINGERPRINT_COMMAND) and cached in OPENBLAS_CACHE, then each host
+    gets its binaries. The steps whose inputs have not changed since the last installation are skipped.
+    '''
+    execute(provision_apt)
+    fingerprints = build_openblas_artifacts()
+    execute(provision, fingerprints)
+
+@runs_once
+def install_from_source():
     execute(get_openblas_archive)
     execute(copy_archives)
     execute(install_apt_packages)
@@ -0,0 +1,123 @@
+#define _GNU_SOURCE // for sched_setaffinity
+#include <stdlib.h>
+#include <stdio.h>
+#include <stdint.h>
+#include <signal.h>
+#include <sched.h>
+#include <time.h>
+
+// Fixed work quantum (FWQ) noise probe of the NoiseProbe wrapper (see experiment.py), pinned to one core, running
+// until SIGTERM. The same small amount of work (the quantum, calibrated to last about <quantum_us> µs) is repeated;
+// a quantum lasting more than <threshold_us> µs longer than the fastest one is a detour: the core was taken by
+// something else (interrupt, kernel thread, other process...). The detours are kept in memory and written at the
+// end in the output file, in binary (native 64 bits unsigned integers):
+//  - header: number of quanta, duration of the fastest quantum (ns), number of detours, number of dropped detours
+//    (beyond the capacity of the buffer), start date and end date of the measure (ns)
+//  - for each detour: start date and duration (ns)
+// The dates are given by CLOCK_MONOTONIC, like time.monotonic and the call windows of Dgemm.
+// A line "ready" is printed once the quantum is calibrated.
+
+#define MAX_DETOURS (1<<20)
+#define NB_CALIBRATION_QUANTA 1000
+
+struct detour {
+    uint64_t start;
+    uint64_t duration;
+};
+
+static volatile sig_atomic_t stop = 0;
+static volatile uint64_t sink;
+
+void syntax(char *exec_name) {
+    fprintf(stderr, "Syntax: %s <core> <output_file> [quantum_us] [threshold_us]\n", exec_name);
+    exit(1);
+}
+
+static void handle_signal(int signum) {
+    (void)signum;
+    stop = 1;
+}
+
+static inline uint64_t now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return (uint64_t)t.tv_sec * 1000000000ULL + t.tv_nsec;
+}
+
+static inline void quantum(uint64_t nb_iterations) {
+    uint64_t x = sink;
+    for(uint64_t i = 0 ; i < nb_iterations ; i++)
+        x = x * 6364136223846793005ULL + 1442695040888963407ULL;
+    sink = x;
+}
+
+static uint64_t fastest_quantum(uint64_t nb_iterations, int nb_quanta) {
+    uint64_t fastest = UINT64_MAX;
+    for(int i = 0 ; i < nb_quanta ; i++) {
+        uint64_t start = now();
+        quantum(nb_iterations);
+        uint64_t duration = now() - start;
+        if(duration < fastest)
+            fastest = duration;
+    }
+    return fastest;
+}
+
+int main(int argc, char *argv[]) {
+    if(argc < 3 || argc > 5)
+        syntax(argv[0]);
+    int core = atoi(argv[1]);
+    char *output = argv[2];
+    uint64_t quantum_ns = (uint64_t)((argc > 3 ? atof(argv[3]) : 10) * 1e3);
+    uint64_t threshold_ns = (uint64_t)((argc > 4 ? atof(argv[4]) : 1) * 1e3);
+    cpu_set_t set;
+    CPU_ZERO(&set);
+    CPU_SET(core, &set);
+    if(sched_setaffinity(0, sizeof(set), &set) != 0) {
+        perror("sched_setaffinity");
+        exit(1);
+    }
+    signal(SIGTERM, handle_signal);
+    signal(SIGINT, handle_signal);
+    struct detour *detours = malloc(MAX_DETOURS * sizeof(struct detour)); // the pages are only touched when used
+    if(detours == NULL) {
+        perror("malloc");
+        exit(1);
+    }
+    uint64_t nb_iterations = 16;
+    while(fastest_quantum(nb_iterations, 100) < quantum_ns)
+        nb_iterations *= 2;
+    uint64_t fastest = fastest_quantum(nb_iterations, NB_CALIBRATION_QUANTA);
+    printf("ready\n");
+    fflush(stdout);
+    uint64_t nb_quanta = 0, nb_detours = 0, nb_dropped = 0;
+    uint64_t first = now(), start = first, end = first;
+    while(!stop) {
+        quantum(nb_iterations);
+        end = now();
+        uint64_t duration = end - start;
+        if(duration < fastest) // may happen after the calibration, e.g. with a higher frequency
+            fastest = duration;
+        if(duration > fastest + threshold_ns) {
+            if(nb_detours < MAX_DETOURS) {
+                detours[nb_detours].start = start;
+                detours[nb_detours].duration = duration;
+                nb_detours++;
+            }
+            else
+                nb_dropped++;
+        }
+        nb_quanta++;
+        start = end;
+    }
+    FILE *f = fopen(output, "wb");
+    if(f == NULL) {
+        perror(output);
+        exit(1);
+    }
+    uint64_t header[6] = {nb_quanta, fastest, nb_detours, nb_dropped, first, end};
+    fwrite(header, sizeof(uint64_t), 6, f);
+    fwrite(detours, sizeof(struct detour), nb_detours, f);
+    fclose(f);
+    return 0;
+}
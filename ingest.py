@@ -0,0 +1,133 @@
+#! /usr/bin/env python3
+
+import sys
+import argparse
+import collections
+import numpy
+import pandas
+from concurrent.futures import ProcessPoolExecutor
+
+# Loading of many result files (e.g. one per host) into a single dataframe. The files are parsed in parallel,
+# their columns are checked against a reference schema (the expected columns if they are given, the columns shared
+# by most of the files otherwise), and they are concatenated only once, after having been cast to a common type for
+# each column. The files whose columns do not match are reported and left out, instead of being misaligned.
+
+class SchemaError(Exception):
+    pass
+
+def read_file(filename):
+    '''Parse a single file, return (filename, dataframe, error message).'''
+    try:
+        df = pandas.read_csv(filename)
+    except (OSError, ValueError) as e: # pandas parser errors are subclasses of ValueError
+        return filename, None, str(e)
+    if 'Unnamed: 0' in df.columns: # index written by DataFrame.to_csv
+        df = df.drop(columns='Unnamed: 0')
+    return filename, df, None
+
+def common_dtype(dtypes):
+    '''The type able to hold the values of all the given types, the columns of mixed kinds are kept as objects.'''
+    dtypes = set(dtypes)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    if all(dtype.kind in 'iuf' for dtype in dtypes):
+        return numpy.result_type(*dtypes)
+    return numpy.dtype(object)
+
+def check_schema(df, reference, required):
+    '''Return a description of the mismatch between the columns of the dataframe and the reference, or None.'''
+    columns = set(df.columns)
+    missing = [col for col in required if col not in columns]
+    if len(missing) > 0:
+        return 'missing required columns %s' % ', '.join(missing)
+    if reference is not None and columns != set(reference):
+        problems = []
+        missing = [col for col in reference if col not in columns]
+        if len(missing) > 0:
+            problems.append('missing columns %s' % ', '.join(missing))
+        extra = [col for col in df.columns if col not in reference]
+        if len(extra) > 0:
+            problems.append('unexpected columns %s' % ', '.join(extra))
+        return ', '.join(problems)
+    return None
+
+def majority_columns(frames):
+    '''The columns shared by the largest number of dataframes (the first of them in case of a tie), in their order.'''
+    counts = collections.Counter(frozenset(df.columns) for df in frames)
+    best = max(counts.values())
+    for df in frames:
+        if counts[frozenset(df.columns)] == best:
+            return list(df.columns)
+
+def load_results(filenames, required=(), nb_workers=None, add_filename=False, expected=None):
+    '''
+    Load and concatenate the given result files. The reference schema is the list of expected columns if it is
+    given (e.g. built from the headers of the programs), otherwise the set of columns shared by most of the files
+    which contain the required columns.
+    Return the dataframe and a dictionary {filename: error} of the files which have been left out.
+    '''
+    filenames = list(filenames)
+    if nb_workers == 1 or len(filenames) <= 1:
+        results = [read_file(filename) for filename in filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=nb_workers) as executor:
+            results = list(executor.map(read_file, filenames))
+    errors = {}
+    candidates = []
+    for filename, df, error in results:
+        if error is None:
+            error = check_schema(df, None, required)
+        if error is not None:
+            errors[filename] = error
+        else:
+            candidates.append((filename, df))
+    if len(candidates) == 0:
+        raise SchemaError('No valid result file (%s).' % '; '.join('%s: %s' % item for item in errors.items()))
+    if expected is not None:
+        reference = list(expected)
+    else:
+        reference = majority_columns([df for _, df in candidates])
+    frames = []
+    for filename, df in candidates:
+        error = check_schema(df, reference, required)
+        if error is not None:
+            errors[filename] = error
+            continue
+        if add_filename:
+            df['filename'] = filename
+        frames.append(df)
+    if len(frames) == 0:
+        raise SchemaError('No valid result file (%s).' % '; '.join('%s: %s' % item for item in errors.items()))
+    if add_filename:
+        reference = reference + ['filename']
+    dtypes = {col: common_dtype(df[col].dtype for df in frames) for col in reference}
+    frames = [df[reference].astype(dtypes, copy=False) for df in frames]
+    result = pandas.concat(frames, ignore_index=True, copy=False)
+    return result, errors
+
+def report_errors(errors, output=sys.stderr):
+    for filename, error in errors.items():
+        output.write('Skipped file %s: %s\n' % (filename, error))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Concatenate result files, checking that their columns match.')
+    parser.add_argument('output', type=str, help='Output CSV file.')
+    parser.add_argument('filenames', type=str, nargs='+', help='Result files.')
+    parser.add_argument('--required', type=lambda s: s.split(','),
+            default=[], help='Comma-separated list of the columns that every file must have.')
+    parser.add_argument('--expected', type=lambda s: s.split(','),
+            default=None, help='Comma-separated list of the expected columns (default: the columns of most of the files).')
+    parser.add_argument('--nb_workers', type=int,
+            default=None, help='Number of processes used to parse the files (default: number of CPUs).')
+    parser.add_argument('--add_filename', action='store_true',
+            help='Add a column with the name of the file of each row.')
+    parser.add_argument('--strict', action='store_true',
+            help='Fail if a file does not match, instead of leaving it out.')
+    args = parser.parse_args()
+    df, errors = load_results(args.filenames, args.required, args.nb_workers, args.add_filename, args.expected)
+    report_errors(errors)
+    if args.strict and len(errors) > 0:
+        sys.exit(1)
+    df.to_csv(args.output, index=False)
+    sys.stderr.write('%d rows from %d files.\n' % (len(df), len(args.filenames) - len(errors)))
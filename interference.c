@@ -0,0 +1,164 @@
+#define _GNU_SOURCE // for sched_setaffinity
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <stdint.h>
+#include <signal.h>
+#include <sched.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/syscall.h>
+
+// Background load of the Interference wrapper (see experiment.py), pinned to one core, running until SIGTERM.
+// Modes (and their work unit):
+//  - stream: triad a = b + s×c on three buffers much larger than the caches (bytes)
+//  - llc: read-modify-write of the cache lines of a buffer of the size of the last level cache, in a pseudo-random order (cache lines)
+//  - syscall: cheap system calls (calls)
+//  - timer: sleeps of 10 µs, i.e. timer interrupts and context switches (sleeps)
+//  - busy: integer arithmetic, typically on the SMT siblings of the cores of the application (iterations)
+// The load is active during the fraction <intensity> of each period of 10 ms and sleeps the rest of the time.
+// A line "ready" is printed once the buffers are initialized. On SIGTERM, the number of work units per second of
+// activity is printed.
+
+#define PERIOD 0.01
+#define CACHE_LINE 64
+#define STREAM_CHUNK 8192
+#define LLC_CHUNK 4096
+#define SYSCALL_CHUNK 256
+#define BUSY_CHUNK 100000
+
+static volatile sig_atomic_t stop = 0;
+static double *buffer_a, *buffer_b, *buffer_c;
+static size_t nb_elements, nb_lines;
+static size_t position = 0;
+static volatile uint64_t sink;
+
+void syntax(char *exec_name) {
+    fprintf(stderr, "Syntax: %s <stream|llc|syscall|timer|busy> <core> <intensity> [buffer_size]\n", exec_name);
+    exit(1);
+}
+
+static void handle_signal(int signum) {
+    (void)signum;
+    stop = 1;
+}
+
+static double now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + t.tv_nsec * 1e-9;
+}
+
+static void sleep_for(double duration) {
+    struct timespec t = {.tv_sec = (time_t)duration, .tv_nsec = (long)((duration - (time_t)duration) * 1e9)};
+    nanosleep(&t, NULL);
+}
+
+static double *allocate(size_t nb_bytes) {
+    double *result = malloc(nb_bytes);
+    if(result == NULL) {
+        perror("malloc");
+        exit(1);
+    }
+    memset(result, 1, nb_bytes);
+    return result;
+}
+
+static double stream_chunk(void) {
+    if(position + STREAM_CHUNK > nb_elements)
+        position = 0;
+    for(size_t i = position ; i < position + STREAM_CHUNK ; i++)
+        buffer_a[i] = buffer_b[i] + 3.*buffer_c[i];
+    position += STREAM_CHUNK;
+    return 3. * STREAM_CHUNK * sizeof(double);
+}
+
+static double llc_chunk(void) {
+    // full-period linear congruential sequence of the lines (nb_lines is a power of two)
+    char *lines = (char*) buffer_a;
+    for(int i = 0 ; i < LLC_CHUNK ; i++) {
+        position = (position * 5 + 1) & (nb_lines - 1);
+        lines[position * CACHE_LINE] += 1;
+    }
+    return LLC_CHUNK;
+}
+
+static double syscall_chunk(void) {
+    for(int i = 0 ; i < SYSCALL_CHUNK ; i++)
+        syscall(SYS_getppid);
+    return SYSCALL_CHUNK;
+}
+
+static double timer_chunk(void) {
+    sleep_for(1e-5);
+    return 1;
+}
+
+static double busy_chunk(void) {
+    uint64_t x = sink;
+    for(int i = 0 ; i < BUSY_CHUNK ; i++)
+        x = x * 6364136223846793005ULL + 1442695040888963407ULL;
+    sink = x;
+    return BUSY_CHUNK;
+}
+
+int main(int argc, char *argv[]) {
+    if(argc != 4 && argc != 5)
+        syntax(argv[0]);
+    char *mode = argv[1];
+    int core = atoi(argv[2]);
+    double intensity = atof(argv[3]);
+    size_t buffer_size = argc == 5 ? strtoull(argv[4], NULL, 10) : 0;
+    if(intensity <= 0 || intensity > 1) {
+        fprintf(stderr, "Error: the intensity must be in ]0, 1], got %s.\n", argv[3]);
+        exit(1);
+    }
+    cpu_set_t set;
+    CPU_ZERO(&set);
+    CPU_SET(core, &set);
+    if(sched_setaffinity(0, sizeof(set), &set) != 0) {
+        perror("sched_setaffinity");
+        exit(1);
+    }
+    signal(SIGTERM, handle_signal); // before the allocations, which may be long
+    signal(SIGINT, handle_signal);
+    double (*work)(void);
+    if(strcmp(mode, "stream") == 0) {
+        nb_elements = (buffer_size ? buffer_size : 1<<26) / sizeof(double);
+        if(nb_elements < STREAM_CHUNK)
+            nb_elements = STREAM_CHUNK;
+        buffer_a = allocate(nb_elements * sizeof(double));
+        buffer_b = allocate(nb_elements * sizeof(double));
+        buffer_c = allocate(nb_elements * sizeof(double));
+        work = stream_chunk;
+    }
+    else if(strcmp(mode, "llc") == 0) {
+        size_t requested = (buffer_size ? buffer_size : 1<<25) / CACHE_LINE;
+        for(nb_lines = 1 ; nb_lines * 2 <= requested ; nb_lines *= 2);
+        buffer_a = allocate(nb_lines * CACHE_LINE);
+        work = llc_chunk;
+    }
+    else if(strcmp(mode, "syscall") == 0)
+        work = syscall_chunk;
+    else if(strcmp(mode, "timer") == 0)
+        work = timer_chunk;
+    else if(strcmp(mode, "busy") == 0)
+        work = busy_chunk;
+    else
+        syntax(argv[0]);
+    printf("ready\n");
+    fflush(stdout);
+    double nb_units = 0, active_time = 0;
+    while(!stop) {
+        double start = now();
+        double end = start + intensity*PERIOD;
+        do {
+            nb_units += work();
+        } while(!stop && now() < end);
+        active_time += now() - start;
+        if(intensity < 1 && !stop)
+            sleep_for((1-intensity)*PERIOD);
+    }
+    printf("%g\n", active_time > 0 ? nb_units / active_time : 0.);
+    return 0;
+}
@@ -1,26 +1,47 @@
 #!/usr/bin/env python3
 
 import sys
-from pandas import DataFrame
+from ingest import load_results
+from model import Model, Registry
 import statsmodels.formula.api as statsmodels
 
-def get_reg(filename):
+def get_kernel(filename):
     if 'dgemm' in filename:
-        model = 'time ~ I(m*n*k)'
+        return 'dgemm'
     elif 'dtrsm' in filename:
-        model = 'time ~ I(m*n**2)'
+        return 'dtrsm'
     else:
         sys.stderr.write('ERROR, did not recognize experiment with file name.\n')
         sys.exit(1)
-    dataframe = DataFrame.from_csv(filename, index_col=None)
+
+def get_reg(filename):
+    if get_kernel(filename) == 'dgemm':
+        model = 'time ~ I(m*n*k)'
+    else:
+        model = 'time ~ I(m*n**2)'
+    dataframe, _ = load_results([filename])
     reg = statsmodels.ols(formula=model, data=dataframe).fit()
     if reg.rsquared < 0.95:
         print('WARNING: bad R-squared, got %f.' % reg.rsquared)
     return reg
 
+def save_reg(filename, reg, registry_file, lib, nb_threads):
+    '''Save the fit in the registry of model.py, for the host of the result file.'''
+    dataframe, _ = load_results([filename])
+    hosts = dataframe['hostname'].unique()
+    if len(hosts) != 1:
+        sys.stderr.write('ERROR, expected a single host in the file, got %s.\n' % ', '.join(hosts))
+        sys.exit(1)
+    registry = Registry(registry_file)
+    registry.add(hosts[0], lib, nb_threads, Model.from_regression(get_kernel(filename), reg), filename=filename)
+    registry.save()
+
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Syntax: %s <file_name>' % sys.argv[0])
+    if len(sys.argv) not in (2, 5):
+        print('Syntax: %s <file_name> [<registry_file> <lib> <nb_threads>]' % sys.argv[0])
+        print('        With a registry file, the model is also saved in it (see model.py).')
         sys.exit(1)
     reg = get_reg(sys.argv[1])
     print(reg.params)
+    if len(sys.argv) == 5:
+        save_reg(sys.argv[1], reg, sys.argv[2], sys.argv[3], int(sys.argv[4]))
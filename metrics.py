@@ -0,0 +1,230 @@
+import math
+import time
+import bisect
+import threading
+import statistics
+import collections
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# Live summaries of an ExpEngine session, published in the text format of Prometheus (e.g. curl localhost:8000/metrics),
+# to watch a long experiment and abort it early if the measures are not the expected ones.
+# All the statistics are updated incrementally: the cost of a run does not depend on the number of previous runs.
+# The cumulative statistics of a configuration come with statistics on its last runs only, to see a drift in a long session.
+
+class Welford:
+    '''Running mean and variance (Welford's algorithm).'''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return float('nan')
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+class P2Quantile:
+    '''
+    Running estimation of a quantile with the P² algorithm (Jain and Chlamtac, 1985): five markers are kept, whose
+    heights are adjusted with a piecewise-parabolic interpolation. Exact for the five first observations.
+    '''
+    def __init__(self, p=0.5):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1+2*p, 1+4*p, 3+2*p, 5]
+        self.increments = [0, p/2, p, (1+p)/2, 1]
+
+    def add(self, x):
+        self.count += 1
+        if self.count <= 5:
+            bisect.insort(self.heights, x)
+            return
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1 # q[k] <= x < q[k+1]
+        for i in range(k+1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.parabolic(i, d)
+                if not q[i-1] < height < q[i+1]:
+                    height = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i+1] - n[i-1]) * ((n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i]) +
+                                               (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+
+    @property
+    def value(self):
+        if self.count == 0:
+            return float('nan')
+        if self.count <= 5:
+            return self.heights[int(round(self.p * (self.count - 1)))]
+        return self.heights[2]
+
+class ConfigurationMetrics:
+    '''Statistics of the call times of a configuration, over all its runs and over the median of each of its last runs.'''
+    def __init__(self, window=20):
+        self.nb_runs = 0
+        self.median = P2Quantile(0.5)
+        self.moments = Welford()
+        self.run_medians = collections.deque(maxlen=window)
+
+    def add(self, call_times):
+        self.nb_runs += 1
+        for t in call_times:
+            self.median.add(t)
+            self.moments.add(t)
+        if len(call_times) > 0:
+            self.run_medians.append(statistics.median(call_times))
+
+    @property
+    def window_median(self):
+        if len(self.run_medians) == 0:
+            return float('nan')
+        return statistics.median(self.run_medians)
+
+    @property
+    def window_std(self):
+        if len(self.run_medians) < 2:
+            return float('nan')
+        return statistics.stdev(self.run_medians)
+
+class SessionMetrics:
+    '''
+    Summaries of the runs of a session: progress and estimated remaining time, overhead of the wrappers (everything
+    in a run but the execution of the application), and for each configuration (the non-trivial states of the
+    programs and the factors of the schedule), the median, mean and standard deviation of the call times, and the
+    median and standard deviation of the per-run medians of the last window runs.
+    '''
+    prefix = 'variability'
+
+    def __init__(self, window=20):
+        self.window = window
+        self.lock = threading.Lock()
+        self.start_session(None)
+
+    def start_session(self, nb_runs):
+        with self.lock:
+            self.nb_runs = nb_runs
+            self.nb_done = 0
+            self.start = time.monotonic()
+            self.run_durations = Welford()
+            self.overheads = Welford()
+            self.last_overhead = float('nan')
+            self.configurations = {}
+
+    def record_run(self, configuration, call_times, run_duration, kernel_duration):
+        '''Called by the ExpEngine after each run, the configuration is a string.'''
+        with self.lock:
+            self.nb_done += 1
+            self.run_durations.add(run_duration)
+            self.last_overhead = run_duration - kernel_duration
+            self.overheads.add(self.last_overhead)
+            if configuration not in self.configurations:
+                self.configurations[configuration] = ConfigurationMetrics(self.window)
+            self.configurations[configuration].add(call_times)
+
+    @property
+    def eta(self):
+        if self.nb_runs is None or self.nb_done == 0:
+            return float('nan')
+        return (self.nb_runs - self.nb_done) * self.run_durations.mean
+
+    @staticmethod
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def render(self):
+        '''The metrics, in the text exposition format of Prometheus.'''
+        lines = []
+        def metric(name, kind, help_text, samples):
+            name = '%s_%s' % (self.prefix, name)
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                label_text = ','.join('%s="%s"' % (k, self.escape(v)) for k, v in labels)
+                lines.append('%s%s %r' % (name, '{%s}' % label_text if label_text else '', float(value)))
+        with self.lock:
+            configurations = sorted(self.configurations.items())
+            def per_configuration(function):
+                return [((('configuration', name),), function(conf)) for name, conf in configurations]
+            metric('runs_completed', 'counter', 'Number of runs done in this session.', [((), self.nb_done)])
+            metric('runs_total', 'gauge', 'Number of runs of this session (NaN if unknown).',
+                    [((), float('nan') if self.nb_runs is None else self.nb_runs)])
+            metric('elapsed_seconds', 'gauge', 'Time since the start of the session.', [((), time.monotonic() - self.start)])
+            metric('eta_seconds', 'gauge', 'Estimated time until the end of the session.', [((), self.eta)])
+            metric('run_duration_mean_seconds', 'gauge', 'Mean duration of a run, wrappers included.', [((), self.run_durations.mean)])
+            metric('wrapper_overhead_seconds', 'gauge', 'Time of the last run spent outside of the application.', [((), self.last_overhead)])
+            metric('wrapper_overhead_mean_seconds', 'gauge', 'Mean time of a run spent outside of the application.', [((), self.overheads.mean)])
+            metric('configuration_runs', 'counter', 'Number of runs of each configuration.', per_configuration(lambda conf: conf.nb_runs))
+            metric('call_time_median_seconds', 'gauge', 'Median of the call times of each configuration (P² estimate).',
+                    per_configuration(lambda conf: conf.median.value))
+            metric('call_time_mean_seconds', 'gauge', 'Mean of the call times of each configuration.',
+                    per_configuration(lambda conf: conf.moments.mean))
+            metric('call_time_stddev_seconds', 'gauge', 'Standard deviation of the call times of each configuration.',
+                    per_configuration(lambda conf: conf.moments.std))
+            metric('call_time_window_median_seconds', 'gauge', 'Median of the per-run medians of the last %d runs of each configuration.' % self.window,
+                    per_configuration(lambda conf: conf.window_median))
+            metric('call_time_window_stddev_seconds', 'gauge', 'Standard deviation of the per-run medians of the last %d runs of each configuration.' % self.window,
+                    per_configuration(lambda conf: conf.window_std))
+        return '\n'.join(lines) + '\n'
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class MetricsServer:
+    '''Serve the given SessionMetrics over HTTP in a background thread, on any path (e.g. /metrics).'''
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): # no output for each scrape
+                pass
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy
+
+# Registry of the performance models fitted by linear_regression.py, one per (host, lib, nb_threads, kernel).
+# The prediction only needs numpy (no statsmodels), it is vectorized over arrays of sizes, and the noise is
+# predicted by sampling the empirical distribution of the relative residuals of the fit.
+
+# Feature of each kernel, same models than in linear_regression.py.
+FEATURES = {
+    'dgemm': lambda m, n, k: m*n*k,
+    'dtrsm': lambda m, n, k: m*n**2,
+}
+
+NB_QUANTILES = 101
+
+class ModelError(Exception):
+    pass
+
+class Model:
+    def __init__(self, kernel, intercept, slope, residual_quantiles, rsquared=None, nb_samples=None):
+        if kernel not in FEATURES:
+            raise ModelError('Unknown kernel %s, the possible choices are %s.' % (kernel, list(FEATURES)))
+        self.kernel = kernel
+        self.feature = FEATURES[kernel]
+        self.intercept = intercept
+        self.slope = slope
+        self.residual_quantiles = numpy.asarray(residual_quantiles, dtype=numpy.float64)
+        self.probabilities = numpy.linspace(0, 1, len(self.residual_quantiles))
+        self.rsquared = rsquared
+        self.nb_samples = nb_samples
+
+    @classmethod
+    def from_fit(cls, kernel, intercept, slope, fitted, residuals, rsquared=None):
+        '''Build a model from the coefficients and the residuals of a fit, the residuals are kept relative to the prediction.'''
+        fitted = numpy.asarray(fitted, dtype=numpy.float64)
+        residuals = numpy.asarray(residuals, dtype=numpy.float64)
+        valid = fitted > 0
+        if not valid.any():
+            raise ModelError('No positive prediction, cannot compute the relative residuals.')
+        relative = residuals[valid] / fitted[valid]
+        quantiles = numpy.quantile(relative, numpy.linspace(0, 1, NB_QUANTILES))
+        return cls(kernel, float(intercept), float(slope), quantiles, rsquared, len(residuals))
+
+    @classmethod
+    def from_regression(cls, kernel, reg):
+        '''Build a model from a statsmodels fit of linear_regression.get_reg.'''
+        intercept, slope = reg.params.values
+        return cls.from_fit(kernel, intercept, slope, reg.fittedvalues, reg.resid, float(reg.rsquared))
+
+    def to_dict(self):
+        return {
+            'kernel': self.kernel,
+            'intercept': self.intercept,
+            'slope': self.slope,
+            'residual_quantiles': list(self.residual_quantiles),
+            'rsquared': self.rsquared,
+            'nb_samples': self.nb_samples,
+        }
+
+    def predict(self, m, n, k=0):
+        '''Expected time, the sizes can be numbers or numpy arrays.'''
+        m = numpy.asarray(m, dtype=numpy.float64)
+        n = numpy.asarray(n, dtype=numpy.float64)
+        k = numpy.asarray(k, dtype=numpy.float64)
+        return self.intercept + self.slope*self.feature(m, n, k)
+
+    def sample(self, m, n, k=0, rng=None):
+        '''Random times, with the distribution of the residuals of the fit (inverse transform sampling).'''
+        prediction = self.predict(m, n, k)
+        rng = rng or numpy.random.default_rng()
+        u = rng.random(prediction.shape)
+        return prediction * (1 + numpy.interp(u, self.probabilities, self.residual_quantiles))
+
+class Registry:
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.models = {}
+        self.metadata = {}
+        if filename is not None and os.path.isfile(filename):
+            with open(filename) as f:
+                content = json.load(f)
+            for entry in content['models']:
+                key = self.key(entry['host'], entry['lib'], entry['nb_threads'], entry['kernel'])
+                self.models[key] = Model(**entry['model'])
+                self.metadata[key] = entry['metadata']
+
+    @staticmethod
+    def key(host, lib, nb_threads, kernel):
+        return (host, lib, int(nb_threads), kernel)
+
+    def add(self, host, lib, nb_threads, model, **metadata):
+        key = self.key(host, lib, nb_threads, model.kernel)
+        self.models[key] = model
+        self.metadata[key] = dict(metadata, date=time.strftime('%Y/%m/%d %H:%M:%S'))
+
+    def get(self, host, lib, nb_threads, kernel):
+        try:
+            return self.models[self.key(host, lib, nb_threads, kernel)]
+        except KeyError:
+            raise ModelError('No model for host %s, lib %s, %s threads and kernel %s.' % (host, lib, nb_threads, kernel))
+
+    def __len__(self):
+        return len(self.models)
+
+    def save(self, filename=None):
+        if filename is not None:
+            self.filename = filename
+        entries = []
+        for (host, lib, nb_threads, kernel), model in sorted(self.models.items()):
+            entries.append({'host': host, 'lib': lib, 'nb_threads': nb_threads, 'kernel': kernel,
+                            'model': model.to_dict(), 'metadata': self.metadata[(host, lib, nb_threads, kernel)]})
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({'models': entries}, f, indent=2)
+        os.replace(tmp_filename, self.filename)
+
+def size_parser(string):
+    return numpy.array([int(v) for v in string.split(',')])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Predict the time of dgemm/dtrsm calls with the models of a registry (see linear_regression.py --save).')
+    parser.add_argument('registry', type=str, help='Registry file.')
+    parser.add_argument('--host', type=str, required=True, help='Host of the model.')
+    parser.add_argument('--lib', type=str, required=True, help='Library of the model.')
+    parser.add_argument('-np', '--nb_threads', type=int, default=1, help='Number of threads of the model.')
+    parser.add_argument('--kernel', type=str, choices=list(FEATURES), required=True, help='Kernel of the model.')
+    parser.add_argument('-m', type=size_parser, required=True, help='Comma-separated values of m.')
+    parser.add_argument('-n', type=size_parser, required=True, help='Comma-separated values of n.')
+    parser.add_argument('-k', type=size_parser, default=numpy.zeros(1), help='Comma-separated values of k (dgemm only).')
+    parser.add_argument('--nb_samples', type=int, default=0, help='Also print the given number of random samples of each time.')
+    args = parser.parse_args()
+    registry = Registry(args.registry)
+    try:
+        model = registry.get(args.host, args.lib, args.nb_threads, args.kernel)
+    except ModelError as e:
+        sys.exit(str(e))
+    m, n, k = numpy.broadcast_arrays(args.m, args.n, args.k)
+    prediction = model.predict(m, n, k)
+    rng = numpy.random.default_rng()
+    for i in range(len(prediction)):
+        samples = ['%g' % t for t in model.sample(numpy.full(args.nb_samples, m[i]), n[i], k[i], rng)]
+        print('m=%d n=%d k=%d: %g %s' % (m[i], n[i], k[i], prediction[i], ' '.join(samples)))
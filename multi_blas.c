@@ -0,0 +1,233 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <time.h>
+#include <assert.h>
+#include <string.h>
+#include <omp.h>
+#include "common_matrix.h"
+#ifdef LIKWID_PERFMON
+#include <likwid.h>
+#endif
+#ifdef USE_NAIVE
+#error "The multi-kernel harness requires a BLAS library."
+#endif
+#ifdef USE_MKL
+#include <mkl.h>
+#else
+#include <cblas.h>
+#endif
+
+// Repeated calls to a single BLAS kernel, with the time of each call (see BlasKernel in experiment.py).
+// The calls are made in column-major mode, the vectors are stored in B (x) and C (y) with an increment of 1:
+//  - dgemm, sgemm: C = C + op(A)×op(B), op(A) is m×k, op(B) is k×n, C is m×n
+//  - dtrsm: X×op(A) = B, A is n×n (lower triangular, unit diagonal), B is m×n (like in HPL and dtrsm_test)
+//  - dgemv: y = y + op(A)×x, A is m×n
+//  - daxpy: y = y + x, x and y have n elements
+//  - dsyrk: C = C + op(A)×op(A)^T, op(A) is n×k, C is n×n (lower part)
+
+enum kernel {DGEMM, SGEMM, DTRSM, DGEMV, DAXPY, DSYRK, NB_KERNELS};
+static const char *kernel_names[NB_KERNELS] = {"dgemm", "sgemm", "dtrsm", "dgemv", "daxpy", "dsyrk"};
+
+struct call {
+    enum kernel kernel;
+    int m, n, k;
+    int lead[3];
+    int trans_A, trans_B;
+};
+
+void syntax(char *exec_name) {
+    fprintf(stderr, "Syntax: %s <kernel> <nb_calls> <m> <n> <k> <lead_A> <lead_B> <lead_C> <trans_A> <trans_B> [output_file]\n", exec_name);
+    fprintf(stderr, "The kernel is one of dgemm, sgemm, dtrsm, dgemv, daxpy and dsyrk, the transposes are N or T.\n");
+    fprintf(stderr, "Each line of the output gives the duration and the start date (CLOCK_MONOTONIC) of a call.\n");
+    exit(1);
+}
+
+#ifdef LIKWID_PERFMON
+FILE *likwid_outfile;
+#endif
+
+// Number of rows and columns of the buffers A, B and C (0×0 when unused), the vectors are single columns.
+void get_shapes(struct call *c, int rows[3], int cols[3]) {
+    memset(rows, 0, 3*sizeof(int));
+    memset(cols, 0, 3*sizeof(int));
+    switch(c->kernel) {
+        case DGEMM:
+        case SGEMM:
+            rows[0] = c->trans_A ? c->k : c->m; cols[0] = c->trans_A ? c->m : c->k;
+            rows[1] = c->trans_B ? c->n : c->k; cols[1] = c->trans_B ? c->k : c->n;
+            rows[2] = c->m;                     cols[2] = c->n;
+            break;
+        case DTRSM:
+            rows[0] = c->n; cols[0] = c->n;
+            rows[1] = c->m; cols[1] = c->n;
+            break;
+        case DGEMV:
+            rows[0] = c->m;                     cols[0] = c->n;
+            rows[1] = c->trans_A ? c->m : c->n; cols[1] = 1;
+            rows[2] = c->trans_A ? c->n : c->m; cols[2] = 1;
+            break;
+        case DAXPY:
+            rows[1] = c->n; cols[1] = 1;
+            rows[2] = c->n; cols[2] = 1;
+            break;
+        case DSYRK:
+            rows[0] = c->trans_A ? c->k : c->n; cols[0] = c->trans_A ? c->n : c->k;
+            rows[2] = c->n;                     cols[2] = c->n;
+            break;
+        default:
+            assert(0);
+    }
+}
+
+int parse_trans(char *arg, int *trans) {
+    if(strcmp(arg, "N") == 0)
+        *trans = 0;
+    else if(strcmp(arg, "T") == 0)
+        *trans = 1;
+    else
+        return 0;
+    return 1;
+}
+
+int read_call(char **argv, struct call *call) {
+    int kernel;
+    for(kernel = 0; kernel < NB_KERNELS; kernel++) {
+        if(strcmp(argv[0], kernel_names[kernel]) == 0)
+            break;
+    }
+    if(kernel == NB_KERNELS)
+        return 0;
+    call->kernel = kernel;
+    call->m = atoi(argv[1]);
+    call->n = atoi(argv[2]);
+    call->k = atoi(argv[3]);
+    for(int i = 0; i < 3; i++)
+        call->lead[i] = atoi(argv[4+i]);
+    if(!parse_trans(argv[7], &call->trans_A) || !parse_trans(argv[8], &call->trans_B))
+        return 0;
+    int rows[3], cols[3];
+    get_shapes(call, rows, cols);
+    for(int i = 0; i < 3; i++) {
+        if(cols[i] > 0 && (rows[i] <= 0 || call->lead[i] < rows[i]))
+            return 0;
+    }
+    return 1;
+}
+
+void run_call(struct call *c, void *A, void *B, void *C) {
+    CBLAS_TRANSPOSE trans_A = c->trans_A ? CblasTrans : CblasNoTrans;
+    CBLAS_TRANSPOSE trans_B = c->trans_B ? CblasTrans : CblasNoTrans;
+    switch(c->kernel) {
+        case DGEMM:
+            cblas_dgemm(CblasColMajor, trans_A, trans_B, c->m, c->n, c->k, 1., A, c->lead[0], B, c->lead[1], 1., C, c->lead[2]);
+            break;
+        case SGEMM:
+            cblas_sgemm(CblasColMajor, trans_A, trans_B, c->m, c->n, c->k, 1.f, A, c->lead[0], B, c->lead[1], 1.f, C, c->lead[2]);
+            break;
+        case DTRSM:
+            cblas_dtrsm(CblasColMajor, CblasRight, CblasLower, trans_A, CblasUnit, c->m, c->n, 1., A, c->lead[0], B, c->lead[1]);
+            break;
+        case DGEMV:
+            cblas_dgemv(CblasColMajor, trans_A, c->m, c->n, 1., A, c->lead[0], B, 1, 1., C, 1);
+            break;
+        case DAXPY:
+            cblas_daxpy(c->n, 1., B, 1, C, 1);
+            break;
+        case DSYRK:
+            cblas_dsyrk(CblasColMajor, CblasLower, trans_A, c->n, c->k, 1., A, c->lead[0], 1., C, c->lead[2]);
+            break;
+        default:
+            assert(0);
+    }
+}
+
+void run_calls(struct call *c, void *A, void *B, void *C, int nb_calls, FILE *outfile) {
+    struct timespec before;
+    struct timespec after;
+
+    for(int i = 0; i < nb_calls; i++) {
+#ifdef LIKWID_PERFMON
+        #pragma omp parallel
+        {
+            LIKWID_MARKER_START(kernel_names[c->kernel]);
+        }
+#endif
+        clock_gettime(CLOCK_MONOTONIC, &before);
+        run_call(c, A, B, C);
+#ifdef LIKWID_PERFMON
+// See https://github.com/RRZE-HPC/likwid/issues/131 for the discussion about cumulative values.
+        #pragma omp parallel
+        {
+            LIKWID_MARKER_STOP(kernel_names[c->kernel]);
+            int nevents = 0; // No need to fill the events array, so nevents is set to 0
+            double time;
+            int count;
+            LIKWID_MARKER_GET(kernel_names[c->kernel], &nevents, NULL, &time, &count);
+            int my_thread_id = omp_get_thread_num();
+            for(int nthread = 0; nthread < omp_get_num_threads(); nthread++) {
+                if(my_thread_id == nthread) {
+                    fprintf(likwid_outfile, "%d,%f,%d,%d", i, time, my_thread_id,
+                        likwid_getProcessorId());
+                    for (int ev = 0; ev < perfmon_getNumberOfEvents(0); ev++) {
+                        fprintf(likwid_outfile, ",%f", perfmon_getLastResult(0, ev, nthread));
+                    }
+                    fprintf(likwid_outfile, "\n");
+                }
+                #pragma omp barrier
+            }
+        }
+#endif
+        clock_gettime(CLOCK_MONOTONIC, &after);
+        double total_time = (after.tv_sec-before.tv_sec) + 1e-9*(after.tv_nsec-before.tv_nsec);
+        // nanosecond precision, the calls to the level 1 and 2 kernels can be very short
+        fprintf(outfile, "%.9f %.9f\n", total_time, before.tv_sec + 1e-9*before.tv_nsec);
+    }
+}
+
+int main(int argc, char* argv[]) {
+    if (argc != 11 && argc != 12)
+        syntax(argv[0]);
+    struct call call;
+    int nb_calls = atoi(argv[2]);
+    argv[2] = argv[1]; // the kernel, followed by the parameters of the call
+    if(nb_calls <= 0 || !read_call(argv+2, &call))
+        syntax(argv[0]);
+    FILE *outfile = stdout;
+    if(argc == 12 && (outfile = fopen(argv[11], "w")) == NULL) {
+        perror(argv[11]);
+        exit(1);
+    }
+    size_t element_size = call.kernel == SGEMM ? sizeof(float) : sizeof(double);
+    int rows[3], cols[3];
+    get_shapes(&call, rows, cols);
+    void *buffers[3];
+    for(int i = 0; i < 3; i++) // the unused buffers are allocated with a single element, to keep the code simple
+        buffers[i] = allocate_buffer(cols[i] > 0 ? (size_t)call.lead[i]*cols[i]*element_size : element_size);
+
+#ifdef LIKWID_PERFMON
+    char *likwid_filename = getenv("LIKWID_FILENAME");
+    if(likwid_filename == NULL)
+        likwid_outfile = stdout;
+    else
+        likwid_outfile = fopen(likwid_filename, "w");
+    LIKWID_MARKER_INIT;
+    #pragma omp parallel
+    {
+        LIKWID_MARKER_THREADINIT;
+        LIKWID_MARKER_REGISTER(kernel_names[call.kernel]);
+    }
+    assert(perfmon_getNumberOfGroups() == 1); // we do not handle the multi-group case (yet?)
+#endif
+    run_calls(&call, buffers[0], buffers[1], buffers[2], nb_calls, outfile);
+
+    if(outfile != stdout)
+        fclose(outfile);
+    for(int i = 0; i < 3; i++)
+        free_buffer(buffers[i]);
+#ifdef LIKWID_PERFMON
+    LIKWID_MARKER_CLOSE;
+    if(likwid_outfile != stdout)
+        fclose(likwid_outfile);
+#endif
+    return 0;
+}
@@ -9,46 +9,22 @@
 #include <sched.h>
 #include "common_matrix.h"
 
+#define MAX_LINE_SIZE 4096
+
 void syntax(char *exec_name) {
     fprintf(stderr, "Syntax: %s <nb_calls> <size> [output_file]\n", exec_name);
+    fprintf(stderr, "        %s --server\n", exec_name);
+    fprintf(stderr, "In server mode, the commands are read on the standard input, one per line: <nb_calls> <size> <nb_threads> <output_file>\n");
+    fprintf(stderr, "The matrices are kept between two commands with the same size. The answer to each command is \"done\" or \"error\".\n");
+    fprintf(stderr, "Each line of the output gives the duration and the start date (CLOCK_MONOTONIC) of a call.\n");
     exit(1);
 }
 
-int main(int argc, char* argv[]) {
-    if (argc != 3 && argc != 4)
-        syntax(argv[0]);
-
-    int nb_calls = atoi(argv[1]);
-    int size    = atoi(argv[2]);
-    FILE *outfile;
-    if(argc == 3)
-        outfile = stdout;
-    else
-        outfile = fopen(argv[3], "w");
-    if(size <= 0 || nb_calls <= 0)
-        syntax(argv[0]);
-    double *A = allocate_matrix(size);
-    double *B = allocate_matrix(size);
-    double *C = allocate_matrix(size);
-
-    double alpha = 1.;
-    double beta = 1.;
-
 #ifdef LIKWID_PERFMON
-    char *likwid_filename = getenv("LIKWID_FILENAME");
-    FILE *likwid_outfile;
-    if(likwid_filename == NULL)
-        likwid_outfile = stdout;
-    else
-        likwid_outfile = fopen(likwid_filename, "w");
-    LIKWID_MARKER_INIT;
-    #pragma omp parallel
-    {
-        LIKWID_MARKER_THREADINIT;
-        LIKWID_MARKER_REGISTER("perf_dgemm");
-    }
-    assert(perfmon_getNumberOfGroups() == 1); // we do not handle the multi-group case (yet?)
+FILE *likwid_outfile;
 #endif
+
+void run_calls(double *A, double *B, double *C, int size, int nb_calls, FILE *outfile) {
     struct timespec before;
     struct timespec after;
 
@@ -86,8 +62,89 @@ int main(int argc, char* argv[]) {
 #endif
         clock_gettime(CLOCK_MONOTONIC, &after);
         double total_time = (after.tv_sec-before.tv_sec) + 1e-9*(after.tv_nsec-before.tv_nsec);
-        fprintf(outfile, "%f\n", total_time);
+        fprintf(outfile, "%f %f\n", total_time, before.tv_sec + 1e-9*before.tv_nsec); // duration and start date of the call
+    }
+}
+
+// Resident mode: the process (and thus the BLAS library, the OpenMP thread pool and the matrices) is kept between the runs.
+int server(void) {
+#ifdef LIKWID_PERFMON
+    fprintf(stderr, "Error: the server mode is not supported with Likwid.\n");
+    return 1;
+#endif
+    char line[MAX_LINE_SIZE];
+    char filename[MAX_LINE_SIZE];
+    double *A = NULL, *B = NULL, *C = NULL;
+    int current_size = 0;
+    while(fgets(line, MAX_LINE_SIZE, stdin) != NULL) {
+        int nb_calls, size, nb_threads;
+        FILE *outfile;
+        if(sscanf(line, "%d %d %d %4095s", &nb_calls, &size, &nb_threads, filename) != 4 ||
+                nb_calls <= 0 || size <= 0 || nb_threads <= 0 || (outfile = fopen(filename, "w")) == NULL) {
+            printf("error\n");
+            fflush(stdout);
+            continue;
+        }
+        if(size != current_size) {
+            if(current_size > 0) {
+                free_matrix(A);
+                free_matrix(B);
+                free_matrix(C);
+            }
+            A = allocate_matrix(size);
+            B = allocate_matrix(size);
+            C = allocate_matrix(size);
+            current_size = size;
+        }
+        set_nb_threads(nb_threads);
+        run_calls(A, B, C, size, nb_calls, outfile);
+        fclose(outfile);
+        printf("done\n");
+        fflush(stdout);
+    }
+    if(current_size > 0) {
+        free_matrix(A);
+        free_matrix(B);
+        free_matrix(C);
+    }
+    return 0;
+}
+
+int main(int argc, char* argv[]) {
+    if (argc == 2 && strcmp(argv[1], "--server") == 0)
+        return server();
+    if (argc != 3 && argc != 4)
+        syntax(argv[0]);
+
+    int nb_calls = atoi(argv[1]);
+    int size    = atoi(argv[2]);
+    FILE *outfile;
+    if(argc == 3)
+        outfile = stdout;
+    else
+        outfile = fopen(argv[3], "w");
+    if(size <= 0 || nb_calls <= 0)
+        syntax(argv[0]);
+    double *A = allocate_matrix(size);
+    double *B = allocate_matrix(size);
+    double *C = allocate_matrix(size);
+
+#ifdef LIKWID_PERFMON
+    char *likwid_filename = getenv("LIKWID_FILENAME");
+    if(likwid_filename == NULL)
+        likwid_outfile = stdout;
+    else
+        likwid_outfile = fopen(likwid_filename, "w");
+    LIKWID_MARKER_INIT;
+    #pragma omp parallel
+    {
+        LIKWID_MARKER_THREADINIT;
+        LIKWID_MARKER_REGISTER("perf_dgemm");
     }
+    assert(perfmon_getNumberOfGroups() == 1); // we do not handle the multi-group case (yet?)
+#endif
+    load_blas_library(); // not in the timing of the first call
+    run_calls(A, B, C, size, nb_calls, outfile);
 
     if(outfile != stdout)
         fclose(outfile);
@@ -1,13 +1,17 @@
 #! /usr/bin/env python3
 
 import argparse
+import os
 from experiment import *
+from design import Factor, Schedule, DesignError
+from metrics import SessionMetrics, MetricsServer
 
-def add_wrapper(cls, enabled, wrappers, *args):
+def add_wrapper(cls, enabled, wrappers, factors, *args):
     if enabled == 'yes':
         wrappers.append(cls(*args))
     elif enabled == 'random':
         wrappers.append(DisableWrapper(cls(*args)))
+        factors.append(Factor(cls.__name__, [False, True]))
     else:
         assert enabled == 'no'
 
@@ -17,50 +21,248 @@ if __name__ == '__main__':
     parser.add_argument('--nb_runs', type=int,
             default=50, help='Number of experiment to run.')
     parser.add_argument('--nb_calls', type=int,
-            default=50, help='Number of calls to dgemm for each run.')
-    parser.add_argument('--size', type=int,
-            default=1024, help='Size of the matrix.").')
-    parser.add_argument('--block_size', type=int,
-            default=128, help='Block size of the matrix for computations.").')
+            default=50, help='Number of calls to the kernel for each run.')
+    parser.add_argument('--size', type=int, nargs='+',
+            default=[1024], help='Size of the matrix (several values can be given with a design of experiments).')
+    parser.add_argument('--block_size', type=int, nargs='+',
+            default=[128], help='Block size of the matrix for computations (several values can be given with a design of experiments).')
+    parser.add_argument('--tuned', action='store_true',
+            help='With the naive library, use the block size, loop order and collapse tuned by autotune.py for the size and the number of threads (instead of --block_size).')
+    parser.add_argument('--dlopen', action='store_true',
+            help='Build a single multi_dgemm which loads the BLAS library at runtime. The libraries given with --lib are then randomly chosen for each run '
+            '(or are a factor of the design of experiments), so they are interleaved in the same session.')
+    parser.add_argument('--kernel', type=str, choices=BlasKernel.kernels,
+            default=None, help='Call the given BLAS kernel with multi_blas instead of the square dgemm of multi_dgemm (the shape is given by --dims, --lead_dims and --trans).')
+    parser.add_argument('--dims', type=int, nargs=3, metavar=('M', 'N', 'K'),
+            default=[1024, 1024, 1024], help='With --kernel, the dimensions of the call (see multi_blas.c).')
+    parser.add_argument('--lead_dims', type=int, nargs=3, metavar=('LEAD_A', 'LEAD_B', 'LEAD_C'),
+            default=None, help='With --kernel, the leading dimensions of the matrices (default: the smallest valid ones).')
+    parser.add_argument('--trans', type=str, choices=['NN', 'NT', 'TN', 'TT'],
+            default='NN', help='With --kernel, transpose A and/or B.')
     parser.add_argument('-np', '--nb_threads', type=int,
             default=1, help='Number of threads used to perform the operation (may not be supported by all BLAS libraries).')
-    parser.add_argument('--likwid', type=str, choices=Likwid.get_available_groups(), nargs='+',
-            default=None, help='Measure the given Likwid event. When used, the option --thread_mapping is automatically enabled.')
+    parser.add_argument('--likwid', type=str, nargs='+',
+            default=None, help='Measure the given Likwid event (the available groups are listed by "likwid-perfctr -a"). When used, the option --thread_mapping is automatically enabled.')
     parser.add_argument('--thread_mapping', type=str, choices=['yes', 'no', 'random'],
             default='no', help='Map each thread to a specific core.')
+    parser.add_argument('--memory_policy', type=str, nargs='+',
+            default=['localalloc'], help='Numactl memory policies used with the thread mapping (e.g. localalloc, interleave=all, membind=0), randomly chosen for each run.')
+    parser.add_argument('--allocation', type=str, nargs='+', choices=MemoryAllocation.modes,
+            default=['malloc'], help='Allocation modes of the matrices, randomly chosen for each run.')
     parser.add_argument('--scheduler', type=str, choices=['yes', 'no', 'random'],
             default='no', help='Use a FIFO scheduling policy.')
     parser.add_argument('--cpu_power', type=str, choices=['yes', 'no', 'random'],
             default='no', help='Force a high frequency for the CPU.')
     parser.add_argument('--hyperthreading', type=str, choices=['yes', 'no', 'random'],
             default='no', help='Remove the hyperthreading.')
+    parser.add_argument('--quiescence', type=str, choices=['yes', 'no', 'random'],
+            default='no', help='Wait before each run until the temperature, the load and the frequency of the CPUs have settled.')
+    parser.add_argument('--max_temperature', type=float,
+            default=None, help='With --quiescence, the maximal temperature of the hottest core, in °C (default: not checked).')
+    parser.add_argument('--max_load', type=float,
+            default=0.05, help='With --quiescence, the maximal CPU load (between 0 and 1).')
+    parser.add_argument('--max_frequency_change', type=float,
+            default=None, help='With --quiescence, the maximal relative change of the mean CPU frequency between two checks (default: not checked).')
+    parser.add_argument('--quiescence_timeout', type=float,
+            default=60, help='With --quiescence, start the run anyway after this number of seconds.')
+    parser.add_argument('--rapl', action='store_true',
+            help='Measure the energy of each call with RAPL (package and DRAM domains of /sys/class/powercap).')
+    parser.add_argument('--rapl_period', type=float,
+            default=0.01, help='Sampling period of the RAPL counters during a run, in seconds (0 to only read them before and after the run).')
+    parser.add_argument('--perf_record', type=str, choices=['yes', 'no', 'random'],
+            default='no', help='Sample the runs with perf record and keep the hottest symbols of the runs having an outlier call.')
+    parser.add_argument('--perf_frequency', type=int,
+            default=99, help='With --perf_record, the sampling frequency, in Hz.')
+    parser.add_argument('--outlier_threshold', type=float,
+            default=1.5, help='With --perf_record, a call is an outlier when it is this number of times slower than the median call of its run.')
+    parser.add_argument('--interference', type=str, nargs='+', choices=Interference.modes,
+            default=None, help='Background load during the runs, randomly chosen among the given modes for each run (see interference.c).')
+    parser.add_argument('--interference_cores', type=str,
+            default=None, help='With --interference, the cores of the load processes, e.g. "6,7" or "siblings:0-3" for the SMT siblings of the cores 0 to 3.')
+    parser.add_argument('--interference_intensity', type=float, nargs='+',
+            default=[1.0], help='With --interference, the fraction of the time the load is active, randomly chosen among the given values for each run.')
+    parser.add_argument('--noise_probe', type=str,
+            default=None, help='Measure the OS noise during the runs with fixed work quantum probes on these cores (e.g. "7", "siblings:0-3", or "idle" for a core not used by dgemm).')
+    parser.add_argument('--noise_quantum', type=float,
+            default=10, help='With --noise_probe, the duration of a work quantum, in µs.')
+    parser.add_argument('--noise_threshold', type=float,
+            default=1, help='With --noise_probe, a quantum is a detour when it lasts this number of µs more than the fastest one.')
+    parser.add_argument('--barrier', type=str,
+            default=os.environ.get(Barrier.environment_variable), help='Start each run at the same instant as the other nodes, with the coordinator at HOST[:PORT] (see barrier.py). '
+            'All the nodes must do the same number of runs.')
+    parser.add_argument('--barrier_name', type=str,
+            default=None, help='With --barrier, the name of this node for the coordinator (default: hostname).')
+    parser.add_argument('--design', type=str, choices=['random', 'full', 'fractional', 'lhs', 'blocked'],
+            default='random', help='Design of experiments. With "random", the "random" programs are enabled with a coin flip for each run. '
+            'Otherwise, a schedule is generated for all the "random" programs, Likwid groups and the given sizes, block sizes and libraries.')
+    parser.add_argument('--fraction', type=int,
+            default=1, help='Number of generated factors for a fractional factorial design.')
+    parser.add_argument('--minimize_transitions', action='store_true',
+            help='Reorder the runs of the schedule to group the runs sharing the same wrapper state (each block is reordered independently). '
+            'Requires --design=blocked with several replicates, so that the levels are still interleaved over time.')
+    parser.add_argument('--keep_state', action='store_true',
+            help='Only do the setup and teardown of a wrapper when its state changes between two consecutive runs.')
+    parser.add_argument('--resident', action='store_true',
+            help='Keep multi_dgemm running between the runs (server mode). Not compatible with Likwid, Time, Perf and Intercoolr. '
+            'The server is restarted when its command line prefix or its environment changes (e.g. with --scheduler, --thread_mapping or --allocation), see the column server_start.')
+    parser.add_argument('--cold_start', type=str, choices=['yes', 'no', 'random'],
+            default='no', help='With --resident, restart the server for each run ("random" requires a design of experiments).')
+    parser.add_argument('--instrument', action='store_true',
+            help='Record the duration of each phase of each run (and of each wrapper) in a file <csv_file>_timings.csv.')
+    parser.add_argument('--profile', type=str, choices=['cprofile', 'tracemalloc'],
+            default=None, help='With --instrument, also profile each phase (cProfile dumps are written in <csv_file>_profiles).')
+    parser.add_argument('--metrics_port', type=int,
+            default=None, help='Publish live summaries of the runs (progress, remaining time, call times of each configuration) on this HTTP port, in the format of Prometheus.')
+    parser.add_argument('--metrics_host', type=str,
+            default='127.0.0.1', help='With --metrics_port, the address to listen on (e.g. 0.0.0.0 for all the interfaces).')
+    parser.add_argument('--schedule', type=str,
+            default=None, help='Path of the schedule file. If the file exists, the experiment is resumed from it.')
     required_named = parser.add_argument_group('required named arguments')
     required_named.add_argument('--csv_file', type = str,
             required=True, help='Path of the CSV file for the results.')
-    required_named.add_argument('--lib', type = str,
-            required=True, help='Library to use.',
-            choices = ['mkl', 'mkl2', 'atlas', 'openblas', 'naive'])
+    required_named.add_argument('--lib', type = str, nargs='+',
+            required=True, help='Library to use (several values can be given with a design of experiments, netlib requires --dlopen).',
+            choices = ['mkl', 'mkl2', 'atlas', 'openblas', 'netlib', 'naive'])
     args = parser.parse_args()
+    if args.design == 'random' and args.schedule is None and max(len(args.size), len(args.block_size), 1 if args.dlopen else len(args.lib)) > 1:
+        parser.error('several sizes, block sizes or libraries require a design of experiments (or --dlopen for the libraries).')
+    if args.tuned and (len(args.block_size) > 1 or args.lib != ['naive'] or args.kernel is not None):
+        parser.error('option --tuned requires the naive library (alone) and replaces --block_size.')
+    if args.dlopen and ('naive' in args.lib or args.kernel is not None):
+        parser.error('option --dlopen does not support the naive library nor --kernel.')
+    if not args.dlopen and 'netlib' in args.lib:
+        parser.error('the netlib library is only available with --dlopen.')
+    if args.resident and args.likwid is not None:
+        parser.error('the resident mode is not supported with Likwid.')
+    if args.resident and args.thread_mapping != 'no' and args.nb_threads == 1:
+        parser.error('the resident mode is not supported with --thread_mapping and a single thread (bound to a random core for each run).')
+    if args.resident and args.design == 'random' and ('random' in (args.scheduler, args.thread_mapping) or len(args.allocation) > 1 or
+            (args.thread_mapping != 'no' and len(args.memory_policy) > 1)):
+        parser.error('with the resident mode, the server is restarted when --scheduler, --thread_mapping, --allocation or --memory_policy change, '
+                'they require a design of experiments to vary.')
+    if args.kernel is not None:
+        if args.resident:
+            parser.error('the resident mode is not supported with --kernel.')
+        if 'naive' in args.lib:
+            parser.error('the naive library is not supported with --kernel.')
+        if len(args.size) > 1 or len(args.block_size) > 1:
+            parser.error('several sizes or block sizes are not supported with --kernel.')
+    if args.perf_record != 'no' and (args.resident or args.likwid is not None):
+        parser.error('option --perf_record is not supported with --resident nor --likwid.')
+    if args.interference is not None and args.interference_cores is None:
+        parser.error('option --interference requires --interference_cores.')
+    if args.cold_start != 'no' and not args.resident:
+        parser.error('option --cold_start requires --resident.')
+    if args.cold_start == 'random' and args.design == 'random':
+        parser.error('--cold_start=random requires a design of experiments.')
+    factors = []
+    if args.cold_start == 'random':
+        factors.append(Factor('cold_start', [False, True]))
+    for name in ['size', 'block_size', 'lib', 'allocation']:
+        levels = getattr(args, name)
+        if len(levels) > 1:
+            factors.append(Factor(name, levels))
+    if args.interference is not None:
+        for name, levels in [('interference', args.interference), ('interference_intensity', args.interference_intensity)]:
+            if len(levels) > 1:
+                factors.append(Factor(name, levels))
+    if args.kernel is None:
+        application = Dgemm(lib=args.lib[0], size=args.size[0], nb_calls=args.nb_calls, nb_threads=args.nb_threads, block_size=None if args.tuned else args.block_size[0],
+                likwid=args.likwid, resident=args.resident, cold_start=args.cold_start == 'yes', dlopen=args.lib if args.dlopen else None)
+    else:
+        try:
+            application = BlasKernel(args.kernel, lib=args.lib[0], nb_calls=args.nb_calls, nb_threads=args.nb_threads, m=args.dims[0], n=args.dims[1], k=args.dims[2],
+                    lead_A=args.lead_dims and args.lead_dims[0], lead_B=args.lead_dims and args.lead_dims[1], lead_C=args.lead_dims and args.lead_dims[2],
+                    trans_A=args.trans[0] == 'T', trans_B=args.trans[1] == 'T', likwid=args.likwid)
+        except HarnessError as e:
+            parser.error(str(e))
     wrappers=[
             CommandLine(),
             Date(),
             Platform(),
             CPU(),
-            Time(),
+            MemoryAllocation(args.allocation),
     ]
+    if not args.resident: # these wrappers measure the whole process
+        wrappers.append(Time())
     if args.likwid is None:
-        wrappers.extend([
-                Temperature(),
-                Perf(),
-                Intercoolr(),
-            ])
+        wrappers.append(Temperature())
+        if not args.resident:
+            # outside of perf stat, so that its counts do not include perf record
+            add_wrapper(PerfRecord, args.perf_record, wrappers, factors, application, args.perf_frequency, args.outlier_threshold)
+            wrappers.extend([
+                    Perf(),
+                    Intercoolr(),
+                ])
     else:
-        wrappers.append(get_likwid_instance(nb_threads=args.nb_threads, groups=args.likwid))
+        try:
+            wrappers.append(get_likwid_instance(nb_threads=args.nb_threads, groups=args.likwid))
+        except LikwidError as e:
+            parser.error(str(e))
+        if len(args.likwid) > 1:
+            factors.append(Factor('likwid_group', args.likwid))
     if args.likwid is None:
-        add_wrapper(ThreadMapping, args.thread_mapping, wrappers, args.nb_threads)
-    add_wrapper(Scheduler, args.scheduler, wrappers)
-    add_wrapper(CPUPower, args.cpu_power, wrappers)
-    add_wrapper(Hyperthreading, args.hyperthreading, wrappers)
+        add_wrapper(ThreadMapping, args.thread_mapping, wrappers, factors, args.nb_threads, args.memory_policy)
+        if args.thread_mapping != 'no' and len(args.memory_policy) > 1:
+            factors.append(Factor('memory_policy', args.memory_policy))
+    add_wrapper(Scheduler, args.scheduler, wrappers, factors)
+    add_wrapper(CPUPower, args.cpu_power, wrappers, factors)
+    add_wrapper(Hyperthreading, args.hyperthreading, wrappers, factors)
+    try:
+        add_wrapper(Quiescence, args.quiescence, wrappers, factors, args.max_temperature, args.max_load, args.max_frequency_change, args.quiescence_timeout)
+    except QuiescenceError as e:
+        parser.error(str(e))
+    # the loads and the probes are started after the quiescence, which would wait for the end of the load, and before
+    # the barrier, so that their startup (which waits for each process to be ready) does not delay the synchronized start
+    if args.interference is not None:
+        try:
+            wrappers.append(Interference(args.interference, args.interference_cores, args.interference_intensity))
+        except (InterferenceError, ValueError, OSError) as e:
+            parser.error(str(e))
+    if args.noise_probe is not None:
+        try:
+            wrappers.append(NoiseProbe(args.noise_probe, application, args.noise_quantum, args.noise_threshold))
+        except (NoiseProbeError, OSError) as e:
+            parser.error(str(e))
+    if args.barrier is not None: # last before the launch: the nodes start together, once their loads and probes are ready
+        from barrier import BarrierError
+        try:
+            wrappers.append(Barrier.from_address(args.barrier, args.barrier_name))
+        except (BarrierError, ValueError) as e:
+            parser.error(str(e))
+    if args.rapl: # after the quiescence and the barrier, the energy of the waits is not measured
+        wrappers.append(RAPL(application, args.rapl_period))
+
+    schedule = None
+    if args.schedule is not None and os.path.isfile(args.schedule):
+        schedule = Schedule.read(args.schedule)
+        print('Resuming schedule %s, %d runs remaining out of %d.' % (args.schedule, len(schedule.pending()), len(schedule)))
+    elif args.design != 'random':
+        schedule = Schedule.generate(args.design, factors, nb_runs=args.nb_runs, fraction=args.fraction)
+        if args.minimize_transitions:
+            # changing the library or the block size requires a compilation, unless the library is loaded at runtime
+            try:
+                schedule.minimize_transitions(costs={'size': 0, 'lib': 0 if args.dlopen else 10, 'block_size': 10})
+            except DesignError as e:
+                parser.error('option --minimize_transitions: %s' % e)
+        schedule.write(args.schedule or args.csv_file + '.schedule')
+
+    instrumentation = None
+    if args.instrument:
+        profile_dir = None
+        if args.profile == 'cprofile':
+            profile_dir = os.path.splitext(args.csv_file)[0] + '_profiles'
+            os.makedirs(profile_dir, exist_ok=True)
+        instrumentation = Instrumentation(profile=args.profile, profile_dir=profile_dir)
+
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = SessionMetrics()
+        try:
+            server = MetricsServer(metrics, args.metrics_port, args.metrics_host).start()
+        except OSError as e:
+            parser.error('Cannot listen on port %d: %s' % (args.metrics_port, e))
+        print('Metrics available at http://%s:%d/metrics' % (args.metrics_host, server.port))
 
-    exp = ExpEngine(application=Dgemm(lib=args.lib, size=args.size, nb_calls=args.nb_calls, nb_threads=args.nb_threads, block_size=args.block_size, likwid=args.likwid), wrappers=wrappers)
-    exp.run_all(nb_runs=args.nb_runs, filename=args.csv_file)
+    exp = ExpEngine(application=application, wrappers=wrappers, keep_state=args.keep_state, instrumentation=instrumentation, metrics=metrics)
+    exp.run_all(nb_runs=args.nb_runs, filename=args.csv_file, schedule=schedule)
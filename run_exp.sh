@@ -19,15 +19,17 @@ rm *.csv
 rm run_*.log
 
 for host in $*; do {	
-    run_command ${host} 'cd scripts/cblas_tests && python3 ./runner.py --csv_file /tmp/results_`hostname`.csv --lib openblas --dgemm -s 1024,1024 -n 50 -r 1 -np $(nproc --all) --stat'
-    scp root@${host}:/tmp/results\*.csv .
+    run_command ${host} 'rm -f /tmp/results.csv && cd scripts/cblas_tests && python3 ./runner.py --csv_file /tmp/results.csv --lib openblas --dgemm -s 1024,1024 -n 50 -r 1 -np $(nproc --all) --stat'
+    scp root@${host}:/tmp/results.csv results_${host}.csv
 }&
 done
 wait
 
-head -n 1 results_${1}.*.csv > results.csv
+# only the files of this experiment, a missing one is reported by ingest.py
+files=""
 for host in $*; do
-    tail -n +2 results_${host}.*.csv >> results.csv
+    files="${files} results_${host}.csv"
 done
+python3 ./ingest.py results.csv ${files}
 
 echo "Terminated."
@@ -8,10 +8,6 @@ import os
 import socket
 from multiprocessing import cpu_count
 from collections import namedtuple
-try:
-    import psutil
-except ImportError:
-    psutil = None
 import time
 import re
 from utils import run_command, compile_generic
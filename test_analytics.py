@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+import numpy
+import pandas
+from analytics import *
+from variability import variability
+
+class DispersionTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.default_rng(42)
+        nb_rows = 2000
+        self.df = pandas.DataFrame({
+            'hostname': rng.choice(['a', 'b'], nb_rows),
+            'size': rng.choice([64, 128, 256], nb_rows),
+            'time': rng.lognormal(0, 0.3, nb_rows),
+        })
+
+    def test_metrics(self):
+        result = dispersion(self.df, by=['hostname', 'size'])
+        self.assertEqual(len(result), 6)
+        for _, row in result.iterrows():
+            times = self.df[(self.df['hostname'] == row['hostname']) & (self.df['size'] == row['size'])]['time'].values
+            self.assertEqual(row['count'], len(times))
+            self.assertAlmostEqual(row['mean'], times.mean())
+            self.assertAlmostEqual(row['cv'], times.std(ddof=1)/times.mean())
+            self.assertAlmostEqual(row['range_mean'], variability(list(times)))
+            q1, median, q3, p99 = numpy.percentile(times, [25, 50, 75, 99])
+            self.assertAlmostEqual(row['median'], median)
+            self.assertAlmostEqual(row['iqr_median'], (q3-q1)/median)
+            self.assertAlmostEqual(row['p99_p50'], p99/median)
+
+    def test_bootstrap(self):
+        result = dispersion(self.df, by=['size'], nb_bootstrap=200, seed=1)
+        for _, row in result.iterrows():
+            self.assertLess(row['mean_low'], row['mean'])
+            self.assertGreater(row['mean_high'], row['mean'])
+            self.assertLess(row['cv_low'], row['cv_high'])
+
+    def test_empty_group(self):
+        self.df.loc[self.df['size'] == 128, 'time'] = numpy.nan
+        result = dispersion(self.df, by=['size'], nb_bootstrap=10, seed=1).set_index('size')
+        self.assertEqual(result.loc[128, 'count'], 0)
+        for name in ['mean', 'min', 'max', 'median', 'p99', 'mean_low', 'cv_high']:
+            self.assertTrue(numpy.isnan(result.loc[128, name]))
+            self.assertFalse(numpy.isnan(result.loc[64, name]))
+        self.df['time'] = numpy.nan
+        result = dispersion(self.df, by=['size'])
+        self.assertTrue(result['median'].isna().all())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import unittest
+import numpy
+import pandas
+from attribution import *
+
+class AttributionTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.default_rng(42)
+        nb_rows = 2000
+        slow = rng.random(nb_rows) < 0.05
+        self.df = pandas.DataFrame({
+            'run_index': numpy.arange(nb_rows) // 10,
+            'call_index': numpy.arange(nb_rows) % 10,
+            'size': rng.choice([64, 128], nb_rows),
+            'cpu-migrations': numpy.where(slow, rng.integers(5, 10, nb_rows), rng.integers(0, 3, nb_rows)),
+            'temperature': rng.normal(50, 2, nb_rows),
+            'cpubind': numpy.where(slow, 'no', rng.choice(['yes', 'no'], nb_rows)),
+        })
+        self.df['time'] = self.df['size'] * rng.uniform(0.99, 1.01, nb_rows) * numpy.where(slow, 2, 1)
+        self.slow = slow
+
+    def test_outliers(self):
+        df = flag_outliers(self.df, ['size'])
+        self.assertEqual(list(df['outlier']), list(self.slow))
+
+    def test_ranking(self):
+        df, ranking = attribute(self.df, by=['size'])
+        self.assertEqual(set(ranking['metric']), {'cpu-migrations', 'temperature', 'cpubind'})
+        self.assertEqual(list(ranking['metric'][:2]), ['cpu-migrations', 'cpubind'])
+        self.assertAlmostEqual(ranking['score'][0], 1)
+        self.assertIn('value over-represented in the outliers: no', list(ranking['detail']))
+        self.assertIn('outlier calls', text_report(df, ranking, ['size'], 10))
+
+    def test_threads(self):
+        df = pandas.concat([self.df.assign(thread_index=i, frequency=i) for i in range(4)])
+        df = collapse_threads(df)
+        self.assertEqual(len(df), len(self.df))
+        self.assertEqual(set(df['frequency']), {1.5})
+        self.assertEqual(set(df['cpubind']), {'yes', 'no'})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import unittest
+import tempfile
+from unittest import mock
+from autotune import *
+
+class AutotuneTest(unittest.TestCase):
+    def test_race(self):
+        speeds = {Variant(32, 'kij', False): 1.0, Variant(64, 'kij', False): 1.3, Variant(64, 'jki', True): 5.0, Variant(128, 'ikj', False): 1.02}
+        rng = random.Random(42)
+        runs = []
+        def run(binary, size, nb_calls, nb_threads):
+            self.assertEqual(nb_threads, 1)
+            runs.append((binary, nb_calls))
+            return [speeds[binary] * size * 1e-3 * rng.uniform(1, 1.01) for _ in range(nb_calls)]
+        binaries = {variant: variant for variant in speeds}
+        winner, times = race(binaries, 100, 1, target_time=1, min_rounds=2, max_rounds=10, run=run, rng=rng)
+        self.assertEqual(winner, Variant(32, 'kij', False))
+        nb_runs = {variant: sum(1 for binary, _ in runs if binary == variant) for variant in speeds}
+        self.assertEqual(nb_runs[Variant(64, 'jki', True)], 3) # calibration and the two first rounds only
+        self.assertGreater(nb_runs[Variant(128, 'ikj', False)], nb_runs[Variant(64, 'kij', False)])
+        self.assertEqual(len(times[Variant(64, 'jki', True)]), 2) # a run lasts about 1 s
+
+    def test_variant_set(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def fake_compile(exec_filename, lib, block_size, loop_order, collapse, output):
+                with open(output, 'w') as f:
+                    f.write('%d %s %s' % (block_size, loop_order, collapse))
+            variants = [Variant(32, 'kij', False), Variant(64, 'ikj', True)]
+            with mock.patch('autotune.compile_generic', side_effect=fake_compile) as compile_mock:
+                binaries = VariantSet(tmp_dir).build(variants, nb_jobs=2)
+                self.assertEqual(compile_mock.call_count, 2)
+                self.assertEqual(VariantSet(tmp_dir).build(variants + [Variant(16, 'kij', False)]), {**binaries, Variant(16, 'kij', False): VariantSet(tmp_dir).path(Variant(16, 'kij', False))})
+                self.assertEqual(compile_mock.call_count, 3) # the cached variants are not compiled again
+            with open(binaries[variants[1]]) as f:
+                self.assertEqual(f.read(), '64 ikj True')
+
+    def test_tuning_table(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'tuning', 'table.json')
+            table = TuningTable(filename)
+            self.assertIsNone(table.get(1024, 4))
+            table.set(1024, 4, Variant(64, 'ikj', True), 0.5)
+            table.set(1024, 4, Variant(64, 'ikj', False), 0.5, host='other')
+            table.save()
+            loaded = TuningTable(filename)
+        self.assertEqual(loaded.get(1024, 4), Variant(64, 'ikj', True))
+        self.assertEqual(loaded.get(1024, 4, host='other'), Variant(64, 'ikj', False))
+        self.assertIsNone(loaded.get(1024, 1))
+
+if __name__ == "__main__":
+    unittest.main()
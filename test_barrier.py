@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import time
+import tempfile
+import unittest
+import subprocess
+from barrier import *
+
+class BarrierTest(unittest.TestCase):
+    def start_agent(self, port, name, nb_barriers):
+        return subprocess.Popen([sys.executable, 'barrier.py', 'agent', '127.0.0.1', '--port', str(port), '--name', name,
+            '--nb_barriers', str(nb_barriers)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_synchronized_start(self):
+        nb_agents, nb_barriers = 3, 4
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'skew.csv')
+            coordinator = Coordinator(nb_agents, host='127.0.0.1', port=0, start_delay=0.1, output=output)
+            coordinator.start()
+            agents = [self.start_agent(coordinator.port, 'agent%d' % i, nb_barriers) for i in range(nb_agents)]
+            starts = []
+            for agent in agents:
+                stdout, stderr = agent.communicate(timeout=60)
+                self.assertEqual(agent.returncode, 0, stderr.decode())
+                starts.append([[float(v) for v in line.split()] for line in stdout.decode().splitlines()])
+            coordinator.join(10)
+            self.assertFalse(coordinator.thread.is_alive())
+            with open(output) as f:
+                skew = list(csv.DictReader(f))
+        for agent_starts in starts:
+            self.assertEqual(len(agent_starts), nb_barriers)
+            for date, offset, lateness in agent_starts:
+                self.assertLess(abs(offset), 0.01) # same clock
+                self.assertGreaterEqual(lateness, 0)
+        for barrier_index in range(nb_barriers):
+            dates = [agent_starts[barrier_index][0] for agent_starts in starts]
+            self.assertLess(max(dates) - min(dates), 0.05)
+        self.assertEqual(len(skew), nb_agents*nb_barriers)
+        self.assertEqual({row['agent'] for row in skew}, {'agent%d' % i for i in range(nb_agents)})
+        self.assertEqual(sorted({int(row['barrier_index']) for row in skew}), list(range(nb_barriers)))
+
+    def test_same_name(self):
+        coordinator = Coordinator(2, host='127.0.0.1', port=0, start_delay=0.05)
+        coordinator.start()
+        agents = [self.start_agent(coordinator.port, 'host', 2) for _ in range(2)]
+        for agent in agents:
+            stdout, stderr = agent.communicate(timeout=60)
+            self.assertEqual(agent.returncode, 0, stderr.decode())
+            self.assertEqual(len(stdout.decode().splitlines()), 2)
+        coordinator.join(10)
+        self.assertFalse(coordinator.thread.is_alive())
+        names = [name for name, _ in coordinator.agents]
+        self.assertEqual(names[0], 'host')
+        self.assertTrue(names[1].startswith('host:'))
+        self.assertEqual(len(coordinator.skew), 4)
+
+    def test_wait_for_slowest(self):
+        coordinator = Coordinator(2, host='127.0.0.1', port=0, start_delay=0.05)
+        coordinator.start()
+        agent = Agent('127.0.0.1', coordinator.port, 'fast')
+        slow = self.start_agent(coordinator.port, 'slow', 1)
+        start = time.time()
+        result = agent.wait() # the other agent has to start a Python interpreter
+        agent.close()
+        slow.communicate(timeout=60)
+        self.assertGreater(result['barrier_wait'], 0.05)
+        self.assertAlmostEqual(result['barrier_wait'], time.time() - start, delta=0.05)
+        self.assertEqual(set(result), {'barrier_wait', 'clock_offset', 'clock_delay', 'start_lateness'})
+
+    def test_abort(self):
+        coordinator = Coordinator(2, host='127.0.0.1', port=0)
+        coordinator.start()
+        agent = Agent('127.0.0.1', coordinator.port, 'alive')
+        failing = self.start_agent(coordinator.port, 'failing', 1)
+        failing.kill() # may be killed before connecting, then the coordinator waits for a second agent
+        failing.wait()
+        if len(coordinator.agents) < 2:
+            other = Agent('127.0.0.1', coordinator.port, 'failing')
+            other.connection.close()
+        with self.assertRaises(BarrierError):
+            agent.wait()
+        agent.close()
+        coordinator.join(10)
+
+if __name__ == "__main__":
+    unittest.main()
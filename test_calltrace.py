@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+import tempfile
+from calltrace import *
+
+class CallTraceTest(unittest.TestCase):
+    def test_numroc(self):
+        N, NB, P = 1000, 64, 3
+        self.assertEqual(sum(numroc(N, NB, p, P) for p in range(P)), N)
+        for p in range(P):
+            self.assertEqual(numroc(N, NB, p, P), sum(1 for i in range(N) if (i // NB) % P == p))
+
+    def test_hpl_single_process(self):
+        calls = hpl_trace(1000, 100)
+        self.assertEqual(len(calls), 18)
+        self.assertEqual(calls[0], Call('dtrsm', 900, 100, 0, 100, 900, 0))
+        self.assertEqual(calls[1], Call('dgemm', 900, 900, 100, 900, 900, 1000))
+        self.assertEqual(calls[-1], Call('dgemm', 100, 100, 100, 100, 100, 1000))
+
+    def test_hpl_grid(self):
+        N, NB, P, Q = 1000, 64, 2, 3
+        flops = 0
+        for p in range(P):
+            for q in range(Q):
+                for call in hpl_trace(N, NB, P, Q, (p, q)):
+                    if call.kernel == 'dgemm':
+                        flops += call.m*call.n*call.k
+        single = sum(call.m*call.n*call.k for call in hpl_trace(N, NB) if call.kernel == 'dgemm')
+        self.assertEqual(flops, single) # the trailing updates are split among the processes
+        with self.assertRaises(TraceError):
+            hpl_trace(N, NB, P, Q, (2, 0))
+
+    def test_read_write(self):
+        calls = hpl_trace(500, 64, 2, 2, (1, 1))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'trace.txt')
+            write_trace(calls, filename)
+            self.assertEqual(read_trace(filename), calls)
+            with open(filename, 'a') as f:
+                f.write('dgemm 1 2\n')
+            with self.assertRaises(TraceError):
+                read_trace(filename)
+
+if __name__ == "__main__":
+    unittest.main()
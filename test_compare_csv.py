@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import unittest
+import tempfile
+import numpy
+import pandas
+from compare_csv import *
+
+class BaselineIndexTest(unittest.TestCase):
+    def results(self, times, filename='new.csv'):
+        df = pandas.DataFrame({'size': [64, 128]*(len(times)//2), 'time': times, 'lib': 'openblas', 'git_hash': 'abc'})
+        df['index'] = range(1, len(df)+1)
+        df['filename'] = filename
+        return df
+
+    def check(self, index, df):
+        stderr, sys.stderr = sys.stderr, io.StringIO()
+        try:
+            return index.check(df)
+        finally:
+            sys.stderr = stderr
+
+    def test_check(self):
+        control = self.results([1, 2, 1.1, 2.1], 'control.csv')
+        index = BaselineIndex(['size'], ['git_hash'])
+        index.update(control, 'control.csv')
+        for times in ([1.05, 2.05], [0.95, 2.2], [1.3, 2], [1.3, 1]):
+            new = self.results(times)
+            self.assertEqual(self.check(index, new), compare_all(control, new, ['size'], ['git_hash', 'index', 'filename']))
+        self.assertEqual(index.versions[0]['result_git_hash'], ['abc'])
+
+    def test_window(self):
+        index = BaselineIndex(['size'], ['git_hash'], window=2)
+        index.update(self.results([1, 2]))
+        index.update(self.results([5, 10]))
+        index.update(self.results([6, 11]))
+        self.assertEqual(index.groups['["64"]']['stats']['time']['min'], 5)
+        self.assertEqual(self.check(index, self.results([1, 2])), 2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'index.json')
+            index.save(filename)
+            loaded = BaselineIndex.load(filename)
+        self.assertEqual(loaded.groups, index.groups)
+        self.assertEqual(len(loaded.versions), 3)
+
+    def test_duplicate(self):
+        index = BaselineIndex(['size'], ['git_hash'])
+        self.assertTrue(index.update(self.results([1, 2]), 'a.csv'))
+        self.assertFalse(index.update(self.results([5, 10]), 'a.csv'))
+        self.assertTrue(index.update(self.results([1.5, 2.5]), 'b.csv'))
+        self.assertEqual([version['filename'] for version in index.versions], ['a.csv', 'b.csv'])
+        self.assertEqual(index.groups['["64"]']['stats']['time']['max'], 1.5)
+
+    def test_sketches(self):
+        rng = numpy.random.default_rng(1)
+        times = rng.lognormal(0, 0.2, 2000)
+        index = BaselineIndex(['size'], ['git_hash'])
+        index.update(self.results(times[:1000]))
+        other = self.results(times[1000:])
+        other['size'] = other['size'].astype(float) # e.g. because of a missing value
+        index.update(other)
+        self.assertEqual(set(index.groups), {'["64"]', '["128"]'})
+        group = index.groups['["64"]']
+        self.assertEqual(len(group['sketches']['time']), 2)
+        values = times[::2]
+        stats = group['stats']['time']
+        self.assertEqual(stats['count'], len(values))
+        self.assertEqual((stats['min'], stats['max']), (values.min(), values.max()))
+        self.assertAlmostEqual(stats['mean'], values.mean())
+        self.assertAlmostEqual(stats['std'], values.std(ddof=1))
+        for q in QUANTILES:
+            self.assertAlmostEqual(stats['q%02d' % (q*100)], numpy.quantile(values, q), delta=0.05)
+        self.assertEqual(group['stats']['lib'], {'distinct': ['openblas'], 'count': len(values)})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import tempfile
+import collections
+from design import *
+
+class DesignTest(unittest.TestCase):
+    def setUp(self):
+        self.factors = [Factor(name, [False, True]) for name in 'ABCD']
+
+    def test_full_factorial(self):
+        points = full_factorial(self.factors + [Factor('size', [64, 128, 256])])
+        self.assertEqual(len(points), 2**4*3)
+        self.assertEqual(len(set(tuple(sorted(p.items())) for p in points)), len(points))
+
+    def test_fractional_factorial(self):
+        points = fractional_factorial(self.factors, 1)
+        self.assertEqual(len(points), 2**3)
+        for factor in self.factors: # balanced design
+            self.assertEqual(sum(p[factor.name] for p in points), len(points)//2)
+        for p in points: # D = ABC
+            self.assertEqual(p['D'], (p['A'] + p['B'] + p['C']) % 2 == 1)
+        with self.assertRaises(DesignError):
+            fractional_factorial(self.factors + [Factor('size', [1, 2, 3])], 1)
+
+    def test_latin_hypercube(self):
+        nb_points = 12
+        points = latin_hypercube([Factor('size', [64, 128, 256]), RangeFactor('nb_calls', 10, 20)], nb_points)
+        self.assertEqual(len(points), nb_points)
+        self.assertEqual(collections.Counter(p['size'] for p in points), {64: 4, 128: 4, 256: 4})
+        for p in points:
+            self.assertTrue(10 <= p['nb_calls'] <= 20)
+
+    def test_schedule(self):
+        schedule = Schedule.generate('blocked', self.factors, nb_runs=20)
+        self.assertEqual(len(schedule), 32) # two full replicates
+        self.assertEqual(set(row['block'] for row in schedule.rows), {0, 1})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'schedule.csv')
+            schedule.write(filename)
+            schedule.mark_done(0)
+            schedule.mark_done(5)
+            read = Schedule.read(filename)
+            self.assertEqual(read.factor_names, schedule.factor_names)
+            self.assertEqual(read.rows, schedule.rows)
+            pending = read.pending()
+            self.assertEqual(len(pending), 30)
+            self.assertNotIn(5, [run_index for run_index, _ in pending])
+
+    def test_minimize_transitions(self):
+        factors = self.factors + [Factor('size', [64, 128])]
+        costs = {'size': 0, 'A': 10}
+        schedule = Schedule.generate('blocked', factors, nb_runs=3*2**5)
+        before = sum(schedule.transition_costs(costs))
+        schedule.minimize_transitions(costs)
+        after = schedule.transition_costs(costs)
+        self.assertLess(sum(after), before)
+        self.assertEqual([row['run_index'] for row in schedule.rows], list(range(len(schedule))))
+        for block in range(3):
+            rows = [row for row in schedule.rows if row['block'] == block]
+            self.assertEqual(len(rows), 2**5)
+            changes = sum(1 for row1, row2 in zip(rows, rows[1:]) if row1['A'] != row2['A'])
+            self.assertEqual(changes, 1) # the most costly factor changes only once per block
+        schedule.mark_done(0)
+        with self.assertRaises(DesignError):
+            schedule.minimize_transitions(costs)
+        with self.assertRaises(DesignError): # a single block
+            Schedule.generate('full', factors, nb_runs=3*2**5).minimize_transitions(costs)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+import tempfile
+import numpy
+import pandas
+from drift import *
+
+class DriftTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.default_rng(42)
+
+    def results(self, nb_runs, slowdown=1, hostname='a'):
+        nb_calls = 10
+        return pandas.DataFrame({
+            'hostname': hostname,
+            'lib': 'mkl',
+            'size': 1024,
+            'nb_threads': 4,
+            'run_index': numpy.repeat(numpy.arange(nb_runs), nb_calls),
+            'time': self.rng.normal(1, 0.01, nb_runs*nb_calls) * slowdown,
+        })
+
+    def test_no_drift(self):
+        detector = DriftDetector()
+        for _ in range(5):
+            self.assertEqual(detector.process(self.results(10)), [])
+
+    def test_drift(self):
+        detector = DriftDetector()
+        self.assertEqual(detector.process(pandas.concat([self.results(30), self.results(30, hostname='b')])), [])
+        alerts = detector.process(pandas.concat([self.results(5, slowdown=1.05), self.results(5, hostname='b')]))
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]['change'], 'slowdown')
+        self.assertEqual(alerts[0]['configuration']['hostname'], 'a')
+
+    def test_state(self):
+        detector = DriftDetector(threshold=10)
+        detector.process(self.results(30), 'first.csv')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'state.json')
+            detector.save(filename)
+            loaded = DriftDetector.load(filename)
+        self.assertEqual(loaded.files, ['first.csv'])
+        self.assertEqual(loaded.threshold, 10)
+        self.assertEqual(loaded.configurations.keys(), detector.configurations.keys())
+        for key, conf in detector.configurations.items():
+            self.assertEqual(loaded.configurations[key].to_dict(), conf.to_dict())
+        self.assertEqual(len(loaded.process(self.results(3, slowdown=0.9))), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
 
-import unittest
+import os
+import sys
+import json
+import time
 import random
+import tempfile
+import unittest
+import threading
+import subprocess
+import psutil
+from unittest import mock
 from experiment import *
+from design import Schedule
+from metrics import SessionMetrics
+from barrier import Coordinator
+from autotune import Variant, TuningTable
 from pandas.util.testing import assert_frame_equal
 
 # From https://stackoverflow.com/a/21000675/4110059
@@ -28,6 +41,10 @@ class MockProgram(Program):
         else:
             return self.__class__.__name__
 
+    @property
+    def label(self):
+        return str(self.idn)
+
     def __command_line__(self):
         return ['cmd', str(self.idn)]
 
@@ -43,6 +60,44 @@ class MockProgram(Program):
     def teardown(self):
         self.events.append('teardown')
 
+class TimedMockProgram(TimedCallsProgram):
+    '''An application whose calls last the given times, written by a shell command.'''
+    header = []
+
+    def __init__(self, times):
+        super().__init__()
+        self.times = times
+
+    def lines(self):
+        return ''.join('%f %d\n' % (t, i) for i, t in enumerate(self.times))
+
+    def write_times(self):
+        with open(self.tmp_filename, 'w') as f:
+            f.write(self.lines())
+
+    def __command_line__(self):
+        return ['sh', '-c', 'printf "%s" > %s' % (self.lines().replace('\n', '\\n'), self.tmp_filename)]
+
+    def __environment_variables__(self):
+        return {}
+
+    def __fetch_data__(self):
+        self.__append_data__({})
+
+def write_files(root, files):
+    '''Write the given files {relative path: content} under root, like the pseudo-files of sysfs or procfs.'''
+    for filename, content in files.items():
+        os.makedirs(os.path.join(root, os.path.dirname(filename)), exist_ok=True)
+        with open(os.path.join(root, filename), 'w') as f:
+            f.write(content + '\n')
+
+def fake_sysfs(test, files):
+    '''A temporary directory with the given files, removed at the end of the test.'''
+    tmp_dir = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp_dir.cleanup)
+    write_files(tmp_dir.name, files)
+    return tmp_dir
+
 class ProgramTest(unittest.TestCase):
     def test_basic(self):
         idn = random.randint(0, 1000)
@@ -232,6 +287,533 @@ class OnlyOneWrapperTest(unittest.TestCase):
         data = self.wrapper.data.reset_index()
         self.assertEqual(set(data['run_index']), set(range(nb_iter)))
 
+    def test_set_factor(self):
+        self.wrapper = OnlyOneWrapper(*self.programs, name='mock')
+        for _ in range(10):
+            idn = random.randint(0, len(self.programs)-1)
+            self.assertTrue(self.wrapper.set_factor('mock', self.programs[idn].label))
+            self.assertEqual(self.get_enabled_program().idn, idn)
+        self.assertFalse(self.wrapper.set_factor('foo', 42))
+
+class MemoryAllocationTest(unittest.TestCase):
+    def test_allocation(self):
+        modes = ['aligned', 'first_touch', 'thp']
+        program = MemoryAllocation(modes)
+        engine = ExpEngine(application=MockProgram(1), wrappers=[program])
+        seen = set()
+        for _ in range(50):
+            engine.randomly_enable()
+            self.assertIn(program.mode, modes)
+            self.assertEqual(engine.environment_variables['DGEMM_ALLOCATION'], program.mode)
+            seen.add(program.mode)
+            program.fetch_data()
+        self.assertEqual(seen, set(modes))
+        self.assertEqual(set(program.data['allocation']), seen)
+        engine.apply_factors({'allocation': 'thp'})
+        self.assertEqual(program.environment_variables, {'DGEMM_ALLOCATION': 'thp'})
+        with self.assertRaises(ValueError):
+            MemoryAllocation(['foo'])
+
+class ThreadMappingTest(unittest.TestCase):
+    def test_memory_policy(self):
+        policies = ['localalloc', 'interleave=all', 'membind=0']
+        nb_cores = psutil.cpu_count()
+        program = ThreadMapping(nb_cores, policies)
+        engine = ExpEngine(application=MockProgram(1), wrappers=[program])
+        seen = set()
+        for _ in range(50):
+            engine.randomly_enable()
+            self.assertIn(program.memory_policy, policies)
+            self.assertEqual(engine.command_line[:3], ['numactl', '--physcpubind=all', '--%s' % program.memory_policy])
+            seen.add(program.memory_policy)
+            program.fetch_data()
+        self.assertEqual(seen, set(policies))
+        self.assertEqual(set(program.data['memory_policy']), seen)
+        self.assertEqual(set(program.data['cpubind']), {'all'})
+        engine.apply_factors({'memory_policy': 'membind=0'})
+        self.assertEqual(program.command_line, ['numactl', '--physcpubind=all', '--membind=0'])
+
+class ExpEngineTest(unittest.TestCase):
+    def test_apply_factors(self):
+        programs = [MockProgram(i, suffix_header=True) for i in range(3)]
+        wrappers = [DisableWrapper(prog) for prog in programs[:2]]
+        engine = ExpEngine(application=programs[2], wrappers=wrappers)
+        for _ in range(10):
+            factors = {prog.name: random.choice([False, True]) for prog in programs[:2]}
+            engine.randomly_enable()
+            engine.apply_factors(factors)
+            self.assertEqual({prog.name: prog.enabled for prog in wrappers}, factors)
+        with self.assertRaises(ValueError):
+            engine.apply_factors({'foo': 42})
+        engine.seek(12)
+        engine.fetch_data()
+        for prog in programs:
+            self.assertEqual(list(prog.data['run_index']), [12])
+
+    def test_keep_state(self):
+        program = MockProgram(1)
+        wrapper = DisableWrapper(program)
+        engine = ExpEngine(application=MockProgram(2), wrappers=[wrapper], keep_state=True)
+        expected = []
+        previous = None
+        for _ in range(20):
+            engine.randomly_enable()
+            engine.transition()
+            if wrapper.enabled != previous and previous:
+                expected.append('teardown')
+            if wrapper.enabled and wrapper.enabled != previous:
+                expected.append('setup')
+            previous = wrapper.enabled
+            self.assertEqual(program.events, expected)
+            self.assertEqual(engine.application.events, ['setup'])
+        engine.final_teardown()
+        self.assertEqual(engine.application.events, ['setup', 'teardown'])
+        if previous:
+            expected.append('teardown')
+        self.assertEqual(program.events, expected)
+
+    def test_nb_transitions(self):
+        wrapper = DisableWrapper(MockProgram(1))
+        for keep_state in [False, True]:
+            engine = ExpEngine(application=MockProgram(2), wrappers=[wrapper], keep_state=keep_state)
+            for enabled in [True, True, False, True]:
+                wrapper.enabled = enabled
+                if keep_state:
+                    engine.transition()
+                else:
+                    engine.setup()
+                    engine.teardown()
+                engine.transition_cost.fetch_data()
+            # without keep_state, all the programs are set up and torn down for each run
+            expected = [3]*4 if not keep_state else [3, 0, 1, 1]
+            self.assertEqual(list(engine.transition_cost.data['nb_transitions']), expected)
+
+    def test_instrumentation(self):
+        programs = [MockProgram(i, suffix_header=True) for i in range(3)]
+        engine = ExpEngine(application=programs[2], wrappers=programs[:2], instrumentation=Instrumentation(profile='tracemalloc'))
+        for run_index in range(4):
+            engine.instrumentation.run_index = run_index
+            engine.setup()
+            engine.teardown()
+            engine.fetch_data()
+        rows = engine.instrumentation.rows
+        for phase in ['setup', 'teardown', 'fetch_data']:
+            phase_rows = [row for row in rows if row['phase'] == phase]
+            self.assertEqual(len(phase_rows), 4*(len(engine.programs)+1))
+            for row in phase_rows:
+                self.assertGreaterEqual(row['duration'], 0)
+                self.assertEqual(row['memory_peak'] is None, row['program'] != '')
+        self.assertEqual(set(row['run_index'] for row in rows), set(range(4)))
+        self.assertEqual(set(row['program'] for row in rows), {''} | {prog.name for prog in engine.programs})
+
+    def test_metrics(self):
+        class NoCommand(MockProgram):
+            def __command_line__(self):
+                return []
+        wrapper = DisableWrapper(NoCommand(1))
+        metrics = SessionMetrics()
+        engine = ExpEngine(application=TimedMockProgram([0.5, 0.7]), wrappers=[NoCommand(0), wrapper], metrics=metrics)
+        metrics.start_session(10)
+        for enabled in [True, False, True]:
+            wrapper.enabled = enabled
+            engine.run_once()
+        self.assertEqual(metrics.nb_done, 3)
+        self.assertEqual(set(metrics.configurations), {'NoCommand=True', 'NoCommand=False'})
+        self.assertEqual(metrics.configurations['NoCommand=True'].nb_runs, 2)
+        self.assertAlmostEqual(metrics.configurations['NoCommand=True'].moments.mean, 0.6)
+        self.assertGreaterEqual(metrics.overheads.mean, 0)
+        engine.factors = {'size': 64}
+        self.assertEqual(engine.configuration, 'NoCommand=True size=64')
+
+    def test_resume(self):
+        class NoCommand(MockProgram):
+            def __command_line__(self):
+                return []
+            def close(self):
+                self.events.append('close')
+        class Calls(TimedMockProgram):
+            header = ['call_index', 'time']
+            key = ['run_index', 'call_index']
+            def __fetch_data__(self):
+                for call_index, (t, _) in enumerate(self.read_output()):
+                    self.__append_data__({'call_index': call_index, 'time': t})
+        def get_engine():
+            return ExpEngine(application=Calls([0.5, 0.7]), wrappers=[DisableWrapper(NoCommand(0))])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'results.csv')
+            schedule = Schedule.from_points(['NoCommand'], [{'NoCommand': True}, {'NoCommand': False}], nb_runs=6)
+            schedule.write(os.path.join(tmp_dir, 'schedule.csv'))
+            engine = get_engine()
+            run_once = engine.run_once
+            def interrupted_run_once():
+                if engine.instrumentation.run_index == 4:
+                    raise KeyboardInterrupt()
+                run_once()
+            engine.run_once = interrupted_run_once
+            with self.assertRaises(KeyboardInterrupt):
+                engine.run_all(filename, schedule=Schedule.read(schedule.filename))
+            self.assertEqual(engine.wrappers[0].program.events[-1], 'close')
+            schedule = Schedule.read(schedule.filename)
+            self.assertEqual([run_index for run_index, _ in schedule.pending()], [4, 5])
+            data = pandas.read_csv(filename)
+            self.assertEqual(list(data['run_index']), [i for i in range(4) for _ in range(2)])
+            append_csv(filename, data[data['run_index'] == 3].assign(run_index=4)) # written, not marked as done
+            get_engine().run_all(filename, schedule=schedule)
+            self.assertEqual(schedule.pending(), [])
+            data = pandas.read_csv(filename)
+            self.assertEqual(list(data['run_index']), [i for i in range(6) for _ in range(2)])
+            self.assertEqual(list(data['call_index']), [0, 1]*6)
+            self.assertEqual(list(data['NoCommand']), [row['NoCommand'] for row in schedule.rows for _ in range(2)])
+
+class BlasKernelTest(unittest.TestCase):
+    def get_kernel(self, *args, **kwargs):
+        with mock.patch.object(BlasKernel, 'compile'):
+            return BlasKernel(*args, **kwargs)
+
+    def test_shapes(self):
+        gemm = self.get_kernel('dgemm', 'openblas', nb_calls=2, nb_threads=1, m=10, n=20, k=30, lead_B=40, trans_A=True)
+        self.assertEqual(gemm.leading_dimensions(), [30, 40, 10])
+        self.assertEqual(gemm.cost(), (2*10*20*30, 8*(10*30 + 30*20 + 2*10*20)))
+        self.assertEqual(gemm.command_line[:12], ['./multi_blas', 'dgemm', '2', '10', '20', '30', '30', '40', '10', 'T', 'N', gemm.tmp_filename])
+        sgemm = self.get_kernel('sgemm', 'openblas', nb_calls=2, nb_threads=1, m=10, n=20, k=30)
+        self.assertEqual(sgemm.cost(), (2*10*20*30, 4*(10*30 + 30*20 + 2*10*20)))
+        axpy = self.get_kernel('daxpy', 'openblas', nb_calls=2, nb_threads=1, n=100)
+        self.assertEqual(axpy.leading_dimensions(), [0, 100, 100])
+        self.assertEqual(axpy.cost(), (200, 2400))
+        gemv = self.get_kernel('dgemv', 'openblas', nb_calls=2, nb_threads=1, m=100, n=50, trans_A=True)
+        self.assertEqual(gemv.leading_dimensions(), [100, 100, 50])
+        self.assertEqual(gemv.cost(), (10000, 8*(5000 + 100 + 2*50)))
+        for kwargs in [{'m': 10, 'n': 20}, {'m': 10, 'n': 20, 'k': 30, 'lead_C': 5}]:
+            with self.assertRaises(HarnessError):
+                self.get_kernel('dgemm', 'openblas', nb_calls=2, nb_threads=1, **kwargs)
+        with self.assertRaises(HarnessError):
+            self.get_kernel('dgetrf', 'openblas', nb_calls=2, nb_threads=1, n=10)
+
+    def test_data(self):
+        kernel = self.get_kernel('dsyrk', 'openblas', nb_calls=2, nb_threads=1, n=100, k=10)
+        with open(kernel.tmp_filename, 'w') as f:
+            f.write('0.001 10.0\n0.002 10.001\n')
+        self.assertEqual(kernel.call_windows(), [(10.0, 10.001), (10.001, 10.003)])
+        kernel.fetch_data()
+        kernel.post_process()
+        self.assertEqual(list(kernel.data['flops']), [100*101*10]*2)
+        for gflops, expected in zip(kernel.data['gflops'], [0.101, 0.0505]):
+            self.assertAlmostEqual(gflops, expected)
+        self.assertTrue(kernel.set_factor('k', 20))
+        self.assertEqual(kernel.cost()[0], 100*101*20)
+        self.assertFalse(kernel.set_factor('size', 20))
+
+class DlopenTest(unittest.TestCase):
+    def test_libraries(self):
+        with mock.patch('experiment.compile_generic') as compile_mock:
+            dgemm = Dgemm('openblas', size=100, nb_calls=2, nb_threads=1, block_size=128, dlopen=['openblas', 'netlib'])
+            engine = ExpEngine(application=dgemm, wrappers=[])
+            seen = set()
+            for _ in range(50):
+                engine.randomly_enable()
+                self.assertEqual(engine.environment_variables['BLAS_LIBRARY'], BLAS_LIBRARIES[dgemm.lib])
+                seen.add(dgemm.lib)
+            self.assertEqual(seen, {'openblas', 'netlib'})
+            engine.apply_factors({'lib': 'netlib'})
+            self.assertEqual(dgemm.lib, 'netlib')
+            compile_mock.assert_called_once_with('multi_dgemm', 'dlopen', 128, None, loop_order='kij', collapse=False) # a single build
+            with self.assertRaises(HarnessError):
+                dgemm.set_factor('lib', 'mkl')
+            with self.assertRaises(HarnessError):
+                Dgemm('openblas', size=100, nb_calls=2, nb_threads=1, block_size=128, dlopen=['openblas', 'foo'])
+        with open(dgemm.tmp_filename, 'w') as f:
+            f.write('0.5 10.0\n0.25 10.5\n')
+        with open(dgemm.environment_variables['BLAS_INFO_FILE'], 'w') as f:
+            f.write('/usr/lib/libblas.so.3.10\nversion 3.10\n')
+        dgemm.fetch_data()
+        self.assertEqual(list(dgemm.data['blas_path']), ['/usr/lib/libblas.so.3.10']*2)
+        self.assertEqual(list(dgemm.data['lib']), ['netlib']*2)
+        self.assertIn('blas_version', dgemm.header)
+
+class TunedDgemmTest(unittest.TestCase):
+    def test_variant(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            table = TuningTable(os.path.join(tmp_dir, 'table.json'))
+            table.set(512, 2, Variant(64, 'ikj', True), 0.1)
+            table.save()
+            with mock.patch.object(Dgemm, 'tuning_table', table.filename), mock.patch('experiment.compile_generic') as compile_mock:
+                dgemm = Dgemm('naive', size=512, nb_calls=2, nb_threads=2, block_size=None)
+                compile_mock.assert_called_once_with('multi_dgemm', 'naive', 64, None, loop_order='ikj', collapse=True)
+                self.assertTrue(dgemm.set_factor('size', 1024)) # not tuned, default variant
+                self.assertEqual((dgemm.block_size, dgemm.loop_order, dgemm.collapse), (128, 'kij', False))
+                self.assertEqual(compile_mock.call_count, 2)
+                dgemm.set_factor('nb_calls', 5)
+                self.assertEqual(compile_mock.call_count, 2)
+        self.assertIn('loop_order', dgemm.header)
+
+class QuiescenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = fake_sysfs(self, {
+            'hwmon/hwmon0/name': 'coretemp', 'hwmon/hwmon0/temp1_label': 'Package id 0', 'hwmon/hwmon0/temp1_input': '90000',
+            'hwmon/hwmon0/temp2_label': 'Core 0', 'hwmon/hwmon0/temp2_input': '45000',
+            'hwmon/hwmon0/temp3_label': 'Core 1', 'hwmon/hwmon0/temp3_input': '47000',
+            'hwmon/hwmon1/name': 'acpitz', 'hwmon/hwmon1/temp1_input': '99000',
+            'cpu/cpu0/cpufreq/scaling_cur_freq': '2000000', 'cpu/cpu1/cpufreq/scaling_cur_freq': '3000000',
+            'stat': 'cpu  100 0 100 800 0 0 0 0 0 0\ncpu0 50 0 50 400 0 0 0 0 0 0\n',
+        })
+
+    def get_program(self, **kwargs):
+        root = self.tmp_dir.name
+        return Quiescence(hwmon_root=os.path.join(root, 'hwmon'), cpu_root=os.path.join(root, 'cpu'), proc_stat=os.path.join(root, 'stat'),
+                poll_period=0.001, **kwargs)
+
+    def test_quiet(self):
+        program = self.get_program(max_temperature=50, max_frequency_change=0.01)
+        self.assertEqual(program.read_temperature(), 47)
+        self.assertEqual(program.read_frequency(), 2.5e9)
+        program.pre_run()
+        program.fetch_data()
+        row = program.data.iloc[0]
+        self.assertFalse(row['quiescence_timeout'])
+        self.assertLess(row['quiescence_wait'], 1)
+        self.assertEqual((row['pre_temperature'], row['pre_load'], row['pre_frequency']), (47, 0, 2.5e9))
+
+    def test_timeout(self):
+        program = self.get_program(max_temperature=40, timeout=0.05)
+        program.pre_run()
+        program.fetch_data()
+        row = program.data.iloc[0]
+        self.assertTrue(row['quiescence_timeout'])
+        self.assertGreaterEqual(row['quiescence_wait'], 0.05)
+
+    def test_load(self):
+        self.assertEqual(Quiescence.load((200, 1000), (250, 1100)), 0.5)
+        self.assertEqual(Quiescence.load((200, 1000), (200, 1000)), 0)
+        program = self.get_program()
+        self.assertEqual(program.read_cpu_times(), (200, 1000))
+        self.assertFalse(program.is_quiet(float('nan'), 0.5, 1, 1))
+        with self.assertRaises(QuiescenceError):
+            Quiescence(max_temperature=50, hwmon_root=self.tmp_dir.name)
+
+class BarrierTest(unittest.TestCase):
+    def test_runs(self):
+        coordinator = Coordinator(2, host='127.0.0.1', port=0, start_delay=0.01)
+        coordinator.start()
+        programs = [Barrier.from_address('127.0.0.1:%d' % coordinator.port, name) for name in ['node1', 'node2']]
+        for _ in range(3): # each node runs in its own thread
+            threads = [threading.Thread(target=program.pre_run) for program in programs]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for program in programs:
+                program.fetch_data()
+        for program in programs:
+            program.close()
+        coordinator.join(10)
+        self.assertEqual(len(coordinator.skew), 6)
+        for program in programs:
+            self.assertEqual(list(program.data['run_index']), [0, 1, 2])
+            self.assertTrue((program.data['start_lateness'] >= 0).all())
+            self.assertTrue((program.data['clock_offset'].abs() < 0.01).all())
+
+class PerfRecordTest(unittest.TestCase):
+    report = b'''
+    61.20%  libopenblas.so.0   [.] dgemm_kernel_HASWELL
+    20.05%  [kernel.kallsyms]  [k] clear_page_erms
+    12.50%  libgomp.so.1.0.0   [.] gomp_barrier_wait_end
+     6.25%  [kernel.kallsyms]  [k] native_irq_return_iret
+'''
+
+    def run_program(self, times, profile_dir=None):
+        application = TimedMockProgram(times)
+        application.write_times()
+        program = PerfRecord(application, nb_symbols=3, profile_dir=profile_dir)
+        self.assertEqual(program.command_line[:2], ['perf', 'record'])
+        with open(program.profile_file, 'w') as f:
+            f.write('profile')
+        with mock.patch('experiment.run_command', return_value=self.report) as report_mock:
+            program.post_run()
+        program.fetch_data()
+        self.assertFalse(os.path.exists(program.profile_file))
+        return program.data.iloc[0], report_mock
+
+    def test_regular_run(self):
+        row, report_mock = self.run_program([1.0, 1.1, 0.9, 1.2])
+        report_mock.assert_not_called()
+        self.assertFalse(row['perf_outlier'])
+        self.assertEqual(row['hot_symbols'], '')
+
+    def test_outlier_run(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            row, report_mock = self.run_program([1.0, 1.1, 3.0, 0.9, 1.0], profile_dir)
+            self.assertEqual(os.listdir(profile_dir), ['perf_0.data'])
+        report_mock.assert_called_once()
+        self.assertTrue(row['perf_outlier'])
+        self.assertAlmostEqual(row['outlier_ratio'], 3)
+        self.assertAlmostEqual(row['kernel_fraction'], 0.263)
+        self.assertEqual(row['hot_symbols'], '61.2% libopenblas.so.0:dgemm_kernel_HASWELL; '
+                '20.1% [kernel.kallsyms]:clear_page_erms; 12.5% libgomp.so.1.0.0:gomp_barrier_wait_end')
+
+class InterferenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = fake_sysfs(self, {
+            'cpu0/topology/thread_siblings_list': '0,4', 'cpu1/topology/thread_siblings_list': '1,5',
+            'cpu2/topology/thread_siblings_list': '2',
+            'cpu0/cache/index0/level': '1', 'cpu0/cache/index0/size': '32K',
+            'cpu0/cache/index3/level': '3', 'cpu0/cache/index3/size': '8192K',
+        })
+
+    def test_topology(self):
+        root = self.tmp_dir.name
+        self.assertEqual(Interference.parse_cores('0-2,6', root), [0, 1, 2, 6])
+        self.assertEqual(Interference.parse_cores('siblings:0-1', root), [4, 5])
+        with self.assertRaises(InterferenceError):
+            Interference.parse_cores('siblings:2', root)
+        self.assertEqual(Interference.llc_size(root), 8 << 20)
+
+    def test_runs(self):
+        program = Interference(['none', 'busy', 'stream'], '0', intensities=[0.5, 1.0], buffer_size=1 << 20, cpu_root=self.tmp_dir.name)
+        self.assertEqual(program.buffer_sizes, {'stream': 1 << 20, 'llc': 8 << 20})
+        self.assertIn(program.random_state()[0], ['none', 'busy', 'stream'])
+        self.assertTrue(program.set_factor('interference', 'busy'))
+        self.assertTrue(program.set_factor('interference_intensity', 0.5))
+        self.assertFalse(program.set_factor('size', 64))
+        for state in [('busy', 0.5), ('none', 1.0), ('stream', 1.0)]:
+            program.state = state
+            program.pre_run()
+            time.sleep(0.05)
+            program.post_run()
+            program.fetch_data()
+        data = program.data
+        self.assertEqual(list(data['interference']), ['busy', 'none', 'stream'])
+        self.assertEqual(list(data['interference_intensity']), [0.5, 1.0, 1.0])
+        self.assertEqual(list(data['interference_cores']), ['0']*3)
+        self.assertGreater(data['interference_rate'][0], 0)
+        self.assertTrue(numpy.isnan(data['interference_rate'][1]))
+        self.assertGreater(data['interference_rate'][2], 0)
+        with self.assertRaises(ValueError):
+            Interference(['foo'], '0')
+
+class NoiseProbeTest(unittest.TestCase):
+    def write_probe(self, filename, fastest, detours, start, end, nb_dropped=0):
+        header = [1000, fastest, len(detours), nb_dropped, start, end]
+        values = numpy.array(header + [v for detour in detours for v in detour], dtype=numpy.uint64)
+        values.tofile(filename)
+
+    def test_call_windows(self):
+        application = TimedMockProgram([1.0, 2.0]) # calls from 0 to 1 s and from 1 to 3 s
+        application.write_times()
+        program = NoiseProbe('0,1', application)
+        self.assertEqual(program.key, ['run_index', 'call_index'])
+        s = 10**9
+        self.write_probe(program.output_file(0), 1000, [(s//2, 1000+10**6), (s - 10**5, 1000+2*10**5)], 0, 3*s)
+        self.write_probe(program.output_file(1), 2000, [(2*s, 2000+10**7)], 0, 3*s, nb_dropped=4)
+        program.fetch_data()
+        data = program.data
+        self.assertEqual(list(data['call_index']), [0, 1])
+        self.assertEqual(list(data['noise_detours']), [3, 3])
+        self.assertEqual(list(data['noise_dropped']), [4, 4])
+        self.assertAlmostEqual(data['noise_fraction'][0], (1e-3 + 2e-4 + 1e-2) / 6)
+        self.assertAlmostEqual(data['noise_max'][0], 1e-2 + 2e-6)
+        self.assertEqual(list(data['call_noise_detours']), [2, 2]) # the second detour overlaps both calls
+        # the 0.2 ms lost by the second detour are split between the calls, proportionally to the overlap
+        self.assertAlmostEqual(data['call_noise_time'][0], 1e-3 + 2e-4 * 100/201, places=10)
+        self.assertAlmostEqual(data['call_noise_time'][1], 2e-4 * 101/201 + 1e-2, places=10)
+        self.assertAlmostEqual(data['call_noise_max'][1], 1e-2 + 2e-6)
+
+    def test_invalid_output(self):
+        program = NoiseProbe('0')
+        with self.assertRaisesRegex(NoiseProbeError, 'No output'):
+            program.fetch_data()
+        self.write_probe(program.output_file(0), 1000, [(0, 2000), (10**6, 3000)], 0, 10**9)
+        with open(program.output_file(0), 'r+b') as f:
+            f.truncate(6*8 + 3*8)
+        with self.assertRaisesRegex(NoiseProbeError, '2 detours announced, 1 written'):
+            program.fetch_data()
+        with open(program.output_file(0), 'r+b') as f:
+            f.truncate(5*8)
+        with self.assertRaisesRegex(NoiseProbeError, 'Truncated'):
+            program.fetch_data()
+
+    def test_run(self):
+        program = NoiseProbe('0', quantum=5, threshold=1)
+        self.assertEqual(program.header, NoiseProbe.run_header)
+        program.pre_run()
+        time.sleep(0.1)
+        program.post_run()
+        program.fetch_data()
+        row = program.data.iloc[0]
+        self.assertGreaterEqual(row['noise_fraction'], 0)
+        self.assertLess(row['noise_fraction'], 1)
+        self.assertGreaterEqual(row['noise_detours'], 0)
+        with open(program.output_file(0), 'wb') as f:
+            f.write(b'stale')
+        program.pre_run() # the output of the previous run is removed
+        self.assertFalse(os.path.exists(program.output_file(0)))
+        program.post_run()
+        self.assertTrue(os.path.exists(program.output_file(0)))
+
+class RAPLTest(unittest.TestCase):
+    def setUp(self):
+        files = {}
+        for domain, name in [('intel-rapl:0', 'package-0'), ('intel-rapl:0:0', 'core'), ('intel-rapl:0:1', 'dram')]:
+            files.update({'%s/name' % domain: name, '%s/max_energy_range_uj' % domain: '1000000', '%s/energy_uj' % domain: '0'})
+        self.tmp_dir = fake_sysfs(self, files)
+
+    def set_energy(self, domain, value):
+        write_files(self.tmp_dir.name, {'%s/energy_uj' % domain: str(value)})
+
+    def test_run(self):
+        rapl = RAPL(sampling_period=0, root=self.tmp_dir.name)
+        self.assertEqual([domain.name for domain in rapl.domains], ['package_0', 'dram_0'])
+        self.assertEqual(rapl.header, ['energy_package_0', 'energy_dram_0', 'power_package_0', 'power_dram_0'])
+        self.set_energy('intel-rapl:0', 900000)
+        rapl.pre_run()
+        self.set_energy('intel-rapl:0', 100000) # wraparound
+        self.set_energy('intel-rapl:0:1', 50000)
+        rapl.post_run()
+        rapl.fetch_data()
+        row = rapl.data.iloc[0]
+        self.assertAlmostEqual(row['energy_package_0'], 0.2)
+        self.assertAlmostEqual(row['energy_dram_0'], 0.05)
+        self.assertGreater(row['power_package_0'], 0)
+
+    def test_calls(self):
+        class Application:
+            def call_windows(self):
+                return [(10, 10.5), (10.5, 11.5)]
+        rapl = RAPL(Application(), sampling_period=0, root=self.tmp_dir.name)
+        rapl.samples = [(10, [0, 0]), (11, [2000000, 100000]), (12, [4000000, 200000])]
+        rapl.fetch_data()
+        self.assertEqual(list(rapl.data['call_index']), [0, 1])
+        self.assertEqual(list(rapl.data['energy_package_0']), [1, 2])
+        self.assertEqual(list(rapl.data['power_package_0']), [2, 2])
+        for energy, expected in zip(rapl.data['energy_dram_0'], [0.05, 0.1]):
+            self.assertAlmostEqual(energy, expected)
+
+    def test_sampling(self):
+        rapl = RAPL(sampling_period=0.001, root=self.tmp_dir.name)
+        rapl.pre_run()
+        time.sleep(0.05)
+        rapl.post_run()
+        self.assertGreater(len(rapl.samples), 5)
+        self.assertIsNone(rapl.sampler)
+
+    def test_no_domain(self):
+        with self.assertRaises(RAPLError):
+            RAPL(root=os.path.join(self.tmp_dir.name, 'intel-rapl:0'))
+
+class StartupTest(unittest.TestCase):
+    def test_lazy_imports(self):
+        code = 'import sys, experiment; print(",".join(m for m in ("pandas", "psutil", "cpuinfo", "git") if m in sys.modules))'
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.decode().strip(), '')
+
+    def test_likwid_groups_cache(self):
+        key = ['host', '/usr/bin/likwid-perfctr', 42]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = os.path.join(tmp_dir, 'likwid_groups.json')
+            with open(cache, 'w') as f:
+                json.dump({'key': key, 'groups': ['CLOCK', 'L3CACHE']}, f)
+            with mock.patch.object(Likwid, 'groups_cache', cache), mock.patch.object(Likwid, 'available_groups', None), \
+                    mock.patch.object(Likwid, 'groups_cache_key', return_value=key):
+                self.assertEqual(Likwid.get_available_groups(), {'CLOCK', 'L3CACHE'}) # likwid-perfctr is not called
 
 if __name__ == "__main__":
     unittest.main()
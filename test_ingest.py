@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+import tempfile
+import pandas
+from ingest import *
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, df, index=True):
+        filename = os.path.join(self.tmp_dir.name, name)
+        df.to_csv(filename, index=index)
+        return filename
+
+    def test_concat(self):
+        files = [
+            self.write('a.csv', pandas.DataFrame({'run_index': [0, 1], 'size': [64, 64], 'time': [1, 2]})),
+            self.write('b.csv', pandas.DataFrame({'time': [1.5, 2.5], 'size': [128, 128], 'run_index': [0, 1]}), index=False),
+            self.write('c.csv', pandas.DataFrame({'run_index': [0], 'size': [256], 'time': [3], 'hostname': ['c']})),
+            os.path.join(self.tmp_dir.name, 'missing.csv'),
+        ]
+        df, errors = load_results(files, nb_workers=2, add_filename=True)
+        self.assertEqual(list(df.columns), ['run_index', 'size', 'time', 'filename'])
+        self.assertEqual(list(df['size']), [64, 64, 128, 128])
+        self.assertEqual(list(df['time']), [1, 2, 1.5, 2.5])
+        self.assertEqual(df['time'].dtype, 'float64')
+        self.assertEqual(df['run_index'].dtype, 'int64')
+        self.assertEqual(list(df['filename']), [files[0]]*2 + [files[1]]*2)
+        self.assertEqual(set(errors), set(files[2:]))
+        self.assertIn('unexpected columns hostname', errors[files[2]])
+
+    def test_required(self):
+        files = [
+            self.write('a.csv', pandas.DataFrame({'run_index': [0], 'size': [64]})),
+            self.write('b.csv', pandas.DataFrame({'run_index': [0], 'size': [64], 'time': [1]})),
+        ]
+        df, errors = load_results(files, required=['run_index', 'time'], nb_workers=1)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(errors, {files[0]: 'missing required columns time'})
+        with self.assertRaises(SchemaError):
+            load_results(files[:1], required=['time'])
+
+    def test_reference(self):
+        odd = pandas.DataFrame({'run_index': [0], 'size': [64], 'hostname': ['a']})
+        usual = pandas.DataFrame({'run_index': [0], 'size': [64]})
+        files = [self.write('a.csv', odd), self.write('b.csv', usual), self.write('c.csv', usual)]
+        df, errors = load_results(files, nb_workers=1)
+        self.assertEqual(list(df.columns), ['run_index', 'size'])
+        self.assertEqual(len(df), 2)
+        self.assertEqual(list(errors), [files[0]])
+        self.assertIn('unexpected columns hostname', errors[files[0]])
+        df, errors = load_results(files, nb_workers=1, expected=['run_index', 'size', 'hostname'])
+        self.assertEqual(list(df.columns), ['run_index', 'size', 'hostname'])
+        self.assertEqual(len(df), 1)
+        self.assertEqual(set(errors), set(files[1:]))
+        self.assertIn('missing columns hostname', errors[files[1]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+import statistics
+import urllib.request
+from metrics import *
+
+class MetricsTest(unittest.TestCase):
+    def test_welford(self):
+        values = [random.gauss(3, 2) for _ in range(1000)]
+        moments = Welford()
+        for x in values:
+            moments.add(x)
+        self.assertAlmostEqual(moments.mean, statistics.mean(values))
+        self.assertAlmostEqual(moments.std, statistics.stdev(values))
+
+    def test_p2_median(self):
+        rng = random.Random(42)
+        for distribution in [lambda: rng.uniform(0, 1), lambda: rng.lognormvariate(0, 1), lambda: rng.expovariate(1)]:
+            values = [distribution() for _ in range(10000)]
+            median = P2Quantile()
+            for x in values:
+                median.add(x)
+            self.assertAlmostEqual(median.value, statistics.median(values), delta=0.02)
+        median = P2Quantile()
+        for x in [5, 1, 3]:
+            median.add(x)
+        self.assertEqual(median.value, 3) # exact for the first observations
+
+    def test_p2_quantile(self):
+        rng = random.Random(1)
+        values = [rng.uniform(0, 100) for _ in range(10000)]
+        quantile = P2Quantile(0.9)
+        for x in values:
+            quantile.add(x)
+        self.assertAlmostEqual(quantile.value, statistics.quantiles(values, n=10)[-1], delta=1)
+
+    def test_session(self):
+        metrics = SessionMetrics()
+        metrics.start_session(10)
+        for run_index in range(4):
+            metrics.record_run('lib=naive' if run_index % 2 else 'lib="mkl"', [1.0, 2.0, 3.0], run_duration=10, kernel_duration=8)
+        self.assertEqual(metrics.eta, 60)
+        server = MetricsServer(metrics, port=0).start()
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d/metrics' % server.port) as response:
+                text = response.read().decode()
+        finally:
+            server.stop()
+        lines = text.splitlines()
+        self.assertIn('variability_runs_completed 4.0', lines)
+        self.assertIn('variability_eta_seconds 60.0', lines)
+        self.assertIn('variability_wrapper_overhead_mean_seconds 2.0', lines)
+        self.assertIn('variability_call_time_median_seconds{configuration="lib=naive"} 2.0', lines)
+        self.assertIn('variability_configuration_runs{configuration="lib=\\"mkl\\""} 2.0', lines)
+        self.assertIn('# TYPE variability_call_time_stddev_seconds gauge', lines)
+        self.assertIn('variability_call_time_window_median_seconds{configuration="lib=naive"} 2.0', lines)
+        self.assertIn('variability_call_time_window_stddev_seconds{configuration="lib=naive"} 0.0', lines)
+
+    def test_window(self):
+        metrics = SessionMetrics(window=3)
+        metrics.start_session(None)
+        for median in [1, 1, 1, 1, 5, 6, 7]:
+            metrics.record_run('lib=naive', [median-0.5, median, median+10], run_duration=1, kernel_duration=1)
+        conf = metrics.configurations['lib=naive']
+        self.assertEqual(list(conf.run_medians), [5, 6, 7])
+        self.assertEqual(conf.window_median, 6)
+        self.assertEqual(conf.window_std, 1)
+        self.assertEqual(conf.moments.count, 21) # the cumulative statistics keep all the runs
+
+if __name__ == "__main__":
+    unittest.main()
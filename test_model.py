@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+import tempfile
+import numpy
+from model import *
+
+class ModelTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.default_rng(42)
+        m, n, k = (rng.integers(100, 2000, 1000) for _ in range(3))
+        self.feature = (m*n*k).astype(numpy.float64)
+        self.times = (1e-4 + 2e-11*self.feature) * rng.lognormal(0, 0.05, len(self.feature))
+        matrix = numpy.column_stack([numpy.ones(len(self.feature)), self.feature])
+        (intercept, slope), *_ = numpy.linalg.lstsq(matrix, self.times, rcond=None)
+        fitted = intercept + slope*self.feature
+        self.model = Model.from_fit('dgemm', intercept, slope, fitted, self.times - fitted)
+
+    def test_predict(self):
+        self.assertAlmostEqual(self.model.slope, 2e-11, delta=1e-12)
+        prediction = self.model.predict([1000, 2000], [1000, 2000], [1000, 2000])
+        self.assertEqual(prediction.shape, (2,))
+        self.assertAlmostEqual(prediction[1], self.model.intercept + self.model.slope*8e9)
+        self.assertAlmostEqual(float(self.model.predict(1000, 1000, 1000)), prediction[0])
+
+    def test_sample(self):
+        samples = self.model.sample(numpy.full(10000, 1000), 1000, 1000, numpy.random.default_rng(1))
+        expected = 1e-4 + 2e-11*1e9
+        self.assertAlmostEqual(numpy.median(samples)/expected, 1, delta=0.02)
+        self.assertAlmostEqual(numpy.std(numpy.log(samples)), 0.05, delta=0.01)
+
+    def test_registry(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'models.json')
+            registry = Registry(filename)
+            registry.add('host', 'openblas', 4, self.model, filename='results_dgemm.csv')
+            registry.save()
+            loaded = Registry(filename)
+        self.assertEqual(len(loaded), 1)
+        model = loaded.get('host', 'openblas', 4, 'dgemm')
+        self.assertEqual(model.to_dict(), self.model.to_dict())
+        with self.assertRaises(ModelError):
+            loaded.get('host', 'openblas', 1, 'dgemm')
+
+if __name__ == "__main__":
+    unittest.main()
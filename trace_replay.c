@@ -0,0 +1,148 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <time.h>
+#include <assert.h>
+#include <string.h>
+#include "common_matrix.h"
+#ifdef USE_NAIVE
+#error "The trace replay requires a BLAS library (dtrsm is not implemented by the naive version)."
+#endif
+#ifdef USE_MKL
+#include <mkl.h>
+#else
+#include <cblas.h>
+#endif
+
+// Replay of a sequence of dgemm and dtrsm calls, in a single process, with the time of each call.
+// The calls are made like in HPL (and like in dgemm_test and dtrsm_test), in column-major mode:
+//  - dgemm: C = C + A×B^T, A is m×k, B is n×k (transposed), C is m×n
+//  - dtrsm: X×A = B, A is n×n (lower triangular, unit diagonal), B is m×n
+
+#define MAX_LINE_SIZE 4096
+
+enum kernel {DGEMM, DTRSM};
+
+struct call {
+    enum kernel kernel;
+    int m, n, k, lead_A, lead_B, lead_C;
+};
+
+void syntax(char *exec_name) {
+    fprintf(stderr, "Syntax: %s <trace_file> [output_file]\n", exec_name);
+    fprintf(stderr, "Each line of the trace is either \"dgemm <m> <n> <k> <lead_A> <lead_B> <lead_C>\" or \"dtrsm <m> <n> <lead_A> <lead_B>\".\n");
+    exit(1);
+}
+
+int read_call(char *line, struct call *call) {
+    char kernel[MAX_LINE_SIZE];
+    if(sscanf(line, "%4095s", kernel) != 1)
+        return 0;
+    if(strcmp(kernel, "dgemm") == 0) {
+        call->kernel = DGEMM;
+        return sscanf(line, "%*s %d %d %d %d %d %d", &call->m, &call->n, &call->k, &call->lead_A, &call->lead_B, &call->lead_C) == 6 &&
+            call->m > 0 && call->n > 0 && call->k > 0 && call->lead_A >= call->m && call->lead_B >= call->n && call->lead_C >= call->m;
+    }
+    if(strcmp(kernel, "dtrsm") == 0) {
+        call->kernel = DTRSM;
+        call->k = 0;
+        call->lead_C = 0;
+        return sscanf(line, "%*s %d %d %d %d", &call->m, &call->n, &call->lead_A, &call->lead_B) == 4 &&
+            call->m > 0 && call->n > 0 && call->lead_A >= call->n && call->lead_B >= call->m;
+    }
+    return 0;
+}
+
+struct call *read_trace(char *filename, int *nb_calls) {
+    FILE *f = fopen(filename, "r");
+    if(f == NULL) {
+        perror(filename);
+        exit(1);
+    }
+    char line[MAX_LINE_SIZE];
+    int capacity = 1024;
+    struct call *calls = (struct call*) malloc(capacity*sizeof(struct call));
+    assert(calls);
+    *nb_calls = 0;
+    int line_number = 0;
+    while(fgets(line, MAX_LINE_SIZE, f) != NULL) {
+        line_number++;
+        if(line[0] == '#' || line[0] == '\n')
+            continue;
+        if(*nb_calls == capacity) {
+            capacity *= 2;
+            calls = (struct call*) realloc(calls, capacity*sizeof(struct call));
+            assert(calls);
+        }
+        if(!read_call(line, &calls[*nb_calls])) {
+            fprintf(stderr, "Error: wrong call at line %d of %s: %s", line_number, filename, line);
+            exit(1);
+        }
+        (*nb_calls)++;
+    }
+    fclose(f);
+    return calls;
+}
+
+// The buffers are allocated once, with the size of the largest matrices of the trace (and the allocation mode
+// of allocate_buffer).
+double *allocate_filled(size_t nb_elements) {
+    double *result = (double*) allocate_buffer(nb_elements*sizeof(double));
+    for(size_t i = 0; i < nb_elements; i++)
+        result[i] = 1e-3; // small values, to avoid overflows in dtrsm
+    return result;
+}
+
+int main(int argc, char* argv[]) {
+    if (argc != 2 && argc != 3)
+        syntax(argv[0]);
+    int nb_calls;
+    struct call *calls = read_trace(argv[1], &nb_calls);
+    FILE *outfile = stdout;
+    if(argc == 3 && (outfile = fopen(argv[2], "w")) == NULL) {
+        perror(argv[2]);
+        exit(1);
+    }
+    size_t size_A = 1, size_B = 1, size_C = 1;
+    for(int i = 0; i < nb_calls; i++) {
+        struct call *c = &calls[i];
+        size_t a, b, cc;
+        if(c->kernel == DGEMM) {
+            a = (size_t)c->lead_A*c->k;
+            b = (size_t)c->lead_B*c->k;
+            cc = (size_t)c->lead_C*c->n;
+        }
+        else {
+            a = (size_t)c->lead_A*c->n;
+            b = (size_t)c->lead_B*c->n;
+            cc = 0;
+        }
+        size_A = a > size_A ? a : size_A;
+        size_B = b > size_B ? b : size_B;
+        size_C = cc > size_C ? cc : size_C;
+    }
+    double *A = allocate_filled(size_A);
+    double *B = allocate_filled(size_B);
+    double *C = allocate_filled(size_C);
+
+    struct timespec before;
+    struct timespec after;
+    for(int i = 0; i < nb_calls; i++) {
+        struct call *c = &calls[i];
+        clock_gettime(CLOCK_MONOTONIC, &before);
+        if(c->kernel == DGEMM)
+            cblas_dgemm(CblasColMajor, CblasNoTrans, CblasTrans, c->m, c->n, c->k, -1., A, c->lead_A, B, c->lead_B, 1., C, c->lead_C);
+        else
+            cblas_dtrsm(CblasColMajor, CblasRight, CblasLower, CblasNoTrans, CblasUnit, c->m, c->n, 1., A, c->lead_A, B, c->lead_B);
+        clock_gettime(CLOCK_MONOTONIC, &after);
+        double total_time = (after.tv_sec-before.tv_sec) + 1e-9*(after.tv_nsec-before.tv_nsec);
+        fprintf(outfile, "%f\n", total_time);
+    }
+
+    if(outfile != stdout)
+        fclose(outfile);
+    free_buffer(A);
+    free_buffer(B);
+    free_buffer(C);
+    free(calls);
+    return 0;
+}
@@ -4,6 +4,8 @@ try:
     from subprocess import DEVNULL
 except ImportError:
     DEVNULL = open('/dev/null', 'w')
+import types
+import importlib
 import logging
 import warnings # psutil gives some warnings, let's just ignore them
 warnings.simplefilter("ignore")
@@ -22,29 +24,75 @@ def error(msg, stdout=None, stderr=None):
         logger.error(stderr)
     sys.exit(1)
 
-def run_command(args):
+class LazyModule(types.ModuleType):
+    '''A module imported at the first access to one of its attributes, to keep the startup fast.'''
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__) # the next accesses do not go through __getattr__
+        return getattr(module, attr)
+
+def lazy_import(name):
+    return LazyModule(name)
+
+def start_command(args, env=None):
     logger.info(' '.join(args))
-    process = Popen(args, stdout=PIPE, stderr=PIPE)
+    return Popen(args, stdout=PIPE, stderr=PIPE, env=env)
+
+def wait_command(process, args):
     output = process.communicate()
     if process.wait() != 0:
         error('with command: %s' % ' '.join(args), output[0].decode('utf8'), output[1].decode('utf8'))
     return output[0]
 
+def run_command(args, env=None):
+    return wait_command(start_command(args, env), args)
+
+class ResidentProcess:
+    '''A process kept alive between the runs, driven with one command per line on its standard input.'''
+    def __init__(self, args):
+        logger.info(' '.join(args))
+        self.args = args
+        self.process = Popen(args, stdin=PIPE, stdout=PIPE, universal_newlines=True, bufsize=1)
+
+    def request(self, command):
+        self.process.stdin.write(command + '\n')
+        self.process.stdin.flush()
+        answer = self.process.stdout.readline().strip()
+        if answer == '':
+            error('process %s terminated with code %s' % (' '.join(self.args), self.process.wait()))
+        return answer
+
+    def stop(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            error('with command: %s' % ' '.join(self.args))
+
 class LibraryNotFound(Exception):
     pass
 
-def compile_generic(exec_filename, lib, block_size=128, likwid=None):
+def compile_generic(exec_filename, lib, block_size=128, likwid=None, loop_order='kij', collapse=False, output=None):
+    '''
+    Compile exec_filename.c with the given library (in exec_filename, unless an output path is given).
+    The loop order and the collapse are variants of the naive library (see common_matrix.c and autotune.py).
+    '''
     c_filename = exec_filename + '.c'
+    exec_filename = output or exec_filename
     options = []
+    if sorted(loop_order) != ['i', 'j', 'k']:
+        raise ValueError('Wrong loop order %s, expected a permutation of "ijk".' % loop_order)
+    naive_options = ['-DLOOP_ORDER=%s' % ' '.join('LOOP_%s' % loop.upper() for loop in loop_order)]
+    if collapse:
+        naive_options.append('-DCOLLAPSE')
     if likwid is not None:
         options.extend(['-DLIKWID_PERFMON', '-llikwid'])
     lib_to_command = {
         'mkl': ['icc', '-DUSE_MKL', c_filename, '-std=gnu99', 'common_matrix.c', '-fopenmp', '-mkl', '-O3', '-o', exec_filename, *options],
-        'mkl2': ['/opt/intel/bin/icc', '-DUSE_MKL', '-std=gnu99', c_filename, 'common_matrix.c', '-I', '/opt/intel/compilers_and_libraries_2017.0.098/linux/mkl/include',
+        'mkl2': ['/opt/intel/bin/icc', '-DUSE_MKL', '-std=gnu99', c_filename, 'common_matrix.c', '-fopenmp', '-I', '/opt/intel/compilers_and_libraries_2017.0.098/linux/mkl/include',
 		'/opt/intel/mkl/lib/intel64/libmkl_rt.so', '-O3', '-o', exec_filename, *options], # an ugly command for a non-standard library location
         'atlas': ['gcc', '-DUSE_ATLAS', c_filename, '-std=gnu99', 'common_matrix.c', '-fopenmp', '/usr/lib/atlas-base/libcblas.so.3', '-O3', '-o', exec_filename, *options],
         'openblas': ['gcc', '-DUSE_OPENBLAS', c_filename, '-std=gnu99', 'common_matrix.c', '-fopenmp', '-lopenblas', '-O3', '-o', exec_filename, *options],
-        'naive': ['gcc', '-DBLOCK_SIZE=%d' % block_size, *options, '-std=gnu99', '-fopenmp', '-DUSE_NAIVE', c_filename, 'common_matrix.c', '-O3', '-o', exec_filename, *options],
+        'dlopen': ['gcc', '-DUSE_DLOPEN', c_filename, '-std=gnu99', 'common_matrix.c', '-fopenmp', '-ldl', '-O3', '-o', exec_filename, *options], # the library is loaded at runtime
+        'naive': ['gcc', '-DBLOCK_SIZE=%d' % block_size, *naive_options, *options, '-std=gnu99', '-fopenmp', '-DUSE_NAIVE', c_filename, 'common_matrix.c', '-O3', '-o', exec_filename, *options],
     }
     try:
         run_command(lib_to_command[lib])